@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.generador import generar, rutas
+from benchmarks.harness import metadatos
+from paginas import PAGINAS
+
+
+# PRUEBA DE CARGA CON SESIONES CONCURRENTES
+#
+# Lanza N sesiones de dashboard.py a la vez con el AppTest de Streamlit (sin
+# navegador), cada una en su hilo y dentro del mismo proceso, como en un
+# servidor real. Cada sesión sigue un guion aleatorio con semilla: mover el
+# slider de fechas, cambiar de página y elegir estado en el selectbox. Se mide
+# la latencia de cada rerun (p50/p95/p99), el throughput y cuánto crece la
+# memoria del proceso. Los resultados se escriben en JSON para comparar entre
+# versiones.
+#
+# dashboard.py lee sus ficheros con rutas relativas: se ejecuta dentro de
+# --directorio, que necesita streamlit/customers.csv (o .parquet),
+# resources/olist_order_reviews_dataset.csv, olist.jpg y br_states.geojson. Si
+# no hay datos, se generan con benchmarks.generador.
+#
+#   python -m benchmarks.carga --sesiones 1 4 8 --acciones 20 --salida carga.json
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(RAIZ, "dashboard.py")
+
+# Estados que más se eligen en el selectbox
+ESTADOS_FRECUENTES = ['SP', 'RJ', 'MG']
+# Peso de cada tipo de acción en el guion
+ACCIONES = {'pagina': 4, 'fechas': 3, 'estado': 3}
+
+
+def rss_bytes():
+    # RSS actual del proceso (Linux); en otros sistemas, el pico
+    try:
+        with open('/proc/self/statm') as fichero:
+            return int(fichero.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def preparar_directorio(directorio, escala, geojson=None):
+    ruta_customers, _ = rutas(directorio)
+    if not os.path.exists(ruta_customers) and not os.path.exists(ruta_customers.replace('.csv', '.parquet')):
+        generar(directorio, escala)
+
+    for origen in (os.path.join(RAIZ, 'olist.jpg'), geojson or os.path.join(RAIZ, 'br_states.geojson')):
+        destino = os.path.join(directorio, os.path.basename(origen))
+        if os.path.exists(origen) and not os.path.exists(destino):
+            shutil.copy(origen, destino)
+
+
+def rango_aleatorio(azar, inicio, fin):
+    # Rangos típicos: todo, último mes, último trimestre o uno cualquiera
+    tipo = azar.choice(['todo', 'mes', 'trimestre', 'libre'])
+    if tipo == 'todo':
+        return inicio, fin
+    if tipo in ('mes', 'trimestre'):
+        return max(inicio, fin - timedelta(days=30 if tipo == 'mes' else 90)), fin
+    desde = inicio + timedelta(days=azar.randrange(max((fin - inicio).days, 1)))
+    return desde, min(fin, desde + timedelta(days=azar.randrange(7, 365)))
+
+
+def paso(at, azar, limites):
+    # Aplica una acción del guion y devuelve su nombre
+    accion = azar.choices(list(ACCIONES), weights=list(ACCIONES.values()))[0]
+
+    if accion == 'estado' and at.selectbox:
+        opciones = at.selectbox[0].options
+        frecuentes = [estado for estado in ESTADOS_FRECUENTES if estado in opciones]
+        at.selectbox[0].set_value(azar.choice(frecuentes or opciones))
+        return accion
+
+    if accion == 'fechas':
+        at.sidebar.slider[0].set_value(rango_aleatorio(azar, *limites))
+        return accion
+
+    at.sidebar.radio[0].set_value(azar.choice(PAGINAS))
+    return 'pagina'
+
+
+def sesion(numero, acciones, semilla, espera, timeout, registros, inicio_comun):
+    azar = random.Random(semilla * 1000 + numero)
+    at = AppTest.from_file(DASHBOARD, default_timeout=timeout)
+
+    inicio_comun.wait()
+
+    def rerun(accion):
+        inicio = time.perf_counter()
+        try:
+            at.run()
+            errores = len(at.exception)
+        except RuntimeError:
+            # AppTest lanza RuntimeError si el rerun supera el timeout
+            errores = 1
+        registros.append({
+            'sesion': numero,
+            'accion': accion,
+            'segundos': time.perf_counter() - inicio,
+            'errores': errores,
+        })
+
+    rerun('inicio')
+    # Al arrancar el slider tiene el rango completo
+    limites = at.sidebar.slider[0].value
+
+    for _ in range(acciones):
+        if espera:
+            time.sleep(azar.uniform(0, espera))
+        rerun(paso(at, azar, limites))
+
+
+def ejecutar(sesiones, acciones, semilla=0, espera=0.0, timeout=300):
+    registros = []
+    inicio_comun = threading.Barrier(sesiones)
+    hilos = [
+        threading.Thread(target=sesion, args=(numero, acciones, semilla, espera, timeout, registros, inicio_comun))
+        for numero in range(sesiones)
+    ]
+
+    memoria_inicio = rss_bytes()
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    memoria_fin = rss_bytes()
+
+    latencias = np.array([registro['segundos'] for registro in registros])
+    return {
+        'sesiones': sesiones,
+        'reruns': len(registros),
+        'errores': sum(registro['errores'] > 0 for registro in registros),
+        'duracion_s': duracion,
+        'throughput_reruns_s': len(registros) / duracion,
+        'p50_s': float(np.percentile(latencias, 50)),
+        'p95_s': float(np.percentile(latencias, 95)),
+        'p99_s': float(np.percentile(latencias, 99)),
+        'rss_inicio_mb': memoria_inicio / 1e6,
+        'rss_fin_mb': memoria_fin / 1e6,
+        'crecimiento_rss_mb': (memoria_fin - memoria_inicio) / 1e6,
+        'por_accion': {
+            accion: float(np.percentile([r['segundos'] for r in registros if r['accion'] == accion], 50))
+            for accion in sorted({registro['accion'] for registro in registros})
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de dashboard.py con sesiones concurrentes")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--acciones", type=int, default=20, help="reruns por sesión después del primero")
+    parser.add_argument("--espera", type=float, default=0.0, help="pausa máxima entre acciones, en segundos")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--escala", type=float, default=0.2, help="escala de los datos sintéticos si hay que generarlos")
+    parser.add_argument("--directorio", default=os.path.join(tempfile.gettempdir(), "olist_carga"))
+    parser.add_argument("--geojson", default=None, help="br_states.geojson a copiar al directorio")
+    parser.add_argument("--salida", default="resultados_carga.json")
+    args = parser.parse_args()
+
+    # Los metadatos (commit incluido) se toman antes de cambiar de directorio
+    entorno = {clave: valor for clave, valor in os.environ.items() if clave.startswith('OLIST_')}
+    informe = {'metadatos': {**metadatos(), 'entorno': entorno}, 'resultados': []}
+    salida = os.path.abspath(args.salida)
+
+    preparar_directorio(args.directorio, args.escala, args.geojson)
+    os.chdir(args.directorio)
+
+    for sesiones in args.sesiones:
+        resultado = ejecutar(sesiones, args.acciones, args.semilla, args.espera)
+        informe['resultados'].append(resultado)
+        print(f"{sesiones:>3} sesiones  {resultado['reruns']:>5} reruns  "
+              f"p50 {resultado['p50_s'] * 1000:8.1f} ms  p95 {resultado['p95_s'] * 1000:8.1f} ms  "
+              f"p99 {resultado['p99_s'] * 1000:8.1f} ms  {resultado['throughput_reruns_s']:6.2f} reruns/s  "
+              f"RSS +{resultado['crecimiento_rss_mb']:.1f} MB  errores {resultado['errores']}")
+
+    with open(salida, "w") as fichero:
+        json.dump(informe, fichero, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.generador import generar, rutas
+from construir_dataset import construir
+from consultas_sql import ConsultasDuckDB
+from cubo import PRECISION_HLL, CuboDiario
+from datos import FECHAS_CUSTOMERS, cargar_datos, filtrar_fechas, limites_fechas
+from metricas import calcular_ciudades, calcular_retrasos, calcular_reviews, calcular_reviews_fechas, calcular_top_estados
+
+
+# EQUIVALENCIA ENTRE BACKENDS
+#
+# Compara las tablas del backend DuckDB (consultas_sql.py) con las de pandas
+# (metricas.py) y del cubo diario (cubo.py, el que usan las páginas con
+# pandas) sobre un dataset sintético, en varios rangos de fechas y leyendo
+# tanto del CSV como del Parquet. Los clientes únicos del cubo con sketches
+# HyperLogLog (OLIST_CUBO_HLL=1) se comparan con los exactos dentro de
+# TOLERANCIA_HLL. Termina con código 1 si alguna tabla no coincide.
+#
+#   python -m benchmarks.equivalencia --escala 0.1
+
+# Error relativo admitido a los sketches: 4 veces su error típico 1.04 / sqrt(m)
+TOLERANCIA_HLL = 4 * 1.04 / (2 ** PRECISION_HLL) ** 0.5
+
+
+def _normalizar(df, claves):
+    # Mismo orden de filas y tipos comparables; el orden de empates no importa
+    df = df.copy()
+    for columna in df.columns:
+        if isinstance(df[columna].dtype, pd.CategoricalDtype) or df[columna].dtype == object:
+            df[columna] = df[columna].astype(str)
+    return df.sort_values(claves).reset_index(drop=True)
+
+
+def comparar(nombre, esperado, obtenido, claves):
+    try:
+        pd.testing.assert_frame_equal(
+            _normalizar(esperado, claves), _normalizar(obtenido, claves),
+            check_dtype=False, check_exact=False, atol=0.011,
+        )
+    except AssertionError as error:
+        print(f"  {nombre}: DIFERENTE\n{error}")
+        return False
+    print(f"  {nombre}: ok ({len(esperado)} filas)")
+    return True
+
+
+def comparar_aproximado(nombre, esperado, obtenido):
+    # Series con el mismo índice: error relativo de cada valor frente al exacto
+    obtenido = obtenido.reindex(esperado.index, fill_value=0)
+    error = ((obtenido - esperado).abs() / esperado.where(esperado > 0)).fillna(0)
+    if len(error) and error.max() > TOLERANCIA_HLL:
+        print(f"  {nombre}: DIFERENTE (error relativo máximo {error.max():.1%} en {error.idxmax()})")
+        return False
+    print(f"  {nombre}: ok ({len(esperado)} valores, error relativo máximo {error.max() if len(error) else 0:.1%})")
+    return True
+
+
+def rangos(customers):
+    inicio, fin = limites_fechas(customers)
+    return [
+        (inicio, fin),
+        (fin - datetime.timedelta(days=30), fin),
+        (inicio + datetime.timedelta(days=200), inicio + datetime.timedelta(days=380)),
+    ]
+
+
+def verificar(ruta_customers, ruta_reviews):
+    datos = cargar_datos(ruta_customers, ruta_reviews)
+    consultas = ConsultasDuckDB(ruta_customers, ruta_reviews)
+    cubo = CuboDiario(datos.customers, datos.customers_delivered)
+    cubo_hll = CuboDiario(datos.customers, datos.customers_delivered, exacto=False)
+
+    iguales = True
+    for desde, hasta in rangos(datos.customers):
+        print(f"{os.path.basename(ruta_customers)} {desde} — {hasta}")
+        filtrado = filtrar_fechas(datos.customers, desde, hasta)
+        filtrado_delivered = filtrar_fechas(datos.customers_delivered, desde, hasta)
+
+        iguales &= comparar('kpis', pd.DataFrame([cubo.kpis(desde, hasta)]), pd.DataFrame([consultas.kpis(desde, hasta)]), ['total_pedidos'])
+        iguales &= comparar('top_estados', calcular_top_estados(filtrado), consultas.top_estados(desde, hasta), ['Estado'])
+        iguales &= comparar('cubo.top_estados', cubo.top_estados(desde, hasta), consultas.top_estados(desde, hasta), ['Estado'])
+        iguales &= comparar('ciudades', calcular_ciudades(filtrado), consultas.ciudades(desde, hasta), ['Ciudad', 'Estado'])
+        iguales &= comparar('cubo.ciudades', cubo.ciudades(desde, hasta), consultas.ciudades(desde, hasta), ['Ciudad', 'Estado'])
+        iguales &= comparar('retrasos', calcular_retrasos(filtrado_delivered), consultas.retrasos(desde, hasta), ['Ciudad', 'Estado'])
+        iguales &= comparar_aproximado(
+            'hll.clientes_unicos',
+            pd.Series([cubo.clientes_unicos(desde, hasta)]), pd.Series([cubo_hll.clientes_unicos(desde, hasta)]),
+        )
+        iguales &= comparar_aproximado(
+            'hll.clientes_por_estado', cubo.clientes_por_estado(desde, hasta), cubo_hll.clientes_por_estado(desde, hasta),
+        )
+        iguales &= comparar('reviews_fechas', calcular_reviews_fechas(datos.hechos_reviews, desde, hasta), consultas.reviews(desde, hasta), ['Estado'])
+
+    iguales &= comparar('reviews', calcular_reviews(datos.customers_delivered, datos.df_reviews), consultas.reviews(), ['Estado'])
+    iguales &= verificar_sin_pedido(datos, cubo)
+    return iguales
+
+
+def verificar_sin_pedido(datos, cubo):
+    # Un cliente sin pedido (fecha NaT, como los que escribe etl --streaming)
+    # va al principio y no cambia ni los límites de fechas ni el cubo
+    sin_pedido = datos.customers.head(1).assign(
+        id_customer_order='sin_pedido', id_user='sin_pedido', order_id=None, order_status=None,
+        **{columna: pd.NaT for columna in FECHAS_CUSTOMERS},
+    )
+    customers = pd.concat([sin_pedido, datos.customers], ignore_index=True)
+
+    print("cliente sin pedido")
+    iguales = limites_fechas(customers) == limites_fechas(datos.customers)
+    print(f"  limites_fechas: {'ok' if iguales else 'DIFERENTE'}")
+
+    cubo_sin_pedido = CuboDiario(customers, datos.customers_delivered)
+    for desde, hasta in rangos(datos.customers):
+        iguales &= comparar('kpis', pd.DataFrame([cubo.kpis(desde, hasta)]),
+                            pd.DataFrame([cubo_sin_pedido.kpis(desde, hasta)]), ['total_pedidos'])
+        iguales &= comparar('ciudades', cubo.ciudades(desde, hasta), cubo_sin_pedido.ciudades(desde, hasta),
+                            ['Ciudad', 'Estado'])
+    return iguales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el backend DuckDB con el de pandas")
+    parser.add_argument("--escala", type=float, default=0.1)
+    parser.add_argument("--datos", default=os.path.join(tempfile.gettempdir(), "olist_equivalencia"))
+    args = parser.parse_args()
+
+    directorio = os.path.join(args.datos, f"escala_{args.escala:g}")
+    ruta_customers, ruta_reviews = rutas(directorio)
+    if not os.path.exists(ruta_customers):
+        generar(directorio, args.escala)
+
+    ruta_parquet = os.path.splitext(ruta_customers)[0] + ".parquet"
+    construir(ruta_customers, ruta_parquet)
+
+    iguales = verificar(ruta_customers, ruta_reviews)
+    iguales &= verificar(ruta_parquet, ruta_reviews)
+
+    sys.exit(0 if iguales else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# GENERADOR DE DATOS SINTÉTICOS CON FORMA OLIST
+#
+# Produce streamlit/customers.csv y resources/olist_order_reviews_dataset.csv
+# con el mismo esquema que los reales, a un factor de escala sobre el tamaño del
+# dataset original (~99k pedidos). Se respeta la forma de los datos: reparto de
+# pedidos por estado como en Olist, ciudades con distribución Zipf dentro de cada
+# estado, clientes con varios pedidos, ~8% de entregas tarde y peores reviews en
+# los pedidos que llegan tarde.
+#
+#   python -m benchmarks.generador --escala 10 --destino /tmp/olist_x10
+
+PEDIDOS_BASE = 99441
+CIUDADES_BASE = 4119
+
+# Proporción de pedidos por estado en el dataset original
+ESTADOS = {
+    'SP': 0.420, 'RJ': 0.129, 'MG': 0.117, 'RS': 0.055, 'PR': 0.051, 'SC': 0.037,
+    'BA': 0.034, 'DF': 0.022, 'ES': 0.020, 'GO': 0.020, 'PE': 0.017, 'CE': 0.013,
+    'PA': 0.010, 'MT': 0.009, 'MA': 0.0075, 'MS': 0.0072, 'PB': 0.0054, 'PI': 0.005,
+    'RN': 0.0049, 'AL': 0.0042, 'SE': 0.0034, 'TO': 0.0028, 'RO': 0.0025, 'AM': 0.0015,
+    'AC': 0.0008, 'AP': 0.0007, 'RR': 0.0005,
+}
+
+ESTADOS_PEDIDO = {
+    'delivered': 0.970, 'shipped': 0.011, 'canceled': 0.006, 'unavailable': 0.006,
+    'invoiced': 0.003, 'processing': 0.003, 'created': 0.0005, 'approved': 0.0005,
+}
+
+# Reparto de puntuaciones para pedidos a tiempo y pedidos tarde (1..5)
+PUNTUACIONES_A_TIEMPO = [0.07, 0.025, 0.08, 0.20, 0.625]
+PUNTUACIONES_TARDE = [0.45, 0.09, 0.12, 0.12, 0.22]
+
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+INICIO = np.datetime64('2016-09-04')
+DIAS = 760
+
+# Exponente de la Zipf de ciudades dentro de cada estado
+ZIPF_CIUDADES = 1.35
+
+
+def _normalizar(pesos):
+    pesos = np.asarray(pesos, dtype='float64')
+    return pesos / pesos.sum()
+
+
+def _ids_hex(rng, n):
+    # n identificadores hex de 32 caracteres, como los de Olist
+    return np.frombuffer(rng.bytes(16 * n).hex().encode(), dtype='S32').astype(str)
+
+
+def _ciudades(rng):
+    # Nº de ciudades por estado proporcional a sus pedidos (mínimo 5)
+    estados = list(ESTADOS)
+    pesos = _normalizar(list(ESTADOS.values()))
+    por_estado = np.maximum(5, np.rint(pesos * CIUDADES_BASE)).astype(int)
+
+    ciudad, estado, peso = [], [], []
+    for nombre, n, peso_estado in zip(estados, por_estado, pesos):
+        zipf = _normalizar(1 / np.arange(1, n + 1) ** ZIPF_CIUDADES)
+        ciudad += [f"Ciudad {nombre} {i}" for i in range(n)]
+        estado += [nombre] * n
+        peso.append(zipf * peso_estado)
+
+    return np.array(ciudad), np.array(estado), _normalizar(np.concatenate(peso))
+
+
+def generar_customers(escala=1, semilla=0):
+    rng = np.random.default_rng(semilla)
+    n = int(PEDIDOS_BASE * escala)
+
+    # ~3% de los pedidos son de clientes que repiten
+    n_usuarios = int(n * 0.97)
+    usuario = np.concatenate([np.arange(n_usuarios), rng.integers(0, n_usuarios, n - n_usuarios)])
+    rng.shuffle(usuario)
+
+    # La ciudad es del cliente, no del pedido
+    ciudades, estados, pesos = _ciudades(rng)
+    ciudad_usuario = rng.choice(len(ciudades), n_usuarios, p=pesos)
+    ciudad = ciudad_usuario[usuario]
+    zip_ciudad = rng.integers(1000, 99999, len(ciudades))
+
+    # Más pedidos hacia el final del periodo, como en el dataset original
+    dia = np.floor(DIAS * np.sqrt(rng.random(n))).astype('int64')
+    segundos = rng.integers(0, 86400, n)
+    compra = INICIO + dia.astype('timedelta64[D]') + segundos.astype('timedelta64[s]')
+
+    estimada = (compra.astype('datetime64[D]') + rng.integers(10, 45, n).astype('timedelta64[D]')).astype('datetime64[s]')
+    desvio = np.rint(rng.normal(-10, 8, n) * 86400).astype('int64')
+    entregada = estimada + desvio.astype('timedelta64[s]')
+    entregada = np.maximum(entregada, compra + np.timedelta64(86400, 's'))
+
+    status = rng.choice(list(ESTADOS_PEDIDO), n, p=_normalizar(list(ESTADOS_PEDIDO.values())))
+    entregada = pd.Series(entregada).where(status == 'delivered')
+
+    ids_usuario = _ids_hex(rng, n_usuarios)
+
+    customers = pd.DataFrame({
+        'id_customer_order': _ids_hex(rng, n),
+        'id_user': ids_usuario[usuario],
+        'zip_code_prefix': zip_ciudad[ciudad],
+        'city': ciudades[ciudad],
+        'state': estados[ciudad],
+        'order_id': _ids_hex(rng, n),
+        'order_status': status,
+        'order_purchase_timestamp': pd.Series(compra).dt.floor('s'),
+        'order_delivered_customer_date': entregada.dt.floor('s'),
+        'order_estimated_delivery_date': estimada,
+    })
+
+    return customers
+
+
+def generar_reviews(customers, semilla=0):
+    rng = np.random.default_rng(semilla + 1)
+
+    # Casi todos los pedidos tienen una review
+    pedidos = customers.sample(frac=0.998, random_state=semilla)
+    n = len(pedidos)
+
+    tarde = (pedidos['order_delivered_customer_date'] > pedidos['order_estimated_delivery_date']).to_numpy()
+    puntuacion = np.where(
+        tarde,
+        rng.choice(np.arange(1, 6), n, p=PUNTUACIONES_TARDE),
+        rng.choice(np.arange(1, 6), n, p=PUNTUACIONES_A_TIEMPO),
+    )
+
+    creacion = pedidos['order_estimated_delivery_date'].to_numpy() + rng.integers(-5, 10, n).astype('timedelta64[D]')
+    respuesta = creacion + rng.integers(3600, 5 * 86400, n).astype('timedelta64[s]')
+
+    comentario = rng.random(n) < 0.41
+
+    return pd.DataFrame({
+        'review_id': _ids_hex(rng, n),
+        'order_id': pedidos['order_id'].to_numpy(),
+        'review_score': puntuacion,
+        'review_comment_title': np.where(rng.random(n) < 0.12, 'Recomendo', None),
+        'review_comment_message': np.where(comentario, 'Produto chegou dentro do prazo', None),
+        'review_creation_date': creacion,
+        'review_answer_timestamp': respuesta,
+    })
+
+
+def rutas(destino):
+    return (
+        os.path.join(destino, 'streamlit', 'customers.csv'),
+        os.path.join(destino, 'resources', 'olist_order_reviews_dataset.csv'),
+    )
+
+
+def generar(destino, escala=1, semilla=0):
+    # Escribe los dos CSV bajo destino con la misma estructura de carpetas que el repo
+    ruta_customers, ruta_reviews = rutas(destino)
+    os.makedirs(os.path.dirname(ruta_customers), exist_ok=True)
+    os.makedirs(os.path.dirname(ruta_reviews), exist_ok=True)
+
+    customers = generar_customers(escala, semilla)
+    # El notebook escribe el índice como primera columna sin nombre
+    customers.to_csv(ruta_customers, date_format=FORMATO_FECHA)
+    generar_reviews(customers, semilla).to_csv(ruta_reviews, index=False, date_format=FORMATO_FECHA)
+
+    return ruta_customers, ruta_reviews
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos con el esquema de Olist")
+    parser.add_argument("--escala", type=float, default=1)
+    parser.add_argument("--destino", required=True)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    for ruta in generar(args.destino, args.escala, args.semilla):
+        print(ruta)
+
+
+if __name__ == "__main__":
+    main()
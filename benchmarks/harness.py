@@ -0,0 +1,169 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+
+import datos
+from benchmarks.generador import generar, rutas
+from cubo import CuboDiario
+from datos import cargar_datos, filtrar_fechas, limites_fechas
+from graficos import GRAFICOS, figura_a_png
+from metricas import calcular_ciudades, calcular_retrasos, calcular_reviews, calcular_reviews_fechas, calcular_top_estados
+
+
+# BENCHMARK DEL CAMINO DE DATOS DEL DASHBOARD
+#
+# Para cada factor de escala genera (o reutiliza) un dataset sintético y mide:
+# carga, filtro por fechas, las funciones calcular_*, el cubo diario y el
+# render de cada gráfico sin pasar por la cache. Los resultados se escriben en
+# JSON para poder comparar entre versiones.
+#
+#   python -m benchmarks.harness --escalas 1 10 100 --salida resultados.json
+
+GRAFICOS_CIUDADES = ['grafico1', 'grafico2', 'grafico3', 'grafico4', 'grafico5']
+GRAFICOS_RETRASOS = ['grafico6', 'grafico7', 'grafico8']
+GRAFICOS_REVIEWS = ['grafico9', 'grafico10', 'grafico11']
+
+
+def medir(funcion, repeticiones):
+    # Devuelve (tiempos, último resultado)
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, resultado
+
+
+def _registro(escala, etapa, tiempos, filas_entrada=None, filas_salida=None):
+    return {
+        'escala': escala,
+        'etapa': etapa,
+        'repeticiones': len(tiempos),
+        'mediana_s': statistics.median(tiempos),
+        'min_s': min(tiempos),
+        'max_s': max(tiempos),
+        'filas_entrada': filas_entrada,
+        'filas_salida': filas_salida,
+    }
+
+
+def _filas(resultado):
+    if isinstance(resultado, datos.Datos):
+        return len(resultado.customers)
+    return len(resultado) if hasattr(resultado, '__len__') else None
+
+
+def ejecutar_escala(escala, directorio, repeticiones, graficos=True):
+    ruta_customers, ruta_reviews = rutas(directorio)
+    if not os.path.exists(ruta_customers):
+        generar(directorio, escala)
+
+    resultados = []
+
+    def anotar(etapa, funcion, filas_entrada=None, veces=repeticiones):
+        tiempos, resultado = medir(funcion, veces)
+        resultados.append(_registro(escala, etapa, tiempos, filas_entrada, _filas(resultado)))
+        return resultado
+
+    # Carga en frío: se vacía la cache de proceso antes de cada repetición
+    def carga(compacto=False):
+        datos._cache.clear()
+        return cargar_datos(ruta_customers, ruta_reviews, compacto=compacto)
+
+    anotar('carga_compacta', lambda: carga(compacto=True))
+    d = anotar('carga', carga)
+
+    customers = d.customers
+    delivered = d.customers_delivered
+    desde, hasta = limites_fechas(customers)
+    ultimo_mes = hasta - datetime.timedelta(days=30)
+
+    anotar('filtro_fechas_total', lambda: filtrar_fechas(customers, desde, hasta), len(customers))
+    anotar('filtro_fechas_ultimo_mes', lambda: filtrar_fechas(customers, ultimo_mes, hasta), len(customers))
+
+    filtrado = filtrar_fechas(customers, desde, hasta)
+    filtrado_delivered = filtrar_fechas(delivered, desde, hasta)
+
+    anotar('calcular_top_estados', lambda: calcular_top_estados(filtrado), len(filtrado))
+    df_ciudades = anotar('calcular_ciudades', lambda: calcular_ciudades(filtrado), len(filtrado))
+    pedidos_tarde = anotar('calcular_retrasos', lambda: calcular_retrasos(filtrado_delivered), len(filtrado_delivered))
+    customers_review = anotar('calcular_reviews', lambda: calcular_reviews(delivered, d.df_reviews), len(d.df_reviews))
+    anotar('calcular_reviews_fechas', lambda: calcular_reviews_fechas(d.hechos_reviews, desde, hasta), len(d.hechos_reviews))
+
+    cubo = anotar('cubo_construccion', lambda: CuboDiario(customers, delivered), len(customers))
+    anotar('cubo_kpis', lambda: cubo.kpis(desde, hasta))
+    anotar('cubo_top_estados', lambda: cubo.top_estados(desde, hasta))
+    anotar('cubo_ciudades', lambda: cubo.ciudades(desde, hasta))
+
+    if graficos:
+        entradas = {}
+        entradas.update({nombre: df_ciudades for nombre in GRAFICOS_CIUDADES})
+        entradas.update({nombre: pedidos_tarde for nombre in GRAFICOS_RETRASOS})
+        entradas.update({nombre: customers_review for nombre in GRAFICOS_REVIEWS})
+
+        for nombre, df in entradas.items():
+            anotar(f'render_{nombre}', lambda: figura_a_png(GRAFICOS[nombre](df)), len(df))
+
+        if os.path.exists('br_states.geojson'):
+            top_estados = cubo.top_estados(desde, hasta)
+            anotar('render_mapa', lambda: GRAFICOS['mapa'](top_estados), len(top_estados))
+
+    return resultados
+
+
+def metadatos():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import numpy
+    import pandas
+
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del camino de datos de dashboard.py")
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--datos", default=os.path.join(tempfile.gettempdir(), "olist_benchmark"),
+                        help="carpeta donde se generan/reutilizan los datasets sintéticos")
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--sin-graficos", action="store_true")
+    args = parser.parse_args()
+
+    resultados = []
+    for escala in args.escalas:
+        directorio = os.path.join(args.datos, f"escala_{escala:g}")
+        for registro in ejecutar_escala(escala, directorio, args.repeticiones, not args.sin_graficos):
+            print(f"x{registro['escala']:<5g} {registro['etapa']:<28} {registro['mediana_s'] * 1000:10.1f} ms")
+            resultados.append(registro)
+
+    with open(args.salida, "w") as fichero:
+        json.dump({'metadatos': metadatos(), 'resultados': resultados}, fichero, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+
+# CACHE LRU CON PRESUPUESTO DE MEMORIA
+#
+# Cache compartida entre hilos (sesiones de Streamlit). Cada entrada cuenta lo
+# que devuelve tamano(valor) y, cuando se supera max_bytes, se descartan las
+# entradas usadas hace más tiempo.
+
+
+class CacheLRU:
+
+    def __init__(self, max_bytes, tamano=len):
+        self.max_bytes = max_bytes
+        self.tamano = tamano
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __contains__(self, clave):
+        return clave in self._entradas
+
+    def obtener(self, clave, defecto=None):
+        with self._lock:
+            if clave not in self._entradas:
+                self.fallos += 1
+                return defecto
+
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return self._entradas[clave][0]
+
+    def guardar(self, clave, valor):
+        tamano = self.tamano(valor)
+        # Una entrada que no cabe entera no desplaza al resto
+        if tamano > self.max_bytes:
+            return
+
+        with self._lock:
+            if clave in self._entradas:
+                self.bytes -= self._entradas.pop(clave)[1]
+
+            self._entradas[clave] = (valor, tamano)
+            self.bytes += tamano
+
+            while self.bytes > self.max_bytes:
+                _, (_, liberado) = self._entradas.popitem(last=False)
+                self.bytes -= liberado
+
+    def descartar(self, condicion):
+        # Elimina las entradas cuya clave cumple condicion(clave)
+        with self._lock:
+            for clave in [clave for clave in self._entradas if condicion(clave)]:
+                self.bytes -= self._entradas.pop(clave)[1]
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        return {
+            'entradas': len(self._entradas),
+            'bytes': self.bytes,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+        }
@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from datos import Datos, cargar_datos
+
+
+# DATASET COMPARTIDO ENTRE PROCESOS
+#
+# Con varios procesos de Streamlit detrás de un balanceador, cada uno carga su
+# propia copia de las tablas. En este modo las tablas ya preparadas de un Datos
+# (ver datos.py) se escriben una vez como ficheros Arrow IPC sin comprimir, y
+# cada proceso los abre con memory map. Las columnas numéricas, de fechas y
+# categóricas se leen sin copia, así que el sistema operativo mantiene una sola
+# copia física en la page cache para todos los procesos.
+#
+# Cada versión va en su propio directorio y el fichero ACTUAL dice cuál está
+# vigente. Publicar una versión nueva es escribir su directorio y reemplazar
+# ACTUAL con os.replace, que es atómico. Los procesos cambian en el siguiente
+# rerun; los que aún tienen abierta la anterior siguen leyendo de ella.
+#
+#   python compartido.py --raiz streamlit/compartido
+#   OLIST_COMPARTIDO=streamlit/compartido streamlit run dashboard.py
+
+RAIZ = "streamlit/compartido"
+ACTUAL = "ACTUAL"
+
+TABLAS = ['customers', 'customers_delivered', 'df_reviews', 'hechos_reviews']
+
+# La versión vigente y la anterior, que puede seguir abierta en algún proceso
+VERSIONES_CONSERVADAS = 2
+
+
+def _nombre_version(version):
+    return 'v-' + hashlib.blake2b(repr(version).encode(), digest_size=8).hexdigest()
+
+
+def _tupla(valor):
+    # JSON devuelve listas; la versión de datos.py se compara como tuplas
+    if isinstance(valor, list):
+        return tuple(_tupla(elemento) for elemento in valor)
+    return valor
+
+
+def leer_actual(raiz=RAIZ):
+    with open(os.path.join(raiz, ACTUAL)) as fichero:
+        return fichero.read().strip()
+
+
+def _escribir_actual(raiz, nombre):
+    temporal = os.path.join(raiz, ACTUAL + ".tmp")
+    with open(temporal, 'w') as fichero:
+        fichero.write(nombre)
+    os.replace(temporal, os.path.join(raiz, ACTUAL))
+
+
+def _limpiar(raiz, vigente):
+    # En POSIX borrar un fichero mapeado no afecta a quien ya lo tiene abierto
+    versiones = [
+        nombre for nombre in os.listdir(raiz)
+        if nombre.startswith('v-') and not nombre.endswith('.tmp') and nombre != vigente
+    ]
+    versiones.sort(key=lambda nombre: os.path.getmtime(os.path.join(raiz, nombre)), reverse=True)
+    for nombre in versiones[VERSIONES_CONSERVADAS - 1:]:
+        shutil.rmtree(os.path.join(raiz, nombre), ignore_errors=True)
+
+
+def publicar(datos, raiz=RAIZ):
+    nombre = _nombre_version(datos.version)
+    destino = os.path.join(raiz, nombre)
+
+    if not os.path.exists(destino):
+        # Se escribe en un temporal y se renombra: ACTUAL nunca apunta a una versión a medias
+        temporal = destino + ".tmp"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+
+        for tabla in TABLAS:
+            df = getattr(datos, tabla)
+            if tabla == 'hechos_reviews':
+                df = df.reset_index()
+            feather.write_feather(df, os.path.join(temporal, f"{tabla}.arrow"), compression='uncompressed')
+
+        for columna, valores in datos.diccionarios.items():
+            feather.write_feather(
+                pd.DataFrame({columna: valores}), os.path.join(temporal, f"diccionario.{columna}.arrow"),
+                compression='uncompressed',
+            )
+
+        with open(os.path.join(temporal, "version.json"), 'w') as fichero:
+            json.dump({'version': datos.version, 'diccionarios': list(datos.diccionarios)}, fichero)
+
+        os.rename(temporal, destino)
+
+    _escribir_actual(raiz, nombre)
+    _limpiar(raiz, nombre)
+    return nombre
+
+
+def _leer(ruta):
+    # split_blocks evita que pandas junte las columnas en bloques (lo que copiaría)
+    return feather.read_table(ruta, memory_map=True).to_pandas(split_blocks=True)
+
+
+def abrir(raiz=RAIZ, nombre=None):
+    inicio = time.perf_counter()
+    directorio = os.path.join(raiz, nombre or leer_actual(raiz))
+
+    with open(os.path.join(directorio, "version.json")) as fichero:
+        metadatos = json.load(fichero)
+
+    tablas = {tabla: _leer(os.path.join(directorio, f"{tabla}.arrow")) for tabla in TABLAS}
+    diccionarios = {
+        columna: pd.Index(_leer(os.path.join(directorio, f"diccionario.{columna}.arrow"))[columna])
+        for columna in metadatos['diccionarios']
+    }
+
+    return Datos(
+        tablas['customers'],
+        tablas['customers_delivered'],
+        tablas['df_reviews'],
+        _tupla(metadatos['version']),
+        {'apertura': time.perf_counter() - inicio},
+        diccionarios,
+        tablas['hechos_reviews'].set_index('order_id'),
+    )
+
+
+_lock = threading.Lock()
+_abiertos = {}
+
+
+def obtener_datos(raiz=RAIZ):
+    # Se lee ACTUAL en cada llamada (un fichero de pocos bytes): así se detecta el cambio de versión
+    nombre = leer_actual(raiz)
+
+    abierto = _abiertos.get(raiz)
+    if abierto is not None and abierto[0] == nombre:
+        return abierto[1]
+
+    with _lock:
+        abierto = _abiertos.get(raiz)
+        if abierto is None or abierto[0] != nombre:
+            abierto = (nombre, abrir(raiz, nombre))
+            _abiertos[raiz] = abierto
+
+    return abierto[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publica las tablas preparadas como Arrow IPC para abrirlas con memory map")
+    parser.add_argument("--raiz", default=RAIZ)
+    parser.add_argument("--texto", action="store_true", help="identificadores como texto en vez de códigos int32")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    datos = cargar_datos(compacto=not args.texto)
+    os.makedirs(args.raiz, exist_ok=True)
+    nombre = publicar(datos, args.raiz)
+
+    print(f"{os.path.join(args.raiz, nombre)}: {len(datos.customers)} filas, "
+          f"{time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from datos import COLUMNA_FECHA, FECHAS_CUSTOMERS, RUTA_ARTEFACTO, RUTA_CUSTOMERS, leer_customers
+
+
+# CONSTRUCCIÓN DEL DATASET COLUMNAR
+#
+# Convierte streamlit/customers.csv (generado por EDA_Completo.ipynb) en un
+# fichero Parquet con tipos nativos: fechas como timestamps, ciudad/estado/estado
+# del pedido como categóricas y delay_days/late ya calculados. dashboard.py lo
+# lee cuando existe y, si no, vuelve al CSV.
+#
+# Las filas se escriben ordenadas por fecha de compra y en row groups de
+# FILAS_POR_GRUPO filas: cada row group cubre un tramo de fechas y sus
+# estadísticas min/max permiten a DuckDB saltarse los que quedan fuera del
+# rango del WHERE.
+#
+#   python construir_dataset.py
+#   python construir_dataset.py --origen otro.csv --destino otro.parquet
+
+CATEGORICAS = ['city', 'state', 'order_status']
+
+FILAS_POR_GRUPO = 16_384
+
+
+def tipar_customers(customers, categoricas=True):
+    customers = customers.copy()
+
+    for columna in FECHAS_CUSTOMERS:
+        customers[columna] = pd.to_datetime(customers[columna])
+
+    # Sin categóricas cuando se escribe por bloques: cada bloque tendría su propio
+    # diccionario. Parquet ya codifica estas columnas con diccionario en disco.
+    for columna in CATEGORICAS:
+        customers[columna] = customers[columna].astype('category' if categoricas else object)
+
+    # Solo tiene sentido para pedidos entregados; el resto queda a NaN / False
+    entregado = customers['order_status'] == 'delivered'
+    delay_days = (
+        customers['order_delivered_customer_date'] -
+        customers['order_estimated_delivery_date']
+    ).dt.days
+    customers['delay_days'] = delay_days.where(entregado).astype('float64')
+    customers['late'] = customers['delay_days'] > 0
+
+    return customers
+
+
+def escribir(customers, destino=RUTA_ARTEFACTO, orden=None):
+    # Con orden (la fecha de compra en customers) las filas se escriben
+    # ordenadas por esa columna, igual que las deja datos._construir
+    if orden is not None:
+        customers = customers.sort_values(orden, kind='stable', na_position='first', ignore_index=True)
+
+    # Se escribe a un temporal y se renombra: los lectores nunca ven un fichero a medias
+    temporal = destino + ".tmp"
+    customers.to_parquet(temporal, index=False, compression="zstd", row_group_size=FILAS_POR_GRUPO)
+    os.replace(temporal, destino)
+
+
+def construir(origen=RUTA_CUSTOMERS, destino=RUTA_ARTEFACTO):
+    customers = tipar_customers(leer_customers(origen))
+    escribir(customers, destino, orden=COLUMNA_FECHA)
+    return customers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el dataset Parquet que usa dashboard.py")
+    parser.add_argument("--origen", default=RUTA_CUSTOMERS)
+    parser.add_argument("--destino", default=RUTA_ARTEFACTO)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    customers = construir(args.origen, args.destino)
+    duracion = time.perf_counter() - inicio
+
+    print(f"{args.destino}: {len(customers)} filas, "
+          f"{os.path.getsize(args.destino) / 1e6:.1f} MB, {duracion:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
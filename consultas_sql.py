@@ -0,0 +1,229 @@
+import datetime
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from datos import firma_fuentes, ruta_customers_por_defecto, ruta_reviews_por_defecto
+from metricas import UMBRALES_DIAGNOSTICO, diagnosticar
+
+
+# BACKEND SQL (DuckDB)
+#
+# Mismas tablas que metricas.py / cubo.py pero calculadas con DuckDB en el
+# propio proceso, directamente sobre el Parquet (o el CSV) sin cargarlo en
+# memoria. El rango de fechas va en el WHERE, así que con Parquet solo se leen
+# los row groups que caen en él. DuckDB devuelve agregados pequeños; los
+# porcentajes y redondeos se hacen después en pandas, igual que en metricas.py.
+#
+# Se elige con OLIST_BACKEND=duckdb (por defecto pandas).
+
+
+def _fuente(ruta):
+    if ruta.endswith(".parquet"):
+        return f"read_parquet('{ruta}')"
+    return f"read_csv('{ruta}', header = true, auto_detect = true)"
+
+
+class ConsultasDuckDB:
+
+    def __init__(self, ruta_customers=None, ruta_reviews=None):
+        if ruta_customers is None:
+            ruta_customers = ruta_customers_por_defecto()
+        if ruta_reviews is None:
+            ruta_reviews = ruta_reviews_por_defecto()
+
+        self.ruta_customers = ruta_customers
+        self.ruta_reviews = ruta_reviews
+        self.version = (firma_fuentes((ruta_customers, ruta_reviews)), 'duckdb')
+
+        self._conexion = duckdb.connect()
+        self._customers = _fuente(ruta_customers)
+        self._reviews = _fuente(ruta_reviews)
+
+    def _consulta(self, sql, parametros=None):
+        # Un cursor por consulta: la conexión se comparte entre sesiones
+        cursor = self._conexion.cursor()
+        try:
+            return cursor.execute(sql, parametros or []).df()
+        finally:
+            cursor.close()
+
+    def _rango(self, desde, hasta):
+        # [desde, hasta + 1 día): mismos límites que datos.filtrar_fechas
+        fin = hasta + datetime.timedelta(days=1)
+        return [datetime.datetime.combine(desde, datetime.time()), datetime.datetime.combine(fin, datetime.time())]
+
+    def _filtrado(self, solo_entregados=False):
+        condicion = "AND order_status = 'delivered'" if solo_entregados else ""
+        # delay_days como Timedelta.days de pandas: días completos redondeando hacia abajo
+        return f"""
+            SELECT
+                id_customer_order, id_user, city, state, order_id, order_status,
+                CAST(order_purchase_timestamp AS TIMESTAMP) AS order_purchase_timestamp,
+                floor((epoch(CAST(order_delivered_customer_date AS TIMESTAMP))
+                       - epoch(CAST(order_estimated_delivery_date AS TIMESTAMP))) / 86400) AS delay_days
+            FROM {self._customers}
+            WHERE CAST(order_purchase_timestamp AS TIMESTAMP) >= ?
+              AND CAST(order_purchase_timestamp AS TIMESTAMP) < ?
+              {condicion}
+        """
+
+    def rango_fechas(self):
+        fila = self._consulta(f"""
+            SELECT min(CAST(order_purchase_timestamp AS TIMESTAMP)) AS inicio,
+                   max(CAST(order_purchase_timestamp AS TIMESTAMP)) AS fin
+            FROM {self._customers}
+        """).iloc[0]
+        return fila['inicio'].date(), fila['fin'].date()
+
+    def kpis(self, desde, hasta):
+        fila = self._consulta(f"""
+            WITH f AS ({self._filtrado()})
+            SELECT
+                count(*) AS total_pedidos,
+                count(DISTINCT id_user) AS clientes_unicos,
+                count(*) FILTER (WHERE order_status = 'delivered') AS entregados,
+                count(*) FILTER (WHERE order_status = 'delivered' AND delay_days > 0) AS tarde,
+                sum(delay_days) FILTER (WHERE order_status = 'delivered' AND delay_days > 0) AS retraso_tarde
+            FROM f
+        """, self._rango(desde, hasta)).iloc[0]
+
+        entregados, tarde = fila['entregados'], fila['tarde']
+        return {
+            'total_pedidos': int(fila['total_pedidos']),
+            'clientes_unicos': int(fila['clientes_unicos']),
+            'porcentaje_tarde': round(float(tarde / entregados * 100), 2) if entregados > 0 else 0,
+            'retraso_medio': round(float(fila['retraso_tarde'] / tarde), 2) if tarde > 0 else 0,
+        }
+
+    def top_estados(self, desde, hasta):
+        df_estados = self._consulta(f"""
+            WITH f AS ({self._filtrado()})
+            SELECT state AS "Estado", count(DISTINCT id_user) AS "Total clientes"
+            FROM f
+            WHERE state IS NOT NULL
+            GROUP BY state
+            ORDER BY "Total clientes" DESC, state
+            LIMIT 5
+        """, self._rango(desde, hasta))
+        return df_estados
+
+    def clientes_por_estado(self, desde, hasta):
+        # Mismo resultado que CuboDiario.clientes_por_estado: todos los estados
+        df_estados = self._consulta(f"""
+            WITH f AS ({self._filtrado()})
+            SELECT state, count(DISTINCT id_user) AS id_user
+            FROM f
+            WHERE state IS NOT NULL
+            GROUP BY state
+            ORDER BY state
+        """, self._rango(desde, hasta))
+        return df_estados.set_index('state')['id_user']
+
+    def ciudades(self, desde, hasta):
+        # Como calcular_ciudades: los pedidos se cuentan por ciudad (sin estado)
+        df_ciudades = self._consulta(f"""
+            WITH f AS ({self._filtrado()}),
+            clientes AS (
+                SELECT city, state, count(DISTINCT id_user) AS total_clientes
+                FROM f
+                WHERE city IS NOT NULL AND state IS NOT NULL
+                GROUP BY city, state
+            ),
+            pedidos AS (
+                SELECT city, count(id_customer_order) AS pedidos
+                FROM f
+                WHERE city IS NOT NULL
+                GROUP BY city
+            )
+            SELECT clientes.city AS "Ciudad", clientes.state AS "Estado",
+                   total_clientes AS "Total clientes", pedidos AS "Pedidos totales"
+            FROM clientes LEFT JOIN pedidos USING (city)
+            ORDER BY "Total clientes" DESC, "Ciudad", "Estado"
+        """, self._rango(desde, hasta))
+
+        df_ciudades['Porcentaje %'] = (
+            df_ciudades['Pedidos totales'] / df_ciudades['Pedidos totales'].sum() * 100
+        ).round(2)
+
+        df_ciudades['Pedidos x cliente'] = (
+            df_ciudades['Pedidos totales'] / df_ciudades['Total clientes']
+        ).round(2)
+
+        return df_ciudades
+
+    def retrasos(self, desde, hasta, umbrales=UMBRALES_DIAGNOSTICO):
+        pedidos_tarde = self._consulta(f"""
+            WITH f AS ({self._filtrado(solo_entregados=True)})
+            SELECT city, state,
+                   count(*) FILTER (WHERE delay_days > 0) AS late,
+                   count(id_customer_order) AS total_pedidos,
+                   coalesce(sum(delay_days) FILTER (WHERE delay_days > 0), 0) AS retraso_tarde
+            FROM f
+            WHERE city IS NOT NULL AND state IS NOT NULL
+            GROUP BY city, state
+            ORDER BY city, state
+        """, self._rango(desde, hasta))
+
+        late = pedidos_tarde['late'].to_numpy()
+        days_late = np.divide(
+            pedidos_tarde['retraso_tarde'].to_numpy(dtype='float64'),
+            late,
+            out=np.zeros(len(pedidos_tarde)),
+            where=late > 0,
+        )
+        pct_tarde = (pedidos_tarde['late'] / pedidos_tarde['total_pedidos'] * 100).round(2)
+
+        return pd.DataFrame({
+            'Ciudad': pedidos_tarde['city'],
+            'Estado': pedidos_tarde['state'],
+            'Pedidos tarde %': pct_tarde,
+            'Dias tarde': days_late,
+            'Diagnóstico': diagnosticar(pct_tarde.to_numpy(), days_late, umbrales),
+        })
+
+    def reviews(self, desde=None, hasta=None):
+        # Reviews de pedidos entregados a tiempo, por estado. Sin fechas se usan
+        # todas, como hace calcular_reviews.
+        if desde is None or hasta is None:
+            desde, hasta = self.rango_fechas()
+
+        customers_review = self._consulta(f"""
+            WITH f AS ({self._filtrado(solo_entregados=True)})
+            SELECT f.state AS "Estado", count(r.order_id) AS "Reviews", avg(r.review_score) AS "Puntuacion"
+            FROM {self._reviews} AS r
+            JOIN f ON r.order_id = f.order_id
+            WHERE NOT coalesce(f.delay_days > 0, false) AND f.state IS NOT NULL
+            GROUP BY f.state
+            ORDER BY f.state
+        """, self._rango(desde, hasta))
+        return customers_review
+
+
+_lock = threading.Lock()
+_backends = {}
+
+
+def obtener_consultas(ruta_customers=None, ruta_reviews=None):
+    # Una instancia por versión de los ficheros, compartida por todas las sesiones
+    if ruta_customers is None:
+        ruta_customers = ruta_customers_por_defecto()
+    if ruta_reviews is None:
+        ruta_reviews = ruta_reviews_por_defecto()
+
+    clave = (ruta_customers, ruta_reviews)
+    version = (firma_fuentes(clave), 'duckdb')
+
+    consultas = _backends.get(clave)
+    if consultas is not None and consultas.version == version:
+        return consultas
+
+    with _lock:
+        consultas = _backends.get(clave)
+        if consultas is None or consultas.version != version:
+            consultas = ConsultasDuckDB(ruta_customers, ruta_reviews)
+            _backends[clave] = consultas
+
+    return consultas
@@ -0,0 +1,274 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datos import COLUMNA_FECHA, filtrar_fechas, leer_agregados
+
+
+# CUBO DIARIO DE AGREGADOS
+#
+# Para cada día y cada par (estado, ciudad) se guardan pedidos, pedidos
+# entregados, pedidos tarde y la suma de días de retraso de los pedidos tarde,
+# acumulados a lo largo del eje de días. El total de cualquier rango de fechas es
+# la resta de dos filas del acumulado, sin recorrer los pedidos.
+#
+# Los clientes únicos (nunique de id_user) no se pueden sumar entre días: por
+# defecto se cuentan sobre las filas del rango, igual que metricas.py y el
+# backend DuckDB. Con exacto=False el total y los de cada estado se estiman con
+# sketches HyperLogLog diarios, que se combinan con un máximo por registro: no
+# recorren las filas, pero son aproximados (~3 % de error con PRECISION_HLL=10).
+#
+# Si incremental.py ha dejado agregados diarios al día para estos ficheros, las
+# sumas se acumulan a partir de ellos en vez de recorrer todas las filas.
+
+PRECISION_HLL = 10
+
+
+def _bit_length(valores):
+    # Número de bits significativos de cada uint64 (búsqueda binaria por desplazamientos)
+    valores = valores.copy()
+    bits = np.zeros(valores.shape, dtype=np.int64)
+    for desplazamiento in (32, 16, 8, 4, 2, 1):
+        mascara = valores >= (np.uint64(1) << np.uint64(desplazamiento))
+        bits += mascara * desplazamiento
+        valores = np.where(mascara, valores >> np.uint64(desplazamiento), valores)
+    return bits + (valores > 0)
+
+
+def registros_hll(ids, precision=PRECISION_HLL):
+    # (registro, rango) de HyperLogLog para cada id
+    hashes = pd.util.hash_pandas_object(pd.Series(ids), index=False).to_numpy()
+    resto = 64 - precision
+
+    registro = (hashes >> np.uint64(resto)).astype(np.int64)
+    bajos = hashes & np.uint64((1 << resto) - 1)
+    rango = resto - _bit_length(bajos) + 1
+
+    return registro, rango.astype(np.uint8)
+
+
+def estimar_hll(registros):
+    # Estimación de cardinalidad por fila; registros tiene forma (..., m)
+    m = registros.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+
+    estimacion = alpha * m * m / np.sum(np.exp2(-registros.astype(np.float64)), axis=-1)
+
+    # Corrección para cardinalidades pequeñas (linear counting)
+    ceros = np.sum(registros == 0, axis=-1)
+    pequena = (estimacion <= 2.5 * m) & (ceros > 0)
+    lineal = m * np.log(m / np.maximum(ceros, 1))
+
+    return np.where(pequena, lineal, estimacion)
+
+
+class CuboDiario:
+
+    def __init__(self, customers, customers_delivered, exacto=True, precision=PRECISION_HLL, agregados=None):
+        self.customers = customers
+        self.customers_delivered = customers_delivered
+        self.exacto = exacto
+        self.precision = precision
+
+        # Los clientes sin pedido (fecha NaT) no caen en ningún rango de fechas
+        customers = customers[customers[COLUMNA_FECHA].notna()]
+        customers_delivered = customers_delivered[customers_delivered[COLUMNA_FECHA].notna()]
+
+        dias = customers[COLUMNA_FECHA].to_numpy().astype('datetime64[D]')
+        self.primer_dia = dias.min()
+        self.n_dias = int((dias.max() - self.primer_dia).astype(np.int64)) + 1
+
+        # Grupos (estado, ciudad) presentes en los datos
+        claves = pd.MultiIndex.from_arrays([customers['state'], customers['city']])
+        codigos, grupos = pd.factorize(claves, sort=True)
+        self.grupos = grupos.to_frame(index=False, name=['state', 'city'])
+        self.n_grupos = len(self.grupos)
+
+        codigos_estado, self.estados = pd.factorize(self.grupos['state'], sort=True)
+
+        dia = self._indice_dia(dias)
+
+        if agregados is not None:
+            self._acumular_agregados(agregados, grupos)
+        else:
+            self._acumular_filas(dia, codigos, customers_delivered, grupos)
+
+        if not exacto:
+            self._construir_sketches(dia, codigos_estado[codigos], customers['id_user'])
+
+    def _acumular_filas(self, dia, codigos, entregados, grupos):
+        self.pedidos = self._acumular(dia, codigos, np.ones(len(dia), dtype=np.int32))
+
+        dia_e = self._indice_dia(entregados[COLUMNA_FECHA].to_numpy().astype('datetime64[D]'))
+        grupo_e = grupos.get_indexer(pd.MultiIndex.from_arrays([entregados['state'], entregados['city']]))
+        delay = entregados['delay_days'].to_numpy(dtype='float64')
+        tarde = delay > 0
+
+        self.entregados = self._acumular(dia_e, grupo_e, np.ones(len(dia_e), dtype=np.int32))
+        self.tarde = self._acumular(dia_e, grupo_e, tarde.astype(np.int32))
+        self.retraso_tarde = self._acumular(dia_e, grupo_e, np.where(tarde, delay, 0).astype(np.int64))
+
+    def _acumular_agregados(self, agregados, grupos):
+        # Una fila por (día, estado, ciudad) en vez de una por pedido
+        dia = self._indice_dia(agregados['dia'].to_numpy().astype('datetime64[D]'))
+        grupo = grupos.get_indexer(pd.MultiIndex.from_arrays([agregados['state'], agregados['city']]))
+        self.pedidos = self._acumular(dia, grupo, agregados['pedidos'].to_numpy(dtype=np.int32))
+        self.entregados = self._acumular(dia, grupo, agregados['entregados'].to_numpy(dtype=np.int32))
+        self.tarde = self._acumular(dia, grupo, agregados['tarde'].to_numpy(dtype=np.int32))
+        self.retraso_tarde = self._acumular(dia, grupo, agregados['retraso_tarde'].to_numpy(dtype=np.int64))
+
+    def _indice_dia(self, dias):
+        return (dias - self.primer_dia).astype(np.int64)
+
+    def _acumular(self, dia, grupo, valores):
+        # Matriz (días + 1, grupos) con la suma acumulada; la fila 0 es todo ceros
+        plano = np.bincount(dia * self.n_grupos + grupo, weights=valores, minlength=self.n_dias * self.n_grupos)
+        diario = plano.astype(valores.dtype).reshape(self.n_dias, self.n_grupos)
+
+        acumulado = np.zeros((self.n_dias + 1, self.n_grupos), dtype=valores.dtype)
+        np.cumsum(diario, axis=0, out=acumulado[1:])
+        return acumulado
+
+    def _construir_sketches(self, dia, estado, ids):
+        m = 1 << self.precision
+        registro, rango = registros_hll(ids, self.precision)
+
+        self.hll_estados = np.zeros((self.n_dias, len(self.estados), m), dtype=np.uint8)
+        clave = (dia * len(self.estados) + estado) * m + registro
+        maximos = pd.Series(rango).groupby(clave).max()
+        self.hll_estados.reshape(-1)[maximos.index.to_numpy()] = maximos.to_numpy()
+
+    # CONSULTAS POR RANGO
+
+    def _limites(self, desde, hasta):
+        inicio = (np.datetime64(desde, 'D') - self.primer_dia).astype(np.int64)
+        fin = (np.datetime64(hasta, 'D') - self.primer_dia).astype(np.int64) + 1
+        return int(np.clip(inicio, 0, self.n_dias)), int(np.clip(fin, 0, self.n_dias))
+
+    def totales(self, desde, hasta):
+        # Agregados por (estado, ciudad) del rango: dos filas del acumulado por métrica
+        inicio, fin = self._limites(desde, hasta)
+        tabla = self.grupos.copy()
+        for nombre in ('pedidos', 'entregados', 'tarde', 'retraso_tarde'):
+            acumulado = getattr(self, nombre)
+            tabla[nombre] = acumulado[fin] - acumulado[inicio]
+        return tabla
+
+    def _filas(self, desde, hasta):
+        return filtrar_fechas(self.customers, desde, hasta)
+
+    def clientes_por_estado(self, desde, hasta):
+        if self.exacto:
+            return self._filas(desde, hasta).groupby('state', observed=True)['id_user'].nunique()
+
+        inicio, fin = self._limites(desde, hasta)
+        if fin <= inicio:
+            return pd.Series(dtype='int64', name='id_user')
+
+        registros = self.hll_estados[inicio:fin].max(axis=0)
+        estimacion = np.rint(estimar_hll(registros)).astype(np.int64)
+        clientes = pd.Series(estimacion, index=pd.Index(self.estados, name='state'), name='id_user')
+        return clientes[clientes > 0]
+
+    def clientes_unicos(self, desde, hasta):
+        if self.exacto:
+            return int(self._filas(desde, hasta)['id_user'].nunique())
+
+        inicio, fin = self._limites(desde, hasta)
+        if fin <= inicio:
+            return 0
+
+        # El sketch global es el máximo de los sketches de todos los estados
+        registros = self.hll_estados[inicio:fin].max(axis=(0, 1))
+        return int(np.rint(estimar_hll(registros)))
+
+    def kpis(self, desde, hasta):
+        tabla = self.totales(desde, hasta)
+
+        entregados = tabla['entregados'].sum()
+        tarde = tabla['tarde'].sum()
+
+        porcentaje_tarde = round(float(tarde / entregados * 100), 2) if entregados > 0 else 0
+        retraso_medio = round(float(tabla['retraso_tarde'].sum() / tarde), 2) if tarde > 0 else 0
+
+        return {
+            'total_pedidos': int(tabla['pedidos'].sum()),
+            'clientes_unicos': self.clientes_unicos(desde, hasta),
+            'porcentaje_tarde': porcentaje_tarde,
+            'retraso_medio': retraso_medio,
+        }
+
+    def top_estados(self, desde, hasta):
+        # Mismo resultado que metricas.calcular_top_estados
+        df_estados = self.clientes_por_estado(desde, hasta).sort_values(ascending=False, kind='stable').head(5)
+
+        df_estados = df_estados.reset_index()
+
+        df_estados.rename(columns={'state': 'Estado', 'id_user': 'Total clientes'}, inplace=True)
+
+        return df_estados
+
+    def estados_rango(self, desde, hasta, columna='pedidos'):
+        # Estados con algún pedido (o entregado, con columna='entregados') en el rango
+        tabla = self.totales(desde, hasta)
+        return sorted(str(estado) for estado in tabla.loc[tabla[columna] > 0, 'state'].unique())
+
+    def ciudades(self, desde, hasta, estado=None):
+        # Mismo resultado que metricas.calcular_ciudades. Los clientes únicos por
+        # ciudad se cuentan sobre las filas del rango: un sketch por día y ciudad
+        # ocuparía demasiado. Con estado, solo las filas de ese estado (el bloque
+        # del estado en la tabla nacional, sin calcularla entera).
+        filas = self._filas(desde, hasta)
+        if estado is not None:
+            filas = filas[filas['state'] == estado]
+        df_ciudades = (filas.groupby(['city', 'state'], observed=True)['id_user'].nunique().reset_index(name='Total clientes').sort_values('Total clientes', ascending=False, kind='stable'))
+
+        tabla = self.totales(desde, hasta)
+        totalPedidos = tabla.groupby('city', observed=True)['pedidos'].sum().reset_index(name='Pedidos totales')
+
+        df_ciudades = pd.merge(df_ciudades, totalPedidos, on='city', how='left')
+
+        # El porcentaje es sobre la suma de la tabla nacional: una fila por
+        # (ciudad, estado) con pedidos, cada una con los pedidos de su ciudad
+        if estado is None:
+            total = df_ciudades['Pedidos totales'].sum()
+        else:
+            con_pedidos = tabla.loc[tabla['pedidos'] > 0, 'city']
+            total = con_pedidos.map(totalPedidos.set_index('city')['Pedidos totales']).sum()
+
+        df_ciudades['Porcentaje %'] = (
+            df_ciudades['Pedidos totales'] / total * 100
+        ).round(2)
+
+        df_ciudades['Pedidos x cliente'] = (
+            df_ciudades['Pedidos totales'] / df_ciudades['Total clientes']
+        ).round(2)
+
+        df_ciudades.rename(columns={'city': 'Ciudad', 'state': 'Estado'}, inplace=True)
+
+        return df_ciudades
+
+
+_lock = threading.Lock()
+_cubos = {}
+
+
+def obtener_cubo(datos, exacto=True):
+    # Un cubo por versión de los datos y modo, compartido por todas las sesiones
+    clave = (datos.version, exacto)
+    cubo = _cubos.get(clave)
+    if cubo is not None:
+        return cubo
+
+    with _lock:
+        cubo = _cubos.get(clave)
+        if cubo is None:
+            agregados = leer_agregados(datos.version[0])
+            cubo = CuboDiario(datos.customers, datos.customers_delivered, exacto=exacto, agregados=agregados)
+            # Los cubos de versiones anteriores ya no sirven
+            for anterior in [c for c in _cubos if c[0] != datos.version]:
+                del _cubos[anterior]
+            _cubos[clave] = cubo
+
+    return cubo
@@ -1,11 +1,23 @@
+import os
+
 import pandas as pd
 import streamlit as st
 from datetime import datetime
-import matplotlib.pyplot as plt
-import numpy as np
-import seaborn as sns
-import geopandas as gpd
-import matplotlib.cm as cm
+
+from datos import cargar_datos, limites_fechas
+from metricas import TODOS_LOS_ESTADOS
+from cubo import obtener_cubo
+from consultas_sql import obtener_consultas
+import compartido
+from estrella import cargar_estrella, existe_estrella
+from tablas import Tablas, resultados
+from paginas import PAGINAS, SELECTOR_DETALLE, SELECTOR_ESTADO, definir_tablas, estado_detalle, tablas_pagina
+import precalentamiento
+import muestra
+from graficos import TITULOS, correlacion_retrasos, pool_procesos, renderizar, renderizar_en_paralelo, renders
+from graficos_cliente import en_cliente, especificacion
+import instrumentacion
+from instrumentacion import etapa
 
 
 st.set_page_config(
@@ -90,37 +102,58 @@ div[data-testid="stMetricLabel"] {
 
 # CARGA Y PREPARACIÓN DE DATOS
 
-customers = pd.read_csv(
-    "streamlit/customers.csv",
-    parse_dates=['order_purchase_timestamp']
-)
+# OLIST_BACKEND=duckdb calcula las tablas con SQL sobre los ficheros (ver
+# consultas_sql.py) sin cargarlos en memoria; por defecto se usa pandas.
+BACKEND = os.environ.get("OLIST_BACKEND", "pandas")
+
+if BACKEND == "duckdb":
+    consultas = obtener_consultas()
+    version = consultas.version
+    fecha_inicio, fecha_fin = consultas.rango_fechas()
+    fuentes = {'consultas': consultas}
+
+else:
+    # Con OLIST_COMPARTIDO=<directorio> las tablas se abren con memory map desde
+    # lo publicado por compartido.py, sin copia propia en cada proceso.
+    # Con OLIST_COMPACTO=0 los identificadores se cargan como texto en vez de códigos int32
+    with etapa("carga") as medicion:
+        if os.environ.get("OLIST_COMPARTIDO"):
+            datos = compartido.obtener_datos(os.environ["OLIST_COMPARTIDO"])
+        else:
+            datos = cargar_datos(compacto=os.environ.get("OLIST_COMPACTO", "1") == "1")
+        medicion.salida(datos.customers)
 
-df_reviews = pd.read_csv(
-    "resources/olist_order_reviews_dataset.csv"
-)
+    customers = datos.customers
 
-customers_delivered = customers[customers['order_status'] == 'delivered']
+    # Con OLIST_CUBO_HLL=1 los clientes únicos se estiman con sketches HyperLogLog
+    # en vez de contarse exactos; la página los marca como aproximados (≈)
+    cubo = obtener_cubo(datos, exacto=os.environ.get("OLIST_CUBO_HLL") != "1")
+    version = (datos.version, cubo.exacto)
+    fuentes = {'datos': datos, 'cubo': cubo}
 
-customers_delivered['order_delivered_customer_date'] = pd.to_datetime(
-    customers_delivered['order_delivered_customer_date']
-)
-customers_delivered['order_estimated_delivery_date'] = pd.to_datetime(
-    customers_delivered['order_estimated_delivery_date']
-)
+    # customers está ordenado por fecha de compra, con los clientes sin pedido (NaT) al principio
+    fecha_inicio, fecha_fin = limites_fechas(customers)
 
-customers_delivered['delay_days'] = (
-    customers_delivered['order_delivered_customer_date'] -
-    customers_delivered['order_estimated_delivery_date']
-).dt.days
-customers_delivered['late'] = customers_delivered['delay_days'] > 0
+# Clientes únicos estimados con HyperLogLog (OLIST_CUBO_HLL=1): se muestran con ≈
+CLIENTES_APROXIMADOS = 'cubo' in fuentes and not fuentes['cubo'].exacto
+AVISO_APROXIMADO = "≈ Total clientes estimado con HyperLogLog (error típico ~3 %)"
+
+# Con el esquema en estrella generado (python estrella.py) se añade la vista de
+# retrasos por vendedor; su versión entra en la clave de las tablas derivadas
+if existe_estrella():
+    estrella = cargar_estrella()
+    version = (version, estrella.version)
+    fuentes['estrella'] = estrella
+
+# Tablas e imágenes de todas las páginas con los filtros por defecto, en segundo
+# plano (ver precalentamiento.py). Solo hace algo la primera vez por versión.
+if precalentamiento.activo:
+    precalentamiento.calentador.programar(version, fecha_inicio, fecha_fin, fuentes)
 
 # SIDEBAR: FILTROS + NAVEGACIÓN
 
 st.sidebar.title("Análisis Olist")
 
-fecha_inicio = customers['order_purchase_timestamp'].min().date()
-fecha_fin = customers['order_purchase_timestamp'].max().date()
-
 st.sidebar.subheader("Filtros")
 
 filtro_fecha = st.sidebar.slider(
@@ -133,521 +166,138 @@ filtro_fecha = st.sidebar.slider(
 # Navegación entre páginas
 pagina = st.sidebar.radio(
     "Ir a:",
-    ["Inicio", "Clientes por estado", "Clientes por ciudad", "Análisis de retrasos", "Análisis de reviews"]
+    PAGINAS
 )
 
+if precalentamiento.activo:
+    preparadas, total = precalentamiento.calentador.progreso()
+    errores_precalentamiento = precalentamiento.calentador.errores()
+    if errores_precalentamiento:
+        # Esas páginas se calculan al abrirlas; el detalle queda en el log
+        st.sidebar.warning("No se pudieron preparar: " + ", ".join(
+            f"{pagina} ({type(error).__name__}: {error})" for pagina, error in errores_precalentamiento.items()
+        ))
+    elif preparadas < total:
+        st.sidebar.caption(f"Preparando páginas en segundo plano: {preparadas}/{total}")
+    else:
+        st.sidebar.caption("Todas las páginas preparadas")
 
-# APLICAR FILTROS
-
-df_filtrado = customers[
-    (customers['order_purchase_timestamp'].dt.date >= filtro_fecha[0]) &
-    (customers['order_purchase_timestamp'].dt.date <= filtro_fecha[1])
-].copy()
-
-df_filtrado_delivered = customers_delivered[
-    (customers_delivered['order_purchase_timestamp'].dt.date >= filtro_fecha[0]) &
-    (customers_delivered['order_purchase_timestamp'].dt.date <= filtro_fecha[1])
-].copy()
-
-
-# FUNCIONES DE MÉTRICAS
-
-def calcular_top_estados(df):
-    
-    df_estados = df.groupby('state')['id_user'].nunique().sort_values(ascending=False).head(5)
-    
-    df_estados = df_estados.reset_index()
-    
-    df_estados.rename(columns={'state': 'Estado', 'id_user': 'Total clientes'}, inplace=True)
-    
-    return df_estados
-
-def calcular_ciudades(df):
-    df_ciudades = (df.groupby(['city', 'state'])['id_user'].nunique().reset_index(name='Total clientes').sort_values('Total clientes', ascending=False))
-    
-    totalPedidos = df.groupby('city')['id_customer_order'].count().reset_index()
-    totalPedidos.rename(columns={'id_customer_order': 'Pedidos totales'}, inplace=True)
-
-    df_ciudades = pd.merge(df_ciudades, totalPedidos, on='city', how='left')
-
-    df_ciudades['Porcentaje %'] = (
-    df_ciudades['Pedidos totales'] / df_ciudades['Pedidos totales'].sum() * 100
-    ).round(2)
-    
-    df_ciudades['Pedidos x cliente'] =(
-        df_ciudades['Pedidos totales'] / df_ciudades['Total clientes']
-    ).round(2)
-
-    df_ciudades.rename(columns={'city': 'Ciudad', 'state':'Estado'}, inplace=True)
-
- 
-    return df_ciudades
-
-
-
-def calcular_retrasos(df_delivered):
-    customers_delivered = customers.query("order_status == 'delivered'").copy()
- 
-   
-    customers_delivered['order_delivered_customer_date'] = pd.to_datetime(customers_delivered['order_delivered_customer_date'])
-    customers_delivered['order_estimated_delivery_date'] = pd.to_datetime(customers_delivered['order_estimated_delivery_date'])
-   
-    customers_delivered['delay_days'] = (customers_delivered['order_delivered_customer_date'] - customers_delivered['order_estimated_delivery_date']).dt.days
-    customers_delivered['late'] = customers_delivered['delay_days'] > 0
-   
- 
-    pedidos_tarde = customers_delivered.groupby(["city", "state"]).agg(
-        late=("late", "sum"),
-        total_pedidos=("id_customer_order", "count"),
-        days_late=("delay_days", lambda x: x[x > 0].mean() if any(x > 0) else 0)
-    ).reset_index()
-   
-   
-    pedidos_tarde["late_orders_%"] = (pedidos_tarde["late"] / pedidos_tarde["total_pedidos"] * 100).round(2)
- 
- 
-   
-    def diagnostico(row):
-        if row['late_orders_%'] > 40 and row['days_late'] > 10:
-            return "Problemas graves"
-        elif row['late_orders_%'] > 25:
-            return "Probable fallo del proveedor o mala preparación del pedido"
-        elif row['late_orders_%'] > 15:
-            return "Retrasos moderados (Posibles problemas con el repartidor)"
-        else:
-            return "Funcionamiento aceptable"
-   
-    pedidos_tarde['Diagnóstico'] = pedidos_tarde.apply(diagnostico, axis=1)
- 
-    pedidos_tarde = pedidos_tarde[["city", "state", "late_orders_%", "days_late", "Diagnóstico"]]
- 
-    pedidos_tarde.rename(columns={"city": "Ciudad", "state": "Estado", "late_orders_%": "Pedidos tarde %","days_late": "Dias tarde"   }, inplace=True)
-    return pedidos_tarde
-
-
-
-def calcular_reviews(customers_delivered, df_reviews):
-    customers_review = customers_delivered[customers_delivered['late'] == False]
-
-    customers_review = pd.merge(
-        df_reviews,
-        customers_review[['order_id','id_customer_order', 'id_user', 'state', 'order_purchase_timestamp']],
-        on='order_id',
-        how='left'
-    )
-
-    customers_review = customers_review.groupby(['state']).agg(
-        Reviews=('order_id', 'count'),
-        Puntuacion=('review_score', 'mean')
-    ).reset_index()
-
-    customers_review.rename(columns={'state': 'Estado'}, inplace=True)
-
-
-    return customers_review
-
-
-
-
-# Precalcular tablas
-topEstados = calcular_top_estados(df_filtrado)
-df_ciudades = calcular_ciudades(df_filtrado)
-pedidos_tarde = calcular_retrasos(df_filtrado_delivered)
-customers_review = calcular_reviews(customers_delivered, df_reviews)
-
-
-# FUNCIONES GRÁFICOS
-
-
-def grafico1(df_ciudades):
-    
-    top_users = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
-
-    st.title("Top 10 Ciudades por Número de Clientes")
-        
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-        
-    bars = ax.bar(top_users['Ciudad'], top_users['Total clientes'], color='#004E64')
-        
-    ax.set_xlabel('Ciudad')
-    ax.set_ylabel('Cantidad de Usuarios Únicos')
-        
-
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-        
-
-    for i, v in enumerate(top_users['Total clientes']):
-        ax.text(i, v + (v * 0.02), f"{v:,}", ha='center', fontsize=10)
-        
-    plt.tight_layout()
-        
-
-    st.pyplot(fig)
-
-
-
-def grafico2(df_ciudades):
-       
-    top_orders = df_ciudades.sort_values('Pedidos totales', ascending=False).head(10)
-    
-    st.title("Top 10 Ciudades por Total de Pedidos")
-    
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    bars = ax.bar(top_orders['Ciudad'], top_orders['Pedidos totales'], color="#4ca5b6")
-    
-    ax.set_xlabel('Ciudad')
-    ax.set_ylabel('Total de Pedidos')
-    
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    
-    for i, v in enumerate(top_orders['Pedidos totales']):
-        ax.text(i, v + (v * 0.02), f"{v:,}", ha='center', fontsize=10)
-    
-    plt.tight_layout()
-    st.pyplot(fig)
-
-
-
-
-def grafico3(df_ciudades):
-    color_users = "#4ca5b6"   
-    color_orders = '#1d3557'  
-
-    top_combined = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
-    
-
-    st.title("Comparativa: Usuarios únicos vs Total de pedidos por ciudad (Top 10)")
-
-    fig, ax = plt.subplots(figsize=(14, 6))
-    
-
-    ax.plot(
-        top_combined['Ciudad'],
-        top_combined['Total clientes'],
-        marker='o',
-        color=color_users,
-        linewidth=2,
-        label='Usuarios únicos'
-    )
-    
-
-    ax.plot(
-        top_combined['Ciudad'],
-        top_combined['Pedidos totales'],
-        marker='s',
-        color=color_orders,
-        linewidth=2,
-        label='Total pedidos'
-    )
-    
-
-    ax.set_xlabel('Ciudad')
-    ax.set_ylabel('Cantidad')
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    
-
-    ax.legend()
-    ax.grid(True, linestyle='--', alpha=0.5)
-    
-    plt.tight_layout()
-    
-
-    st.pyplot(fig)
-
-
-def grafico4(df_ciudades):
-    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
-    st.title("Top 10 Ciudades por Porcentaje de Pedidos (%)")
-
-    fig, ax = plt.subplots(figsize=(14, 9))
-    bars = ax.bar(
-        top_pct['Ciudad'],
-        top_pct['Porcentaje %'],
-        color='#52b788',     
-    )
-    
-    ax.set_xlabel('Ciudad', fontsize=12)
-    ax.set_ylabel('Porcentaje (%)', fontsize=12)
-    
-
-    plt.setp(ax.get_xticklabels(), rotation=40, ha='right')
-    
-
-    for i, v in enumerate(top_pct['Porcentaje %']):
-        ax.text(i, v + 0.5, f"{v}%", ha='center', fontsize=10)
-    
-    plt.tight_layout()
-    
-
-    st.pyplot(fig)
-
-
-def grafico5(df_ciudades):
-    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
-    st.title("Participación de Pedidos por Ciudad (%) – Top 10")
-    
-
-    colors = [
-        '#1d3557',  
-        '#457b9d',
-        '#6096ba',
-        '#a8dadc',
-        '#00b4d8',
-        '#48cae4',
-        '#90e0ef',
-        '#52b788',  
-        '#2d6a4f',
-        '#95d5b2'   
-    ]
-    
-
-    fig, ax = plt.subplots(figsize=(10, 10))
-    
-    ax.pie(
-        top_pct['Porcentaje %'],
-        labels=top_pct['Ciudad'],
-        autopct='%1.1f%%',
-        startangle=140,
-        colors=colors
-    )
-    
-    plt.tight_layout()
-
-    st.pyplot(fig)
-
-
-#GRAFICOS PAGINA 3
-def grafico6(pedidos_tarde):
-    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
-    
-    cities = top10['Ciudad']
-    days_late = top10['Dias tarde']
-    
-    st.title("Días Promedio de Retraso por Ciudad (Top 10)")
-    
-
-    fig, ax = plt.subplots(figsize=(12,6))
-    
-
-    bars = ax.bar(cities, days_late, color='#1d3557')
-    
-    ax.set_xlabel('Ciudad')
-    ax.set_ylabel('Días')
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    
-
-    for i, v in enumerate(days_late):
-        ax.text(i, v + 0.1, f"{v:.1f}", ha='center', fontsize=10)
-    
-    plt.tight_layout()
-    
-
-    st.pyplot(fig)
-
-def grafico7(pedidos_tarde):
-    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False)
- 
-    x = top10['Pedidos tarde %']
-    y = top10['Dias tarde']
-    cities = top10['Ciudad']
-    
-
-    coef = np.polyfit(x, y, 1)
-    y_fit = np.polyval(coef, x)
-    
-    st.title("Relación: % Pedidos Tarde vs Días Promedio de Retraso")
-    
-
-    fig, ax = plt.subplots(figsize=(10,6))
-    
-
-    ax.scatter(x, y, color='#52b788', s=100, alpha=0.8, label='Ciudades')
-    
-
-    ax.plot(x, y_fit, color='#1d3557', linestyle='--', linewidth=2, label='Tendencia')
-    
-
-    ax.set_xlabel('% Pedidos entregados tarde')
-    ax.set_ylabel('Días promedio de retraso')
-    ax.grid(True, linestyle='--', alpha=0.5)
-    ax.legend()
-    
-    plt.tight_layout()
-    st.pyplot(fig)
-
-    correlacion = x.corr(y)
-    st.write(f"**Coeficiente de correlación:** {correlacion:.2f}")
 
+# TABLAS DERIVADAS
+# Se calculan bajo demanda (ver tablas.py): cada página declara las que necesita
 
-def grafico8(pedidos_tarde):
-    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
-    cities = top10['Ciudad']
-    
-    x = np.arange(len(cities))
-    width = 0.4
-    
-    st.title("Comparativa: Días promedio de retraso vs % de pedidos entregados tarde (Top 10 ciudades)")
-    
+desde, hasta = filtro_fecha
 
-    fig, ax1 = plt.subplots(figsize=(14,6))
-    
+tablas = Tablas(version, (desde, hasta))
 
-    color_days_late = '#457b9d' 
-    color_late_pct = '#2a9d8f'   
-    
+definir_tablas(tablas, desde, hasta, **fuentes)
 
-    bars1 = ax1.bar(x - width/2, top10['Dias tarde'], width, label='Días promedio de retraso', color=color_days_late)
-    ax1.set_ylabel('Días promedio de retraso', color=color_days_late)
-    ax1.tick_params(axis='y', labelcolor=color_days_late)
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(cities, rotation=45, ha='right')
-    ax1.grid(axis='y', linestyle='--', alpha=0.5)
-
-    ax2 = ax1.twinx()
-    bars2 = ax2.bar(x + width/2, top10['Pedidos tarde %'], width, label='% Pedidos entregados tarde', color=color_late_pct)
-    ax2.set_ylabel('% Pedidos entregados tarde', color=color_late_pct)
-    ax2.tick_params(axis='y', labelcolor=color_late_pct)
-
-    handles1, labels1 = ax1.get_legend_handles_labels()
-    handles2, labels2 = ax2.get_legend_handles_labels()
-    ax1.legend(handles1 + handles2, labels1 + labels2, loc='upper left', bbox_to_anchor=(1.02, 1))
-    
-    plt.tight_layout()
-    
+# En las páginas con selectbox de estado, si ya hay uno elegido solo se pide su
+# bloque (ver indice_estados.py) y no la tabla nacional
+estado_pagina = TODOS_LOS_ESTADOS
+if pagina in SELECTOR_ESTADO:
+    estado_pagina = st.session_state.get(SELECTOR_ESTADO[pagina][0], TODOS_LOS_ESTADOS)
 
-    st.pyplot(fig)
+# MODO PROGRESIVO
+# Con OLIST_PROGRESIVO=1, si las tablas exactas de la página no están hechas se
+# pinta antes una estimación con la muestra estratificada (ver muestra.py) y las
+# exactas se calculan en segundo plano; al terminar, un rerun las pone en su sitio.
 
-#GRAFICOS PAGINA 4
-def grafico9(customers_review):
-    customers_review_sorted = customers_review.sort_values('Puntuacion', ascending=False)
- 
-    st.title("Puntaje promedio de reviews por estado (Pedidos entregados a tiempo)")
-    
+PROGRESIVO = os.environ.get("OLIST_PROGRESIVO") == "1" and 'datos' in fuentes
 
-    fig, ax = plt.subplots(figsize=(12,6))
-    
+# El estado del detalle del mapa depende del top de estados: en modo progresivo
+# solo se resuelve si ya está calculado, para no esperar por él
+estado_mapa = None
+if pagina in SELECTOR_DETALLE and (not PROGRESIVO or tablas.disponibles(['top_estados', 'estados_ciudades'])):
+    estado_mapa = estado_detalle(tablas, st.session_state.get(SELECTOR_DETALLE[pagina]))
 
-    line_color = '#1d3557'  
-    fill_color = '#a8dadc' 
-    
+tablas_necesarias = tablas_pagina(pagina, estado_pagina, estado_mapa)
 
-    ax.plot(
-        customers_review_sorted['Estado'],
-        customers_review_sorted['Puntuacion'],
-        marker='o',
-        linestyle='-',
-        color=line_color,
-        linewidth=2,
-        markersize=6,
-        label='Puntaje promedio'
-    )
+aviso = st.empty()
+refinamiento = None
+vista_previa = False
+clave_pagina = (version, desde, hasta, pagina, estado_pagina)
 
+if (
+    PROGRESIVO
+    and st.session_state.get("refinado") != clave_pagina
+    and not tablas.disponibles(tablas_necesarias)
+):
+    with etapa("muestra"):
+        aproximadas = muestra.obtener_muestra(datos).tablas(version, desde, hasta, fuentes)
+        estimacion = aproximadas['kpis']
 
-    ax.set_xlabel('Estado', fontsize=12)
-    ax.set_ylabel('Puntaje promedio', fontsize=12)
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    ax.legend()
-    
-    plt.tight_layout()
-    st.pyplot(fig)
+    # Con pocas filas en el rango el error es grande: mejor esperar a las exactas
+    if estimacion['error_relativo'] <= muestra.TOLERANCIA:
+        refinamiento = muestra.refinar(version, desde, hasta, fuentes, tablas_necesarias)
+        tablas = aproximadas
+        vista_previa = True
+        aviso.info(
+            f"Vista previa con una muestra del {muestra.FRACCION:.0%} de los pedidos "
+            f"(error relativo ≤ {estimacion['error_relativo']:.1%}). Calculando el resultado exacto…"
+        )
 
+if not vista_previa:
+    tablas.preparar(tablas_necesarias)
 
 
-def grafico10(customers_review):
-    x = customers_review['Reviews']
-    y = customers_review['Puntuacion']
-    states = customers_review['Estado']
-    
-    st.title("Reviews vs Puntaje promedio por estado (Pedidos entregados a tiempo)")
+# GRÁFICOS
+# Las imágenes salen de la cache de renderizado de graficos.py.
+# Con OLIST_RENDER_PROCESOS=N los gráficos de la página se dejan con su hueco
+# reservado y se dibujan todos a la vez en N procesos al final del script
+# (completar_graficos); cada imagen ocupa su hueco según termina.
+# Los gráficos de OLIST_GRAFICOS_CLIENTE se mandan como Vega-Lite y los dibuja
+# el navegador (ver graficos_cliente.py).
 
-    norm = (y - y.min()) / (y.max() - y.min())
-    colors = cm.winter(norm)
-    
+RENDER_PROCESOS = int(os.environ.get("OLIST_RENDER_PROCESOS", "0"))
 
-    fig, ax = plt.subplots(figsize=(10,6))
-    
+if RENDER_PROCESOS:
+    # Arranca los procesos (solo la primera vez) mientras se calcula la página
+    pool_procesos(RENDER_PROCESOS)
 
-    ax.scatter(x, y, color=colors, s=100, alpha=0.8)
-    
+graficos_pendientes = []
 
-    ax.set_xlabel('Número de reviews', fontsize=12)
-    ax.set_ylabel('Puntaje promedio', fontsize=12)
-    ax.grid(True, linestyle='--', alpha=0.5)
-    
-    plt.tight_layout()
-    st.pyplot(fig)
 
+def mostrar_grafico(nombre, df, *args):
+    if nombre in TITULOS:
+        st.title(TITULOS[nombre])
 
+    if vista_previa and not en_cliente(nombre):
+        # La imagen se dibuja con las tablas exactas; mientras, el hueco queda reservado
+        st.empty().caption("Gráfico en preparación…")
+        return
 
+    if en_cliente(nombre):
+        with etapa(f"vega_lite:{nombre}", df):
+            tabla, spec = especificacion(nombre, df, *args)
+            st.vega_lite_chart(tabla, spec, width="stretch", theme=None)
+        return
 
+    if RENDER_PROCESOS:
+        graficos_pendientes.append((st.empty(), nombre, df, args))
+        return
 
+    imagen = renderizar(nombre, df, *args)
+    with etapa(f"st.image:{nombre}"):
+        st.image(imagen, width="stretch")
 
-def grafico11(customers_review):
-    customers_review_sorted = customers_review.sort_values('Puntuacion', ascending=False)
-    
-    st.title("Reviews por estado")
 
-    heatmap_data = customers_review_sorted.pivot(
-        index='Estado',
-        columns='Reviews',
-        values='Puntuacion'
-    )
-    
-    fig, ax = plt.subplots(figsize=(10,8))
-    
-    sns.heatmap(
-        heatmap_data,
-        annot=True,
-        fmt=".2f",
-        cmap='YlGnBu',
-        cbar_kws={'label': 'Puntaje promedio'},
-        ax=ax
-    )
-    
-    ax.set_xlabel('Número de reviews')
-    ax.set_ylabel('Estado')
-    
-    plt.tight_layout()
-    
-    st.pyplot(fig)
-
-
-
-def mapa(geojson_path, df_pedidos):
-
-    
-    estados = gpd.read_file(geojson_path)
-
-    df_pedidos = df_pedidos.reset_index()
-
-    estados = estados.merge(
-        df_pedidos[['Estado', 'Total clientes']],
-        left_on='abbrev_state',
-        right_on='Estado',
-        how='left'
-    )
-
-    estados.rename(columns={'Total clientes': 'pedidos'}, inplace=True)
-
-    estados['pedidos'] = estados['pedidos'].fillna(0)
-
-    fig, ax = plt.subplots(figsize=(10, 8))
-    estados.plot(
-        column="pedidos",
-        cmap="viridis",
-        linewidth=0.8,
-        edgecolor="black",
-        legend=True,
-        ax=ax
-    )
-    ax.set_title("Mapa coroplético - Pedidos")
-    ax.axis('off')  
-
-    st.pyplot(fig)
+def mostrar_tabla(df, **opciones):
+    st.dataframe(df, **opciones)
+    # En la vista previa las tablas salen de la muestra
+    if vista_previa:
+        st.caption("≈ Aproximado: estimación con la muestra (las columnas ± son el error al 95 %)"
+                   if any(str(columna).endswith("±") for columna in df.columns)
+                   else "≈ Aproximado: estimación con la muestra")
 
 
+def completar_graficos():
+    peticiones = [(nombre, df, args) for _, nombre, df, args in graficos_pendientes]
+    with etapa("render_paralelo", peticiones):
+        for posicion, imagen in renderizar_en_paralelo(peticiones, RENDER_PROCESOS):
+            graficos_pendientes[posicion][0].image(imagen, width="stretch")
+    graficos_pendientes.clear()
+
 
 # PÁGINA 0: INICIO (KPIs)
 
@@ -659,23 +309,22 @@ if pagina == "Inicio":
 
     col1, col2, col3, col4 = st.columns(4)
 
-    total_pedidos = len(df_filtrado)
-    clientes_unicos = df_filtrado['id_user'].nunique()
+    kpis = tablas['kpis']
+    topEstados = tablas['top_estados']
+    df_ciudades = tablas['ciudades']
 
-    if len(df_filtrado_delivered) > 0:
-        porcentaje_tarde = (df_filtrado_delivered['late'].mean() * 100).round(2)
-        retraso_medio = df_filtrado_delivered.loc[
-            df_filtrado_delivered['delay_days'] > 0, 'delay_days'
-        ].mean()
-        retraso_medio = 0 if pd.isna(retraso_medio) else round(retraso_medio, 2)
-    else:
-        porcentaje_tarde = 0
-        retraso_medio = 0
+    def kpi(nombre, sufijo=""):
+        # Las estimaciones de la muestra llevan su error
+        if 'errores' in kpis:
+            return f"≈{kpis[nombre]}{sufijo} ±{kpis['errores'][nombre]}{sufijo}"
+        if CLIENTES_APROXIMADOS and nombre == 'clientes_unicos':
+            return f"≈{kpis[nombre]}{sufijo}"
+        return f"{kpis[nombre]}{sufijo}"
 
-    col1.metric("Total pedidos", total_pedidos)
-    col2.metric("Clientes únicos", clientes_unicos)
-    col3.metric("% pedidos tarde", f"{porcentaje_tarde}%")
-    col4.metric("Retraso medio (días)", retraso_medio)
+    col1.metric("Total pedidos", kpi('total_pedidos'))
+    col2.metric("Clientes únicos", kpi('clientes_unicos'))
+    col3.metric("% pedidos tarde", kpi('porcentaje_tarde', "%"))
+    col4.metric("Retraso medio (días)", kpi('retraso_medio'))
 
     st.markdown("---")
 
@@ -684,6 +333,8 @@ if pagina == "Inicio":
     with col5:
         st.subheader("Top 5 estados por clientes")
         st.bar_chart(topEstados.set_index('Estado')['Total clientes'])
+        if CLIENTES_APROXIMADOS:
+            st.caption(AVISO_APROXIMADO)
 
     with col6:
         st.subheader("Top 10 ciudades por pedidos")
@@ -702,14 +353,38 @@ elif pagina == "Clientes por estado":
         f"Rango de fechas: {filtro_fecha[0]} — {filtro_fecha[1]}"
     )
 
+    topEstados = tablas['top_estados']
+
     st.subheader("Top 5 Clientes por estado")
-    st.dataframe(topEstados)
+    mostrar_tabla(topEstados)
+    if CLIENTES_APROXIMADOS:
+        st.caption(AVISO_APROXIMADO)
 
     st.subheader("Top 5 Clientes por estado")
     st.bar_chart(topEstados.set_index('Estado')['Total clientes'])
 
     st.subheader("Mapa")
-    mapa('br_states.geojson',topEstados)
+    mostrar_grafico('mapa', topEstados)
+
+    # Detalle de un estado del mapa: sus totales y su bloque de ciudades
+    st.subheader("Detalle por estado")
+    estados_mapa = tablas['estados_ciudades']
+    if estados_mapa:
+        # Por defecto el mismo estado que se preparó arriba (ver paginas.estado_detalle)
+        if estado_mapa not in estados_mapa:
+            estado_mapa = estado_detalle(tablas)
+        estado_mapa = st.selectbox(
+            "Ver ciudades de:", estados_mapa,
+            index=estados_mapa.index(estado_mapa), key=SELECTOR_DETALLE[pagina]
+        )
+
+        totales = tablas.obtener('totales_estado', estado_mapa)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Ciudades", totales['Ciudades'])
+        # Los mismos clientes únicos del estado que el top 5 de arriba
+        col2.metric("Clientes", f"≈{totales['Total clientes']}" if CLIENTES_APROXIMADOS else totales['Total clientes'])
+        col3.metric("Pedidos", totales['Pedidos totales'])
+        mostrar_tabla(tablas.obtener('ciudades_estado', estado_mapa).head(10), hide_index=True)
     
 
 
@@ -723,24 +398,23 @@ elif pagina == "Clientes por ciudad":
  
     #FILTRO
  
-    estados_disponibles = df_ciudades['Estado'].sort_values().unique()
-    estado_seleccionado = st.selectbox("Filtrar por estado:", ["ALL STATES"] + list(estados_disponibles))
+    estados_disponibles = tablas['estados_ciudades']
+    estado_seleccionado = st.selectbox(
+        "Filtrar por estado:", [TODOS_LOS_ESTADOS] + estados_disponibles, key=SELECTOR_ESTADO[pagina][0]
+    )
  
-    if estado_seleccionado == 'ALL STATES':
-        df_filtrado = df_ciudades
-    else:
-        df_filtrado = df_ciudades[df_ciudades['Estado'] == estado_seleccionado]
+    df_filtrado = tablas.obtener('ciudades_estado', estado_seleccionado)
  
  
  
     st.subheader("Ranking de clientes por ciudades")
-    st.dataframe(df_filtrado)
+    mostrar_tabla(df_filtrado)
  
-    grafico1(df_filtrado)
-    grafico2(df_filtrado)
-    grafico3(df_filtrado)
-    grafico4(df_filtrado)
-    grafico5(df_filtrado)
+    mostrar_grafico('grafico1', df_filtrado)
+    mostrar_grafico('grafico2', df_filtrado)
+    mostrar_grafico('grafico3', df_filtrado)
+    mostrar_grafico('grafico4', df_filtrado)
+    mostrar_grafico('grafico5', df_filtrado)
  
 
 
@@ -757,22 +431,31 @@ elif pagina == "Análisis de retrasos":
    
     #FILTRO
  
-    estados_disponibles = pedidos_tarde['Estado'].sort_values().unique()
-    estado_seleccionado = st.selectbox("Filtrar por estado:", ["ALL STATES"] + list(estados_disponibles))
+    estados_disponibles = tablas['estados_retrasos']
+    estado_seleccionado = st.selectbox(
+        "Filtrar por estado:", [TODOS_LOS_ESTADOS] + estados_disponibles, key=SELECTOR_ESTADO[pagina][0]
+    )
  
-    if estado_seleccionado == 'ALL STATES':
-        pedidos_tarde_filtrado = pedidos_tarde
-    else:
-        pedidos_tarde_filtrado = pedidos_tarde[pedidos_tarde['Estado'] == estado_seleccionado]
+    pedidos_tarde_filtrado = tablas.obtener('retrasos_estado', estado_seleccionado)
  
  
  
     st.subheader("Revisión de demoras")
-    st.dataframe(pedidos_tarde_filtrado)
+    mostrar_tabla(pedidos_tarde_filtrado)
  
-    grafico6(pedidos_tarde_filtrado)
-    grafico7(pedidos_tarde_filtrado)
-    grafico8(pedidos_tarde_filtrado)
+    mostrar_grafico('grafico6', pedidos_tarde_filtrado)
+    mostrar_grafico('grafico7', pedidos_tarde_filtrado)
+    st.write(f"**Coeficiente de correlación:** {correlacion_retrasos(pedidos_tarde_filtrado):.2f}")
+    mostrar_grafico('grafico8', pedidos_tarde_filtrado)
+
+    if 'estrella' in fuentes:
+        st.subheader("Retrasos por vendedor")
+        st.caption(
+            "Envío tarde: el vendedor entregó al transportista después de shipping_limit_date. "
+            "Tarde por vendedor: de los pedidos que llegaron tarde al cliente, los que ya salieron tarde del vendedor. "
+            "El estado es el del vendedor."
+        )
+        mostrar_tabla(tablas.obtener('retrasos_vendedor_estado', estado_seleccionado), hide_index=True)
 
 
 # PÁGINA 4: ANÁLISIS DE REVIEWS Y SCORE MEDIO
@@ -781,9 +464,35 @@ elif pagina == "Análisis de reviews":
     st.write(
         f"Rango de fechas: {filtro_fecha[0]} — {filtro_fecha[1]}"
     )
+    customers_review = tablas['reviews']
+
     st.subheader("Análisis de reviews")
-    st.dataframe(customers_review)
-    grafico9(customers_review)
-    grafico10(customers_review)
-    grafico11(customers_review)
-  
\ No newline at end of file
+    mostrar_tabla(customers_review)
+    mostrar_grafico('grafico9', customers_review)
+    mostrar_grafico('grafico10', customers_review)
+    mostrar_grafico('grafico11', customers_review)
+  
+
+if graficos_pendientes:
+    completar_graficos()
+
+if refinamiento is not None:
+    refinamiento.result()
+    # El rerun encuentra las exactas en la cache; no se vuelve a estimar esta combinación
+    st.session_state["refinado"] = clave_pagina
+    st.rerun()
+
+
+# PANEL DE PERFIL
+# Oculto: solo aparece con OLIST_PERFIL=1 y ?perfil=1 en la URL
+
+if instrumentacion.activa and st.query_params.get("perfil") == "1":
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Perfil por etapa")
+    st.sidebar.dataframe(instrumentacion.resumen(), hide_index=True)
+
+    st.sidebar.subheader("Caches")
+    st.sidebar.dataframe(pd.DataFrame({
+        'Resultados': resultados.estadisticas(),
+        'Renders': renders.estadisticas(),
+    }))
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# CARGA Y PREPARACIÓN DE DATOS
+#
+# Los DataFrames se construyen una sola vez por proceso y se comparten entre
+# todas las sesiones de Streamlit. Antes de devolverlos se comprueba la fecha de
+# modificación y el tamaño de los ficheros de origen: si alguno ha cambiado se
+# vuelven a leer. Los DataFrames compartidos no deben modificarse in situ.
+#
+# customers y customers_delivered se guardan ordenados por fecha de compra, de
+# modo que un rango de fechas es siempre un bloque contiguo de filas.
+
+RUTA_CUSTOMERS = "streamlit/customers.csv"
+RUTA_ARTEFACTO = "streamlit/customers.parquet"
+RUTA_REVIEWS = "resources/olist_order_reviews_dataset.csv"
+RUTA_REVIEWS_ARTEFACTO = "streamlit/reviews.parquet"
+# Agregados diarios por (día, estado, ciudad) que mantiene incremental.py
+RUTA_AGREGADOS = "streamlit/agregados_diarios.parquet"
+CLAVE_FIRMA = b'olist_firma'
+
+log = logging.getLogger(__name__)
+
+COLUMNA_FECHA = 'order_purchase_timestamp'
+
+FECHAS_CUSTOMERS = [
+    'order_purchase_timestamp',
+    'order_delivered_customer_date',
+    'order_estimated_delivery_date',
+]
+
+# Modo compacto: identificadores hex de 32 caracteres -> códigos int32
+COLUMNAS_ID = ['id_user', 'id_customer_order', 'order_id']
+COLUMNAS_CATEGORICAS = ['city', 'state', 'order_status']
+
+
+@dataclass
+class Datos:
+    customers: pd.DataFrame
+    customers_delivered: pd.DataFrame
+    df_reviews: pd.DataFrame
+    version: tuple
+    tiempos: dict = field(default_factory=dict)
+    # columna -> Index con los valores originales (solo en modo compacto)
+    diccionarios: dict = field(default_factory=dict)
+    # Reviews de pedidos entregados ya unidas al pedido (ver construir_hechos_reviews)
+    hechos_reviews: pd.DataFrame = None
+
+    def decodificar(self, df, columnas=None):
+        # Devuelve una copia de df con los identificadores originales, para mostrar/exportar
+        df = df.copy()
+        for columna in columnas or self.diccionarios:
+            if columna in df.columns and columna in self.diccionarios:
+                df[columna] = self.diccionarios[columna].take(df[columna].to_numpy(), allow_fill=True)
+        return df
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def firma_fuentes(rutas):
+    # (ruta, mtime, tamaño) de cada fichero: cambia en cuanto se reescribe alguno
+    firma = []
+    for ruta in rutas:
+        info = os.stat(ruta)
+        firma.append((ruta, info.st_mtime_ns, info.st_size))
+    return tuple(firma)
+
+
+def leer_customers(ruta):
+    # El Parquet de construir_dataset.py ya viene tipado; el CSV hay que parsearlo
+    if ruta.endswith(".parquet"):
+        return pd.read_parquet(ruta)
+
+    customers = pd.read_csv(ruta, index_col=0, parse_dates=FECHAS_CUSTOMERS)
+    customers.reset_index(drop=True, inplace=True)
+    return customers
+
+
+def leer_reviews(ruta):
+    # reviews.parquet lo escribe etl.py --streaming
+    if ruta.endswith(".parquet"):
+        return pd.read_parquet(ruta)
+    return pd.read_csv(ruta)
+
+
+def firma_metadatos(firma):
+    # Solo (mtime, tamaño): la misma firma aunque las rutas se escriban distinto
+    return json.dumps([[mtime, tamano] for _, mtime, tamano in firma]).encode()
+
+
+def leer_agregados(firma, ruta=RUTA_AGREGADOS):
+    # Los agregados solo valen para los ficheros con los que se calcularon
+    if not os.path.exists(ruta):
+        return None
+    metadatos = pq.read_schema(ruta).metadata or {}
+    if metadatos.get(CLAVE_FIRMA) != firma_metadatos(firma):
+        return None
+    return pd.read_parquet(ruta)
+
+
+def compactar(customers, df_reviews):
+    customers = customers.copy()
+    df_reviews = df_reviews.copy()
+    diccionarios = {}
+
+    for columna in COLUMNAS_ID:
+        if columna == 'order_id':
+            # order_id se comparte con las reviews: un solo diccionario para las dos tablas
+            codigos, valores = pd.factorize(pd.concat([customers[columna], df_reviews[columna]], ignore_index=True))
+            customers[columna] = codigos[:len(customers)].astype(np.int32)
+            df_reviews[columna] = codigos[len(customers):].astype(np.int32)
+        else:
+            codigos, valores = pd.factorize(customers[columna])
+            customers[columna] = codigos.astype(np.int32)
+        diccionarios[columna] = valores
+
+    for columna in COLUMNAS_CATEGORICAS:
+        customers[columna] = customers[columna].astype('category')
+
+    for columna in customers.select_dtypes('integer').columns.difference(COLUMNAS_ID):
+        customers[columna] = pd.to_numeric(customers[columna], downcast='integer')
+    for columna in customers.select_dtypes('float').columns:
+        customers[columna] = pd.to_numeric(customers[columna], downcast='float')
+
+    df_reviews['review_score'] = pd.to_numeric(df_reviews['review_score'], downcast='integer')
+
+    return customers, df_reviews, diccionarios
+
+
+def preparar_delivered(customers):
+    customers_delivered = customers[customers['order_status'] == 'delivered'].copy()
+
+    if 'delay_days' in customers_delivered.columns:
+        return customers_delivered
+
+    customers_delivered['delay_days'] = (
+        customers_delivered['order_delivered_customer_date'] -
+        customers_delivered['order_estimated_delivery_date']
+    ).dt.days
+    customers_delivered['late'] = customers_delivered['delay_days'] > 0
+
+    return customers_delivered
+
+
+def construir_hechos_reviews(customers_delivered, df_reviews):
+    # Una fila por review de un pedido entregado, con la fecha de compra, el
+    # estado, la ciudad y si llegó tarde. Ordenada por (late, fecha de compra):
+    # los pedidos a tiempo son un bloque y, dentro, un rango de fechas es un slice.
+    hechos = pd.merge(
+        df_reviews[['order_id', 'review_score']],
+        customers_delivered[['order_id', COLUMNA_FECHA, 'state', 'city', 'late']],
+        on='order_id',
+        how='inner'
+    )
+    # NaT al principio de cada bloque, como en customers: rango_filas cuenta con ello
+    hechos = hechos.sort_values(['late', COLUMNA_FECHA], kind='stable', na_position='first', ignore_index=True)
+    return hechos.set_index('order_id')
+
+
+def _construir(ruta_customers, ruta_reviews, version, compacto):
+    tiempos = {}
+    diccionarios = {}
+
+    inicio = time.perf_counter()
+    customers = leer_customers(ruta_customers)
+    customers = customers.sort_values(COLUMNA_FECHA, kind='stable', na_position='first', ignore_index=True)
+    tiempos['customers'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    df_reviews = leer_reviews(ruta_reviews)
+    tiempos['reviews'] = time.perf_counter() - inicio
+
+    if compacto:
+        inicio = time.perf_counter()
+        customers, df_reviews, diccionarios = compactar(customers, df_reviews)
+        tiempos['compactar'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    customers_delivered = preparar_delivered(customers)
+    tiempos['preparacion'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    hechos_reviews = construir_hechos_reviews(customers_delivered, df_reviews)
+    tiempos['hechos_reviews'] = time.perf_counter() - inicio
+
+    tiempos['total'] = sum(tiempos.values())
+
+    return Datos(customers, customers_delivered, df_reviews, version, tiempos, diccionarios, hechos_reviews)
+
+
+# Última fuente elegida para cada CSV, para registrar solo los cambios
+_fuentes_elegidas = {}
+
+
+def elegir_fuente(csv, artefacto):
+    # El artefacto solo si es al menos tan reciente como el CSV del que sale: si
+    # el notebook reescribe el CSV, el Parquet anterior deja de valer y se lee el
+    # CSV hasta que se vuelva a construir.
+    if not os.path.exists(artefacto):
+        ruta, motivo = csv, "no hay artefacto"
+    elif not os.path.exists(csv):
+        ruta, motivo = artefacto, "no hay CSV"
+    elif os.stat(artefacto).st_mtime_ns >= os.stat(csv).st_mtime_ns:
+        ruta, motivo = artefacto, "artefacto al día"
+    else:
+        ruta, motivo = csv, "el CSV es más reciente que el artefacto"
+
+    if _fuentes_elegidas.get(csv) != ruta:
+        _fuentes_elegidas[csv] = ruta
+        log.info("Fuente de %s: %s (%s)", csv, ruta, motivo)
+    return ruta
+
+
+def ruta_customers_por_defecto():
+    return elegir_fuente(RUTA_CUSTOMERS, RUTA_ARTEFACTO)
+
+
+def ruta_reviews_por_defecto():
+    return elegir_fuente(RUTA_REVIEWS, RUTA_REVIEWS_ARTEFACTO)
+
+
+def cargar_datos(ruta_customers=None, ruta_reviews=None, compacto=False):
+    if ruta_customers is None:
+        ruta_customers = ruta_customers_por_defecto()
+    if ruta_reviews is None:
+        ruta_reviews = ruta_reviews_por_defecto()
+
+    # Una sola copia por modo: la firma lleva las rutas, así que si cambia la
+    # fuente elegida (CSV -> Parquet) la versión nueva sustituye a la anterior
+    # en vez de quedarse las dos en memoria
+    clave = compacto
+    version = (firma_fuentes((ruta_customers, ruta_reviews)), compacto)
+
+    datos = _cache.get(clave)
+    if datos is not None and datos.version == version:
+        return datos
+
+    # Solo un hilo reconstruye; el resto espera y reutiliza el resultado
+    with _lock:
+        datos = _cache.get(clave)
+        if datos is None or datos.version != version:
+            datos = _construir(ruta_customers, ruta_reviews, version, compacto)
+            _cache[clave] = datos
+
+    return datos
+
+
+# FILTRO POR FECHAS
+
+def rango_filas(df, desde, hasta, columna=COLUMNA_FECHA):
+    # Posiciones [inicio, fin) de las compras entre los días desde y hasta (incluidos).
+    # Búsqueda binaria sobre los int64 del timestamp: df debe estar ordenado por columna.
+    valores = df[columna].to_numpy()
+    marcas = valores.view('i8')
+
+    limites = np.array(
+        [np.datetime64(pd.Timestamp(desde)), np.datetime64(pd.Timestamp(hasta) + pd.Timedelta(days=1))]
+    ).astype(valores.dtype).view('i8')
+
+    inicio, fin = np.searchsorted(marcas, limites, side='left')
+    return int(inicio), int(fin)
+
+
+def limites_fechas(df, columna=COLUMNA_FECHA):
+    # Primer y último día con fecha. df ordenado por columna con los NaT al
+    # principio (clientes sin pedido): como enteros, NaT es el mínimo de int64
+    marcas = df[columna].to_numpy().view('i8')
+    primera = int(np.searchsorted(marcas, np.iinfo(np.int64).min, side='right'))
+    if primera == len(marcas):
+        return None, None
+    return df[columna].iloc[primera].date(), df[columna].iloc[-1].date()
+
+
+def filtrar_fechas(df, desde, hasta, columna=COLUMNA_FECHA):
+    # Devuelve un slice posicional (sin copia) en lugar de una máscara booleana
+    inicio, fin = rango_filas(df, desde, hasta, columna)
+    return df.iloc[inicio:fin]
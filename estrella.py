@@ -0,0 +1,253 @@
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import etl
+from construir_dataset import escribir
+from datos import firma_fuentes, rango_filas
+
+
+# ESQUEMA EN ESTRELLA
+#
+# customers.csv solo tiene el pedido y el cliente: no sabe qué vendedor envió
+# cada artículo, así que el diagnóstico de calcular_retrasos solo puede
+# suponer "fallo del proveedor" a partir de las tasas por ciudad. Aquí los
+# CSV de Olist se guardan como un esquema en estrella:
+#
+#   hechos_pedidos   un pedido por fila, ordenados por fecha de compra
+#   hechos_items     un artículo por fila (pedido, producto, vendedor, shipping_limit_date)
+#   dim_cliente, dim_vendedor, dim_producto, dim_geografia
+#
+# Todas las claves son enteros int32 que coinciden con la posición de la fila
+# en su tabla (id_pedido = fila de hechos_pedidos, etc.): unir es indexar un
+# array, sin merge sobre los identificadores hex de 32 caracteres, que solo
+# quedan como columna descriptiva en su propia tabla. Como id_pedido sigue el
+# orden de compra, un rango de fechas es un bloque contiguo de pedidos y de
+# artículos.
+#
+#   python estrella.py --origen resources --destino streamlit/estrella
+
+RUTA_ESTRELLA = "streamlit/estrella"
+
+TABLAS = ['hechos_pedidos', 'hechos_items', 'dim_cliente', 'dim_vendedor', 'dim_producto', 'dim_geografia']
+
+FECHAS_PEDIDO = [
+    'order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+    'order_delivered_customer_date', 'order_estimated_delivery_date',
+]
+
+
+@dataclass
+class Estrella:
+    hechos_pedidos: pd.DataFrame
+    hechos_items: pd.DataFrame
+    dim_cliente: pd.DataFrame
+    dim_vendedor: pd.DataFrame
+    dim_producto: pd.DataFrame
+    dim_geografia: pd.DataFrame
+    version: tuple = ()
+    tiempos: dict = field(default_factory=dict)
+
+
+def claves(valores, referencia):
+    # Posición de cada valor en referencia como int32; -1 si no está
+    return pd.Index(referencia).get_indexer(valores).astype('int32')
+
+
+def _secuencia(n):
+    return np.arange(n, dtype='int32')
+
+
+def construir_estrella(tablas):
+    # tablas: lo que devuelve etl.ejecutar
+    geografia = tablas['geolocation'][['zip_code_prefix', 'city', 'state']].reset_index(drop=True)
+    dim_geografia = geografia.assign(
+        id_geografia=_secuencia(len(geografia)),
+        city=geografia['city'].astype('category'),
+        state=geografia['state'].astype('category'),
+    )[['id_geografia', 'zip_code_prefix', 'city', 'state']]
+
+    customer = tablas['customer'].reset_index(drop=True)
+    dim_cliente = pd.DataFrame({
+        'id_cliente': _secuencia(len(customer)),
+        'customer_id': customer['id_customer_order'],
+        # El usuario (customer_unique_id) también como entero: varios clientes por usuario
+        'id_usuario': pd.factorize(customer['id_user'])[0].astype('int32'),
+        'id_geografia': claves(customer['zip_code_prefix'], geografia['zip_code_prefix']),
+    })
+
+    sellers = tablas['sellers'].reset_index(drop=True)
+    dim_vendedor = pd.DataFrame({
+        'id_vendedor': _secuencia(len(sellers)),
+        'seller_id': sellers['id_seller'],
+        'id_geografia': claves(sellers['zip_code_prefix'], geografia['zip_code_prefix']),
+    })
+
+    # El outer merge de traducir_productos deja filas de categorías sin producto
+    products = tablas['products'].dropna(subset=['id_product']).reset_index(drop=True)
+    dim_producto = pd.DataFrame({
+        'id_producto': _secuencia(len(products)),
+        'product_id': products['id_product'],
+        'category': products['category_en'].astype('category'),
+        'weight_g': products['weight_g'],
+        'lengh_cm': products['lengh_cm'],
+        'heigh_cm': products['heigh_cm'],
+        'width_cm': products['width_cm'],
+    })
+
+    orders = tablas['orders'].sort_values('order_purchase_timestamp', kind='stable').reset_index(drop=True)
+    hechos_pedidos = pd.DataFrame({
+        'id_pedido': _secuencia(len(orders)),
+        'order_id': orders['order_id'],
+        'id_cliente': claves(orders['customer_id'], customer['id_customer_order']),
+        'order_status': orders['order_status'].astype('category'),
+        **{columna: orders[columna] for columna in FECHAS_PEDIDO},
+    })
+
+    items = tablas['order_items']
+    hechos_items = pd.DataFrame({
+        'id_pedido': claves(items['order_id'], orders['order_id']),
+        'order_item_id': items['order_item_id'],
+        'id_producto': claves(items['product_id'], products['id_product']),
+        'id_vendedor': claves(items['seller_id'], sellers['id_seller']),
+        'shipping_limit_date': items['shipping_limit_date'],
+        'price': items['price'],
+        'freight_value': items['freight_value'],
+    })
+    # Mismo orden que hechos_pedidos: los artículos de un rango de fechas son contiguos
+    hechos_items = hechos_items[hechos_items['id_pedido'] >= 0]
+    hechos_items = hechos_items.sort_values(['id_pedido', 'order_item_id'], kind='stable').reset_index(drop=True)
+
+    return Estrella(hechos_pedidos, hechos_items, dim_cliente, dim_vendedor, dim_producto, dim_geografia)
+
+
+def rutas_estrella(ruta=RUTA_ESTRELLA):
+    return [os.path.join(ruta, f"{tabla}.parquet") for tabla in TABLAS]
+
+
+def escribir_estrella(estrella, destino=RUTA_ESTRELLA):
+    os.makedirs(destino, exist_ok=True)
+    for tabla, ruta in zip(TABLAS, rutas_estrella(destino)):
+        escribir(getattr(estrella, tabla), ruta)
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def cargar_estrella(ruta=RUTA_ESTRELLA):
+    # Una copia por proceso, como cargar_datos; se relee si cambia algún fichero
+    version = firma_fuentes(rutas_estrella(ruta))
+
+    estrella = _cache.get(ruta)
+    if estrella is not None and estrella.version == version:
+        return estrella
+
+    with _lock:
+        estrella = _cache.get(ruta)
+        if estrella is None or estrella.version != version:
+            inicio = time.perf_counter()
+            estrella = Estrella(**{tabla: pd.read_parquet(fichero) for tabla, fichero in zip(TABLAS, rutas_estrella(ruta))})
+            estrella.version = version
+            estrella.tiempos['lectura'] = time.perf_counter() - inicio
+            _cache[ruta] = estrella
+
+    return estrella
+
+
+def existe_estrella(ruta=RUTA_ESTRELLA):
+    return all(os.path.exists(fichero) for fichero in rutas_estrella(ruta))
+
+
+# RETRASOS POR VENDEDOR
+
+def _dias(diferencia):
+    return diferencia / np.timedelta64(1, 'D')
+
+
+def retrasos_vendedor(estrella, desde, hasta):
+    # Pedidos comprados entre desde y hasta: bloque contiguo de id_pedido y de artículos
+    pedidos = estrella.hechos_pedidos
+    inicio, fin = rango_filas(pedidos, desde, hasta)
+
+    items = estrella.hechos_items
+    primero, ultimo = np.searchsorted(items['id_pedido'].to_numpy(), [inicio, fin])
+    items = items.iloc[primero:ultimo]
+
+    # Columnas del pedido de cada artículo: indexación por id_pedido, sin merge
+    posiciones = items['id_pedido'].to_numpy()
+    recogida = pedidos['order_delivered_carrier_date'].to_numpy()[posiciones]
+    entrega = pedidos['order_delivered_customer_date'].to_numpy()[posiciones]
+    estimada = pedidos['order_estimated_delivery_date'].to_numpy()[posiciones]
+    entregado = (pedidos['order_status'] == 'delivered').to_numpy()[posiciones]
+
+    # Vendedor -> transportista: entrega al transportista después de shipping_limit_date
+    retraso_envio = _dias(recogida - items['shipping_limit_date'].to_numpy())
+    envio_tarde = retraso_envio > 0
+    # Transportista -> cliente: entregado después de la fecha estimada
+    retraso_entrega = _dias(entrega - estimada)
+    entrega_tarde = entregado & (retraso_entrega > 0)
+
+    tabla = pd.DataFrame({
+        'id_vendedor': items['id_vendedor'].to_numpy(),
+        'items': 1,
+        'con_envio': ~np.isnat(recogida),
+        'envio_tarde': envio_tarde,
+        'dias_envio_tarde': np.where(envio_tarde, retraso_envio, 0),
+        'entregado': entregado,
+        'entrega_tarde': entrega_tarde,
+        'dias_entrega_tarde': np.where(entrega_tarde, retraso_entrega, 0),
+        # Llegó tarde al cliente y el vendedor ya lo había enviado tarde
+        'tarde_por_vendedor': entrega_tarde & envio_tarde,
+    })
+    suma = tabla.groupby('id_vendedor').sum()
+
+    def porcentaje(parte, total):
+        return (100 * suma[parte] / suma[total].where(suma[total] > 0)).round(2)
+
+    def media(dias, casos):
+        # Sin casos tarde la media de días es 0, como en calcular_retrasos
+        return (suma[dias] / suma[casos].where(suma[casos] > 0)).fillna(0).round(2)
+
+    vendedores = estrella.dim_vendedor.iloc[suma.index.to_numpy()]
+    geografia = estrella.dim_geografia.iloc[vendedores['id_geografia'].clip(lower=0).to_numpy()]
+    sin_geografia = (vendedores['id_geografia'] < 0).to_numpy()
+
+    resultado = pd.DataFrame({
+        'Vendedor': vendedores['seller_id'].to_numpy(),
+        'Ciudad': geografia['city'].astype(object).mask(sin_geografia).to_numpy(),
+        'Estado': geografia['state'].astype(object).mask(sin_geografia).to_numpy(),
+        'Artículos': suma['items'].to_numpy(),
+        'Envío tarde %': porcentaje('envio_tarde', 'con_envio').to_numpy(),
+        'Días envío tarde': media('dias_envio_tarde', 'envio_tarde').to_numpy(),
+        'Entrega tarde %': porcentaje('entrega_tarde', 'entregado').to_numpy(),
+        'Días entrega tarde': media('dias_entrega_tarde', 'entrega_tarde').to_numpy(),
+        'Tarde por vendedor %': porcentaje('tarde_por_vendedor', 'entrega_tarde').to_numpy(),
+    })
+
+    return resultado.sort_values(['Envío tarde %', 'Artículos'], ascending=False).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el esquema en estrella con claves enteras a partir de los CSV de Olist")
+    parser.add_argument("--origen", default="resources")
+    parser.add_argument("--destino", default=RUTA_ESTRELLA)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    tablas, _ = etl.ejecutar(args.origen, verbose=False)
+    estrella = construir_estrella(tablas)
+    escribir_estrella(estrella, args.destino)
+
+    for tabla, ruta in zip(TABLAS, rutas_estrella(args.destino)):
+        print(f"{tabla:<16} {len(getattr(estrella, tabla)):>8} filas  {os.path.getsize(ruta) / 1e6:6.1f} MB")
+    print(f"{'total':<16} {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
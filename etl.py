@@ -0,0 +1,430 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import construir_dataset
+from datos import COLUMNA_FECHA
+
+
+# ETL DE LOS CSV DE OLIST
+#
+# Mismo proceso que las celdas de EDA_Completo.ipynb que generan
+# streamlit/customers.csv, como módulo ejecutable fuera de Jupyter:
+#   - los ocho CSV se leen a la vez en un pool de hilos, con tipos explícitos y
+#     formato de fecha fijo (sin inferencia),
+#   - cada paso de limpieza es una etapa con nombre y se cronometra,
+#   - la salida es el customers.csv que espera dashboard.py y, opcionalmente,
+#     el Parquet de construir_dataset.py.
+#
+#   python etl.py
+#   python etl.py --origen resources --destino streamlit --parquet
+#   python etl.py --streaming --memoria-max 256
+
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+FUENTES = {
+    'sellers': {
+        'fichero': 'olist_sellers_dataset.csv',
+        'dtype': {'seller_id': str, 'seller_zip_code_prefix': 'int32', 'seller_city': str, 'seller_state': str},
+    },
+    'products': {
+        'fichero': 'olist_products_dataset.csv',
+        'dtype': {
+            'product_id': str, 'product_category_name': str,
+            'product_name_lenght': 'float64', 'product_description_lenght': 'float64', 'product_photos_qty': 'float64',
+            'product_weight_g': 'float64', 'product_length_cm': 'float64',
+            'product_height_cm': 'float64', 'product_width_cm': 'float64',
+        },
+    },
+    'categories': {
+        'fichero': 'olist_product_category_name_translation.csv',
+        'dtype': {'product_category_name': str, 'product_category_name_english': str},
+    },
+    'orders': {
+        'fichero': 'olist_orders_dataset.csv',
+        'dtype': {'order_id': str, 'customer_id': str, 'order_status': 'category'},
+        'fechas': [
+            'order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+            'order_delivered_customer_date', 'order_estimated_delivery_date',
+        ],
+    },
+    'reviews': {
+        'fichero': 'olist_order_reviews_dataset.csv',
+        'dtype': {
+            'review_id': str, 'order_id': str, 'review_score': 'int8',
+            'review_comment_title': str, 'review_comment_message': str,
+        },
+        'fechas': ['review_creation_date', 'review_answer_timestamp'],
+    },
+    'payments': {
+        'fichero': 'olist_order_payments_dataset.csv',
+        'dtype': {
+            'order_id': str, 'payment_sequential': 'int16', 'payment_type': str,
+            'payment_installments': 'int16', 'payment_value': 'float64',
+        },
+    },
+    'order_items': {
+        'fichero': 'olist_order_items_dataset.csv',
+        'dtype': {
+            'order_id': str, 'order_item_id': 'int16', 'product_id': str, 'seller_id': str,
+            'price': 'float64', 'freight_value': 'float64',
+        },
+        'fechas': ['shipping_limit_date'],
+    },
+    'customers': {
+        'fichero': 'olist_customers_dataset.csv',
+        'dtype': {
+            'customer_id': str, 'customer_unique_id': str, 'customer_zip_code_prefix': 'int32',
+            'customer_city': str, 'customer_state': str,
+        },
+    },
+}
+
+
+class Etapas:
+    # Ejecuta funciones con nombre y guarda cuánto tarda cada una
+
+    def __init__(self, verbose=True):
+        self.tiempos = {}
+        self.verbose = verbose
+
+    def __call__(self, nombre, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        self.tiempos[nombre] = time.perf_counter() - inicio
+        if self.verbose:
+            print(f"{nombre:<24} {self.tiempos[nombre] * 1000:9.1f} ms")
+        return resultado
+
+
+def leer_fuente(origen, nombre, columnas=None, **kwargs):
+    fuente = FUENTES[nombre]
+    fechas = [columna for columna in fuente.get('fechas', []) if columnas is None or columna in columnas]
+    return pd.read_csv(
+        os.path.join(origen, fuente['fichero']),
+        usecols=columnas,
+        dtype=fuente['dtype'],
+        parse_dates=fechas,
+        date_format={columna: FORMATO_FECHA for columna in fechas},
+        **kwargs,
+    )
+
+
+def leer_fuentes(origen, nombres=None, hilos=None):
+    # pandas libera el GIL en el parser de C: los ficheros se leen en paralelo
+    nombres = list(nombres or FUENTES)
+    with ThreadPoolExecutor(max_workers=hilos or len(nombres)) as pool:
+        futuros = {nombre: pool.submit(leer_fuente, origen, nombre) for nombre in nombres}
+        return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+
+# ETAPAS DE LIMPIEZA
+
+def limpiar_clientes(df_customer):
+    df_customer = df_customer.copy()
+    # id_customer se genera al realizar una order, mientras que id_unique identifica al usuario
+    df_customer.columns = ['id_customer_order', 'id_user', 'zip_code_prefix', 'city', 'state']
+    return df_customer
+
+
+def limpiar_vendedores(df_sellers):
+    df_sellers = df_sellers.copy()
+    df_sellers.columns = ['id_seller', 'zip_code_prefix', 'city', 'state']
+    return df_sellers
+
+
+def construir_geolocalizacion(df_customer, df_sellers):
+    columns = ['zip_code_prefix', 'city', 'state']
+
+    df_geolocation = pd.concat([df_customer[columns], df_sellers[columns]])
+    df_geolocation = df_geolocation.drop_duplicates(subset='zip_code_prefix')
+
+    df_geolocation['city'] = (
+        df_geolocation['city'].str.split(r' -|/').str[0].str.strip().str.title()
+    )
+
+    return df_geolocation
+
+
+def traducir_productos(df_products, df_categories):
+    df_categories = df_categories.copy()
+    df_categories.columns = ['category_pt', 'category_en']
+
+    df_products = df_products[['product_id', 'product_category_name', 'product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']].copy()
+    df_products.columns = ['id_product', 'category', 'weight_g', 'lengh_cm', 'heigh_cm', 'width_cm']
+
+    # Categorías que no vienen en el fichero de traducción
+    nueva_filas = pd.DataFrame({
+        'category_pt': ['pc_gamer', 'portateis_cozinha_e_preparadores_de_alimentos'],
+        'category_en': ['pc_gamer', 'kitchenware_and_food_preparars']
+    })
+    df_categories = pd.concat([df_categories, nueva_filas], ignore_index=True)
+
+    df_products = pd.merge(
+        df_products,
+        df_categories[['category_pt', 'category_en']],
+        left_on='category',
+        right_on='category_pt',
+        how='outer'
+    )
+
+    return df_products.drop(columns=['category'])
+
+
+def imputar_productos(df_products):
+    df_products = df_products.copy()
+
+    df_products['category_en'] = df_products['category_en'].fillna('unknow')
+    df_products['category_pt'] = df_products['category_pt'].fillna('unknow')
+
+    for columna in ['weight_g', 'lengh_cm', 'heigh_cm', 'width_cm']:
+        df_products[columna] = df_products[columna].fillna(df_products[columna].mean())
+
+    return df_products
+
+
+def limpiar_reviews(df_reviews):
+    df_reviews = df_reviews.copy()
+    df_reviews['review_comment_title'] = df_reviews['review_comment_title'].fillna('No comment')
+    df_reviews['review_comment_message'] = df_reviews['review_comment_message'].fillna('No comment')
+    return df_reviews
+
+
+def reetiquetar_pagos(df_payments):
+    df_payments = df_payments.copy()
+    df_payments['payment_type'] = df_payments['payment_type'].replace({'boleto': 'ticket'})
+    return df_payments
+
+
+COLUMNAS_PEDIDO = ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp', 'order_delivered_customer_date', 'order_estimated_delivery_date']
+
+
+def construir_dimension(df_customer, df_geolocation):
+    # Una fila por id_customer_order con su ciudad/estado normalizados
+    return pd.merge(
+        df_customer.drop(columns=['city', 'state']),
+        df_geolocation,
+        on='zip_code_prefix',
+        how='left'
+    )
+
+
+def unir_pedidos(dimension, df_orders, how='left'):
+    customers = pd.merge(
+        dimension,
+        df_orders[COLUMNAS_PEDIDO],
+        left_on='id_customer_order',
+        right_on='customer_id',
+        how=how
+    )
+
+    return customers.drop(columns=['customer_id'])
+
+
+def construir_customers(df_customer, df_geolocation, df_orders):
+    return unir_pedidos(construir_dimension(df_customer, df_geolocation), df_orders)
+
+
+def ejecutar(origen='resources', hilos=None, verbose=True):
+    etapas = Etapas(verbose)
+
+    fuentes = etapas('lectura', leer_fuentes, origen, hilos=hilos)
+
+    df_customer = etapas('clientes', limpiar_clientes, fuentes['customers'])
+    df_sellers = etapas('vendedores', limpiar_vendedores, fuentes['sellers'])
+    df_geolocation = etapas('geolocalizacion', construir_geolocalizacion, df_customer, df_sellers)
+    df_products = etapas('traduccion_categorias', traducir_productos, fuentes['products'], fuentes['categories'])
+    df_products = etapas('imputacion_productos', imputar_productos, df_products)
+    df_reviews = etapas('reviews', limpiar_reviews, fuentes['reviews'])
+    df_payments = etapas('pagos', reetiquetar_pagos, fuentes['payments'])
+    customers = etapas('customers', construir_customers, df_customer, df_geolocation, fuentes['orders'])
+
+    tablas = {
+        'customers': customers,
+        'customer': df_customer.drop(columns=['city', 'state']),
+        'sellers': df_sellers.drop(columns=['city', 'state']),
+        'geolocation': df_geolocation,
+        'products': df_products,
+        'orders': fuentes['orders'],
+        'order_items': fuentes['order_items'],
+        'reviews': df_reviews,
+        'payments': df_payments,
+    }
+    return tablas, etapas.tiempos
+
+
+# MODO STREAMING
+#
+# Para exportaciones que no caben en memoria. Solo las dimensiones pequeñas
+# (clientes, vendedores, geolocalización) se cargan enteras; pedidos y reviews se
+# leen por bloques. Cada bloque de pedidos se une a la dimensión de clientes y se
+# añade al Parquet de salida como un row group más, así que el pico de memoria
+# depende del tamaño de bloque y no del tamaño del fichero. El tamaño de bloque
+# se calcula a partir del techo de memoria (--memoria-max, en MB) y de lo que
+# ocupa una fila en una muestra del propio fichero.
+#
+# Los clientes sin ningún pedido se añaden al final con las columnas del pedido
+# vacías, igual que el merge left de construir_customers.
+
+MEMORIA_MAX_MB = 256
+
+# Un bloque llega a ocupar varias veces su tamaño mientras se une, se tipa y se
+# convierte a Arrow
+FACTOR_BLOQUE = 4
+FILAS_MUESTRA = 5000
+MIN_FILAS_BLOQUE = 1000
+
+
+def filas_por_bloque(origen, nombre, presupuesto, columnas=None):
+    muestra = leer_fuente(origen, nombre, columnas=columnas, nrows=FILAS_MUESTRA)
+    bytes_fila = muestra.memory_usage(deep=True).sum() / max(len(muestra), 1)
+    return max(MIN_FILAS_BLOQUE, int(presupuesto / (bytes_fila * FACTOR_BLOQUE)))
+
+
+class SalidaParquet:
+    # Añade DataFrames a un Parquet, uno por row group. Se escribe a un temporal
+    # que solo se renombra al destino si todo ha ido bien.
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.temporal = destino + '.tmp'
+        self.escritor = None
+        self.filas = 0
+        self.bloques = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if self.escritor is not None:
+            self.escritor.close()
+        if tipo is None and self.escritor is not None:
+            os.replace(self.temporal, self.destino)
+        elif os.path.exists(self.temporal):
+            os.remove(self.temporal)
+        return False
+
+    def escribir(self, df):
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+
+        if self.escritor is None:
+            # Una columna toda nula en el primer bloque no fija el tipo: se asume texto
+            esquema = pa.schema(
+                [campo.with_type(pa.string()) if pa.types.is_null(campo.type) else campo for campo in tabla.schema],
+                metadata=tabla.schema.metadata,
+            )
+            self.escritor = pq.ParquetWriter(self.temporal, esquema, compression='zstd')
+
+        self.escritor.write_table(tabla.cast(self.escritor.schema))
+        self.filas += len(df)
+        self.bloques += 1
+
+
+def escribir_customers_streaming(origen, dimension, destino, presupuesto):
+    filas_bloque = filas_por_bloque(origen, 'orders', presupuesto, COLUMNAS_PEDIDO)
+
+    indice = pd.Index(dimension['id_customer_order'])
+    con_pedido = np.zeros(len(dimension), dtype=bool)
+
+    with SalidaParquet(destino) as salida:
+        for bloque in leer_fuente(origen, 'orders', columnas=COLUMNAS_PEDIDO, chunksize=filas_bloque):
+            posiciones = indice.get_indexer(bloque['customer_id'])
+            con_pedido[posiciones[posiciones >= 0]] = True
+
+            customers = unir_pedidos(dimension, bloque, how='inner')
+            salida.escribir(construir_dataset.tipar_customers(customers, categoricas=False))
+
+        # Clientes sin pedido: merge contra un bloque vacío con los mismos tipos
+        sin_pedido = dimension[~con_pedido]
+        if len(sin_pedido) or salida.escritor is None:
+            vacio = leer_fuente(origen, 'orders', columnas=COLUMNAS_PEDIDO, nrows=0)
+            customers = unir_pedidos(sin_pedido, vacio)
+            salida.escribir(construir_dataset.tipar_customers(customers, categoricas=False))
+
+    return salida.filas, salida.bloques, filas_bloque
+
+
+def escribir_reviews_streaming(origen, destino, presupuesto):
+    filas_bloque = filas_por_bloque(origen, 'reviews', presupuesto)
+
+    with SalidaParquet(destino) as salida:
+        for bloque in leer_fuente(origen, 'reviews', chunksize=filas_bloque):
+            salida.escribir(limpiar_reviews(bloque))
+
+    return salida.filas, salida.bloques, filas_bloque
+
+
+def ejecutar_streaming(origen='resources', destino='streamlit', memoria_max=MEMORIA_MAX_MB, verbose=True):
+    etapas = Etapas(verbose)
+
+    fuentes = etapas('lectura_dimensiones', leer_fuentes, origen, ['customers', 'sellers'])
+    df_customer = etapas('clientes', limpiar_clientes, fuentes.pop('customers'))
+    df_sellers = etapas('vendedores', limpiar_vendedores, fuentes.pop('sellers'))
+    df_geolocation = etapas('geolocalizacion', construir_geolocalizacion, df_customer, df_sellers)
+    dimension = etapas('dimension_clientes', construir_dimension, df_customer, df_geolocation)
+    del df_customer, df_sellers, df_geolocation
+
+    # Lo que deja la dimensión dentro del techo es lo que pueden ocupar los bloques
+    memoria_dimension = dimension.memory_usage(deep=True).sum()
+    presupuesto = memoria_max * 1e6 - memoria_dimension
+    if presupuesto <= 0:
+        raise ValueError(
+            f"memoria_max={memoria_max} MB no alcanza para la dimensión de clientes "
+            f"({memoria_dimension / 1e6:.1f} MB)"
+        )
+
+    os.makedirs(destino, exist_ok=True)
+    salidas = {
+        'customers': etapas('customers', escribir_customers_streaming,
+                            origen, dimension, os.path.join(destino, 'customers.parquet'), presupuesto),
+        'reviews': etapas('reviews', escribir_reviews_streaming,
+                          origen, os.path.join(destino, 'reviews.parquet'), presupuesto),
+    }
+
+    if verbose:
+        for nombre, (filas, bloques, filas_bloque) in salidas.items():
+            print(f"{nombre:<24} {filas} filas en {bloques} bloques de hasta {filas_bloque}")
+
+    return salidas, etapas.tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera streamlit/customers.csv a partir de los CSV de Olist")
+    parser.add_argument("--origen", default="resources")
+    parser.add_argument("--destino", default="streamlit")
+    parser.add_argument("--hilos", type=int, default=None)
+    parser.add_argument("--parquet", action="store_true", help="escribe también customers.parquet")
+    parser.add_argument("--streaming", action="store_true",
+                        help="lee pedidos y reviews por bloques y escribe customers.parquet y reviews.parquet")
+    parser.add_argument("--memoria-max", type=float, default=MEMORIA_MAX_MB, help="techo de memoria en MB (--streaming)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.streaming:
+        salidas, tiempos = ejecutar_streaming(args.origen, args.destino, args.memoria_max)
+        print(f"{'total':<24} {(time.perf_counter() - inicio) * 1000:9.1f} ms ({salidas['customers'][0]} filas)")
+        return
+
+    tablas, tiempos = ejecutar(args.origen, args.hilos)
+
+    os.makedirs(args.destino, exist_ok=True)
+    etapas = Etapas()
+    customers = tablas['customers']
+    etapas('escritura_csv', customers.to_csv, os.path.join(args.destino, 'customers.csv'), date_format=FORMATO_FECHA)
+
+    if args.parquet:
+        ruta = os.path.join(args.destino, 'customers.parquet')
+        etapas('escritura_parquet', construir_dataset.escribir, construir_dataset.tipar_customers(customers), ruta,
+               orden=COLUMNA_FECHA)
+
+    print(f"{'total':<24} {(time.perf_counter() - inicio) * 1000:9.1f} ms ({len(customers)} filas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import io
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib.figure import Figure
+
+
+# GEOMETRÍA DE LOS ESTADOS DE BRASIL
+#
+# El GeoJSON se lee una sola vez por proceso, se simplifica a una tolerancia
+# suficiente para pantalla y se guarda en GeoParquet al lado del original para
+# los siguientes arranques (br_states.<tolerancia>.parquet, fuera de git). El mapa base (polígonos, bordes, barra de color) se
+# dibuja una vez; en cada render solo cambian los colores de relleno.
+
+RUTA_GEOJSON = 'br_states.geojson'
+
+# En grados: ~1 km, por debajo de lo que se distingue en una figura de 10x8 pulgadas
+TOLERANCIA = 0.01
+
+
+class MapaBase:
+
+    def __init__(self, estados):
+        self.estados = estados
+        # Índice abreviatura -> fila, para unir los valores sin merge
+        self.indice = pd.Index(estados['abbrev_state'])
+
+        self.figura = Figure(figsize=(10, 8))
+        ax = self.figura.subplots()
+        estados.plot(linewidth=0.8, edgecolor="black", ax=ax)
+        ax.set_title("Mapa coroplético - Pedidos")
+        ax.axis('off')
+
+        # Según la versión, geopandas dibuja un parche por fila o uno por polígono
+        # de cada multipolígono: en el segundo caso los valores se repiten
+        self.coleccion = ax.collections[0]
+        self.partes = np.ones(len(estados), dtype=np.int64)
+        if len(self.coleccion.get_paths()) != len(estados):
+            self.partes = shapely.get_num_geometries(estados.geometry.to_numpy())
+
+        self.coleccion.set_cmap("viridis")
+        self.coleccion.set_array(np.zeros(int(self.partes.sum())))
+        self.figura.colorbar(self.coleccion, ax=ax)
+
+        self._lock = threading.Lock()
+
+    def valores(self, df_pedidos):
+        valores = np.zeros(len(self.indice))
+        posiciones = self.indice.get_indexer(df_pedidos['Estado'])
+        encontrados = posiciones >= 0
+        valores[posiciones[encontrados]] = df_pedidos['Total clientes'].to_numpy()[encontrados]
+        return valores
+
+    def png(self, df_pedidos, **opciones):
+        valores = self.valores(df_pedidos)
+
+        # La figura es compartida: se colorea y codifica de una en una
+        with self._lock:
+            self.coleccion.set_array(np.repeat(valores, self.partes))
+            self.coleccion.set_clim(valores.min(), valores.max())
+            buffer = io.BytesIO()
+            self.figura.savefig(buffer, **opciones)
+
+        return buffer.getvalue()
+
+
+def leer_estados(ruta=RUTA_GEOJSON, tolerancia=TOLERANCIA):
+    binario = os.path.splitext(ruta)[0] + f'.{tolerancia:g}.parquet'
+
+    if os.path.exists(binario) and os.path.getmtime(binario) >= os.path.getmtime(ruta):
+        return gpd.read_parquet(binario)
+
+    estados = gpd.read_file(ruta)[['abbrev_state', 'geometry']]
+    if tolerancia:
+        estados['geometry'] = estados.geometry.simplify(tolerancia, preserve_topology=True)
+
+    try:
+        estados.to_parquet(binario)
+    except OSError:
+        # Sin permiso de escritura se sigue con la versión en memoria
+        pass
+
+    return estados
+
+
+_lock = threading.Lock()
+_mapas = {}
+
+
+def obtener_mapa(ruta=RUTA_GEOJSON, tolerancia=TOLERANCIA):
+    info = os.stat(ruta)
+    clave = (ruta, info.st_mtime_ns, info.st_size, tolerancia)
+
+    mapa = _mapas.get(clave)
+    if mapa is not None:
+        return mapa
+
+    with _lock:
+        mapa = _mapas.get(clave)
+        if mapa is None:
+            mapa = MapaBase(leer_estados(ruta, tolerancia))
+            _mapas.clear()
+            _mapas[clave] = mapa
+
+    return mapa
@@ -0,0 +1,560 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+import matplotlib.cm as cm
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from cache import CacheLRU
+from geometria import RUTA_GEOJSON, obtener_mapa
+from instrumentacion import etapa
+
+
+# FUNCIONES GRÁFICOS
+#
+# Cada función construye y devuelve la figura; el título y la salida a
+# Streamlit los pone dashboard.py a través de renderizar().
+
+
+TITULOS = {
+    'grafico1': "Top 10 Ciudades por Número de Clientes",
+    'grafico2': "Top 10 Ciudades por Total de Pedidos",
+    'grafico3': "Comparativa: Usuarios únicos vs Total de pedidos por ciudad (Top 10)",
+    'grafico4': "Top 10 Ciudades por Porcentaje de Pedidos (%)",
+    'grafico5': "Participación de Pedidos por Ciudad (%) – Top 10",
+    'grafico6': "Días Promedio de Retraso por Ciudad (Top 10)",
+    'grafico7': "Relación: % Pedidos Tarde vs Días Promedio de Retraso",
+    'grafico8': "Comparativa: Días promedio de retraso vs % de pedidos entregados tarde (Top 10 ciudades)",
+    'grafico9': "Puntaje promedio de reviews por estado (Pedidos entregados a tiempo)",
+    'grafico10': "Reviews vs Puntaje promedio por estado (Pedidos entregados a tiempo)",
+    'grafico11': "Reviews por estado",
+}
+
+
+def grafico1(df_ciudades):
+    
+    top_users = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
+
+        
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+        
+    bars = ax.bar(top_users['Ciudad'], top_users['Total clientes'], color='#004E64')
+        
+    ax.set_xlabel('Ciudad')
+    ax.set_ylabel('Cantidad de Usuarios Únicos')
+        
+
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+        
+
+    for i, v in enumerate(top_users['Total clientes']):
+        ax.text(i, v + (v * 0.02), f"{v:,}", ha='center', fontsize=10)
+        
+    plt.tight_layout()
+        
+
+    return fig
+
+
+
+def grafico2(df_ciudades):
+       
+    top_orders = df_ciudades.sort_values('Pedidos totales', ascending=False).head(10)
+    
+    
+    fig, ax = plt.subplots(figsize=(12, 6))
+    
+    bars = ax.bar(top_orders['Ciudad'], top_orders['Pedidos totales'], color="#4ca5b6")
+    
+    ax.set_xlabel('Ciudad')
+    ax.set_ylabel('Total de Pedidos')
+    
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    
+    for i, v in enumerate(top_orders['Pedidos totales']):
+        ax.text(i, v + (v * 0.02), f"{v:,}", ha='center', fontsize=10)
+    
+    plt.tight_layout()
+    return fig
+
+
+
+
+def grafico3(df_ciudades):
+    color_users = "#4ca5b6"   
+    color_orders = '#1d3557'  
+
+    top_combined = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
+    
+
+
+    fig, ax = plt.subplots(figsize=(14, 6))
+    
+
+    ax.plot(
+        top_combined['Ciudad'],
+        top_combined['Total clientes'],
+        marker='o',
+        color=color_users,
+        linewidth=2,
+        label='Usuarios únicos'
+    )
+    
+
+    ax.plot(
+        top_combined['Ciudad'],
+        top_combined['Pedidos totales'],
+        marker='s',
+        color=color_orders,
+        linewidth=2,
+        label='Total pedidos'
+    )
+    
+
+    ax.set_xlabel('Ciudad')
+    ax.set_ylabel('Cantidad')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    
+
+    ax.legend()
+    ax.grid(True, linestyle='--', alpha=0.5)
+    
+    plt.tight_layout()
+    
+
+    return fig
+
+
+def grafico4(df_ciudades):
+    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
+
+    fig, ax = plt.subplots(figsize=(14, 9))
+    bars = ax.bar(
+        top_pct['Ciudad'],
+        top_pct['Porcentaje %'],
+        color='#52b788',     
+    )
+    
+    ax.set_xlabel('Ciudad', fontsize=12)
+    ax.set_ylabel('Porcentaje (%)', fontsize=12)
+    
+
+    plt.setp(ax.get_xticklabels(), rotation=40, ha='right')
+    
+
+    for i, v in enumerate(top_pct['Porcentaje %']):
+        ax.text(i, v + 0.5, f"{v}%", ha='center', fontsize=10)
+    
+    plt.tight_layout()
+    
+
+    return fig
+
+
+def grafico5(df_ciudades):
+    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
+    
+
+    colors = [
+        '#1d3557',  
+        '#457b9d',
+        '#6096ba',
+        '#a8dadc',
+        '#00b4d8',
+        '#48cae4',
+        '#90e0ef',
+        '#52b788',  
+        '#2d6a4f',
+        '#95d5b2'   
+    ]
+    
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    
+    ax.pie(
+        top_pct['Porcentaje %'],
+        labels=top_pct['Ciudad'],
+        autopct='%1.1f%%',
+        startangle=140,
+        colors=colors
+    )
+    
+    plt.tight_layout()
+
+    return fig
+
+
+#GRAFICOS PAGINA 3
+def grafico6(pedidos_tarde):
+    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
+    
+    cities = top10['Ciudad']
+    days_late = top10['Dias tarde']
+    
+    
+
+    fig, ax = plt.subplots(figsize=(12,6))
+    
+
+    bars = ax.bar(cities, days_late, color='#1d3557')
+    
+    ax.set_xlabel('Ciudad')
+    ax.set_ylabel('Días')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    
+
+    for i, v in enumerate(days_late):
+        ax.text(i, v + 0.1, f"{v:.1f}", ha='center', fontsize=10)
+    
+    plt.tight_layout()
+    
+
+    return fig
+
+def grafico7(pedidos_tarde):
+    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False)
+ 
+    x = top10['Pedidos tarde %']
+    y = top10['Dias tarde']
+    cities = top10['Ciudad']
+    
+
+    coef = np.polyfit(x, y, 1)
+    y_fit = np.polyval(coef, x)
+    
+    
+
+    fig, ax = plt.subplots(figsize=(10,6))
+    
+
+    ax.scatter(x, y, color='#52b788', s=100, alpha=0.8, label='Ciudades')
+    
+
+    ax.plot(x, y_fit, color='#1d3557', linestyle='--', linewidth=2, label='Tendencia')
+    
+
+    ax.set_xlabel('% Pedidos entregados tarde')
+    ax.set_ylabel('Días promedio de retraso')
+    ax.grid(True, linestyle='--', alpha=0.5)
+    ax.legend()
+    
+    plt.tight_layout()
+    return fig
+
+
+def correlacion_retrasos(pedidos_tarde):
+    return pedidos_tarde['Pedidos tarde %'].corr(pedidos_tarde['Dias tarde'])
+
+
+def grafico8(pedidos_tarde):
+    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
+    cities = top10['Ciudad']
+    
+    x = np.arange(len(cities))
+    width = 0.4
+    
+    
+
+    fig, ax1 = plt.subplots(figsize=(14,6))
+    
+
+    color_days_late = '#457b9d' 
+    color_late_pct = '#2a9d8f'   
+    
+
+    bars1 = ax1.bar(x - width/2, top10['Dias tarde'], width, label='Días promedio de retraso', color=color_days_late)
+    ax1.set_ylabel('Días promedio de retraso', color=color_days_late)
+    ax1.tick_params(axis='y', labelcolor=color_days_late)
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(cities, rotation=45, ha='right')
+    ax1.grid(axis='y', linestyle='--', alpha=0.5)
+
+    ax2 = ax1.twinx()
+    bars2 = ax2.bar(x + width/2, top10['Pedidos tarde %'], width, label='% Pedidos entregados tarde', color=color_late_pct)
+    ax2.set_ylabel('% Pedidos entregados tarde', color=color_late_pct)
+    ax2.tick_params(axis='y', labelcolor=color_late_pct)
+
+    handles1, labels1 = ax1.get_legend_handles_labels()
+    handles2, labels2 = ax2.get_legend_handles_labels()
+    ax1.legend(handles1 + handles2, labels1 + labels2, loc='upper left', bbox_to_anchor=(1.02, 1))
+    
+    plt.tight_layout()
+    
+
+    return fig
+
+#GRAFICOS PAGINA 4
+def grafico9(customers_review):
+    customers_review_sorted = customers_review.sort_values('Puntuacion', ascending=False)
+ 
+    
+
+    fig, ax = plt.subplots(figsize=(12,6))
+    
+
+    line_color = '#1d3557'  
+    fill_color = '#a8dadc' 
+    
+
+    ax.plot(
+        customers_review_sorted['Estado'],
+        customers_review_sorted['Puntuacion'],
+        marker='o',
+        linestyle='-',
+        color=line_color,
+        linewidth=2,
+        markersize=6,
+        label='Puntaje promedio'
+    )
+
+
+    ax.set_xlabel('Estado', fontsize=12)
+    ax.set_ylabel('Puntaje promedio', fontsize=12)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.legend()
+    
+    plt.tight_layout()
+    return fig
+
+
+
+def grafico10(customers_review):
+    x = customers_review['Reviews']
+    y = customers_review['Puntuacion']
+    states = customers_review['Estado']
+    
+
+    norm = (y - y.min()) / (y.max() - y.min())
+    colors = cm.winter(norm)
+    
+
+    fig, ax = plt.subplots(figsize=(10,6))
+    
+
+    ax.scatter(x, y, color=colors, s=100, alpha=0.8)
+    
+
+    ax.set_xlabel('Número de reviews', fontsize=12)
+    ax.set_ylabel('Puntaje promedio', fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.5)
+    
+    plt.tight_layout()
+    return fig
+
+
+
+
+
+
+def grafico11(customers_review):
+    customers_review_sorted = customers_review.sort_values('Puntuacion', ascending=False)
+    
+
+    heatmap_data = customers_review_sorted.pivot(
+        index='Estado',
+        columns='Reviews',
+        values='Puntuacion'
+    )
+    
+    fig, ax = plt.subplots(figsize=(10,8))
+    
+    sns.heatmap(
+        heatmap_data,
+        annot=True,
+        fmt=".2f",
+        cmap='YlGnBu',
+        cbar_kws={'label': 'Puntaje promedio'},
+        ax=ax
+    )
+    
+    ax.set_xlabel('Número de reviews')
+    ax.set_ylabel('Estado')
+    
+    plt.tight_layout()
+    
+    return fig
+
+
+
+def mapa(df_pedidos, geojson_path=RUTA_GEOJSON):
+    # Devuelve directamente el PNG: la figura base es compartida (ver geometria.py)
+    return obtener_mapa(geojson_path).png(df_pedidos, **OPCIONES_PNG)
+
+
+# CACHE DE RENDERIZADO
+#
+# Las imágenes PNG se guardan con la clave (gráfico, huella del contenido de la
+# entrada): si otra sesión pide el mismo gráfico con los mismos datos se sirve la
+# imagen ya codificada sin pasar por matplotlib.
+
+GRAFICOS = {
+    'grafico1': grafico1,
+    'grafico2': grafico2,
+    'grafico3': grafico3,
+    'grafico4': grafico4,
+    'grafico5': grafico5,
+    'grafico6': grafico6,
+    'grafico7': grafico7,
+    'grafico8': grafico8,
+    'grafico9': grafico9,
+    'grafico10': grafico10,
+    'grafico11': grafico11,
+    'mapa': mapa,
+}
+
+MAX_BYTES_RENDER = 64 * 1024 * 1024
+
+# Mismos parámetros que usa st.pyplot al codificar la figura
+OPCIONES_PNG = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+renders = CacheLRU(MAX_BYTES_RENDER)
+
+# pyplot guarda estado global (figura actual): dos hilos no pueden dibujar a la vez
+_lock_pyplot = threading.Lock()
+
+
+def huella(*entradas):
+    resumen = hashlib.blake2b(digest_size=16)
+    for entrada in entradas:
+        if isinstance(entrada, pd.DataFrame):
+            resumen.update(repr(list(entrada.columns)).encode())
+            resumen.update(pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes())
+        else:
+            resumen.update(repr(entrada).encode())
+    return resumen.hexdigest()
+
+
+def figura_a_png(fig):
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, **OPCIONES_PNG)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def renderizar(nombre, df, *args):
+    clave = (nombre, huella(df, *args))
+
+    imagen = renders.obtener(clave)
+    if imagen is None:
+        with etapa(f"render:{nombre}", df):
+            if nombre == 'mapa':
+                # El mapa no usa pyplot y tiene su propio lock (ver geometria.py)
+                imagen = GRAFICOS[nombre](df, *args)
+            else:
+                with _lock_pyplot:
+                    imagen = figura_a_png(GRAFICOS[nombre](df, *args))
+        renders.guardar(clave, imagen)
+
+    return imagen
+
+
+# RENDERIZADO EN PARALELO
+#
+# Los gráficos de una página se envían juntos a un pool de procesos con el
+# backend Agg: la página tarda lo que el gráfico más lento y no la suma de
+# todos. Los procesos se crean con spawn (el proceso de Streamlit tiene hilos)
+# la primera vez que se usan. Las imágenes pasan igualmente por la cache de
+# renders.
+#
+# spawn importa en cada proceso nuevo el módulo __main__ del padre, y dentro de
+# Streamlit __main__ es el propio dashboard.py. Por eso todos los procesos se
+# arrancan al crear el pool, con un __main__ vacío mientras tanto; el pool ya no
+# crea procesos después.
+
+_lock_pool = threading.Lock()
+_pool = None
+
+
+def _iniciar_proceso():
+    matplotlib.use('Agg')
+
+
+def _renderizar_en_proceso(nombre, df, args):
+    return figura_a_png(GRAFICOS[nombre](df, *args))
+
+
+def pool_procesos(procesos=None):
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            procesos = procesos or os.cpu_count()
+            pool = ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_proceso,
+            )
+
+            principal = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                # Cada submit sin proceso libre arranca uno nuevo, hasta llegar a procesos
+                for _ in range(procesos):
+                    pool.submit(int)
+            finally:
+                sys.modules['__main__'] = principal
+
+            _pool = pool
+    return _pool
+
+
+def _descartar_pool(pool):
+    # Un pool con un proceso muerto ya no acepta trabajo: el siguiente
+    # pool_procesos arranca otro
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def renderizar_en_paralelo(peticiones, procesos=None):
+    # peticiones: lista de (nombre, df, args). Devuelve (posición, png) según
+    # van terminando, primero los que ya estaban en cache.
+    listas = []
+    pendientes = {}
+
+    for posicion, (nombre, df, args) in enumerate(peticiones):
+        clave = (nombre, huella(df, *args))
+        imagen = renders.obtener(clave)
+        if imagen is not None:
+            listas.append((posicion, imagen))
+        elif nombre == 'mapa':
+            listas.append((posicion, renderizar(nombre, df, *args)))
+        else:
+            pool = pool_procesos(procesos)
+            try:
+                futuro = pool.submit(_renderizar_en_proceso, nombre, df, args)
+            except (BrokenProcessPool, RuntimeError):
+                # Roto o ya cerrado por otra sesión: este gráfico se dibuja aquí
+                _descartar_pool(pool)
+                listas.append((posicion, renderizar(nombre, df, *args)))
+                continue
+            pendientes[futuro] = (posicion, clave, nombre, df, args, pool)
+
+    yield from listas
+
+    for futuro in as_completed(pendientes):
+        posicion, clave, nombre, df, args, pool = pendientes[futuro]
+        try:
+            imagen = futuro.result()
+        except Exception as error:
+            if isinstance(error, BrokenProcessPool):
+                _descartar_pool(pool)
+            # Un proceso caído no deja la página sin gráfico: se dibuja aquí
+            yield posicion, renderizar(nombre, df, *args)
+            continue
+        renders.guardar(clave, imagen)
+        yield posicion, imagen
@@ -0,0 +1,314 @@
+import os
+
+import pandas as pd
+
+
+# GRÁFICOS EN EL NAVEGADOR
+#
+# Alternativa a las funciones de graficos.py: en vez de dibujar un PNG con
+# matplotlib en el servidor, cada función devuelve la tabla ya reducida (el
+# top 10, el orden final) y una especificación Vega-Lite con los mismos ejes,
+# etiquetas y colores. dashboard.py la pasa a st.vega_lite_chart y el dibujo
+# lo hace el navegador; por la red solo viaja la tabla pequeña.
+#
+# Se elige gráfico a gráfico: los que no estén en la lista siguen con
+# matplotlib (el mapa siempre, porque necesita la geometría de los estados).
+#
+#   OLIST_GRAFICOS_CLIENTE=todos                      todos los que tienen versión Vega-Lite
+#   OLIST_GRAFICOS_CLIENTE=grafico1,grafico2,grafico6 solo esos
+
+
+def _etiqueta(x, y, formato=None, desplazamiento=-5, color='black'):
+    # Texto encima de cada barra, como los ax.text de graficos.py
+    texto = {'field': y, 'type': 'quantitative'}
+    if formato:
+        texto['format'] = formato
+    return {
+        'mark': {'type': 'text', 'dy': desplazamiento, 'fontSize': 10, 'color': color},
+        'encoding': {
+            'x': {'field': x, 'type': 'nominal', 'sort': None},
+            'y': {'field': y, 'type': 'quantitative'},
+            'text': texto,
+        },
+    }
+
+
+def _serie(nombre):
+    # Columna constante con el nombre de la serie, para la leyenda de cada capa
+    return {'calculate': repr(nombre), 'as': 'Serie'}
+
+
+def _barras(tabla, x, y, color, titulo_x, titulo_y, formato=None):
+    return tabla, {
+        'layer': [
+            {
+                'mark': {'type': 'bar', 'color': color},
+                'encoding': {
+                    # sort None: el orden de las filas, ya ordenadas como en matplotlib
+                    'x': {'field': x, 'type': 'nominal', 'sort': None, 'title': titulo_x, 'axis': {'labelAngle': -45}},
+                    'y': {'field': y, 'type': 'quantitative', 'title': titulo_y},
+                },
+            },
+            _etiqueta(x, y, formato),
+        ],
+    }
+
+
+def grafico1(df_ciudades):
+    top_users = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
+    return _barras(top_users[['Ciudad', 'Total clientes']], 'Ciudad', 'Total clientes', '#004E64',
+                   'Ciudad', 'Cantidad de Usuarios Únicos', ',')
+
+
+def grafico2(df_ciudades):
+    top_orders = df_ciudades.sort_values('Pedidos totales', ascending=False).head(10)
+    return _barras(top_orders[['Ciudad', 'Pedidos totales']], 'Ciudad', 'Pedidos totales', '#4ca5b6',
+                   'Ciudad', 'Total de Pedidos', ',')
+
+
+def grafico3(df_ciudades):
+    top_combined = df_ciudades.sort_values('Total clientes', ascending=False).head(10)
+
+    # Formato largo: una fila por ciudad y serie
+    tabla = top_combined.melt(
+        id_vars='Ciudad', value_vars=['Total clientes', 'Pedidos totales'], var_name='Serie', value_name='Cantidad',
+    )
+    tabla['Serie'] = tabla['Serie'].map({'Total clientes': 'Usuarios únicos', 'Pedidos totales': 'Total pedidos'})
+
+    return tabla, {
+        'mark': {'type': 'line', 'point': True, 'strokeWidth': 2},
+        'encoding': {
+            'x': {'field': 'Ciudad', 'type': 'nominal', 'sort': top_combined['Ciudad'].tolist(), 'title': 'Ciudad',
+                  'axis': {'labelAngle': -45, 'grid': True, 'gridDash': [4, 4]}},
+            'y': {'field': 'Cantidad', 'type': 'quantitative', 'title': 'Cantidad', 'axis': {'gridDash': [4, 4]}},
+            'color': {'field': 'Serie', 'type': 'nominal', 'title': None,
+                      'scale': {'domain': ['Usuarios únicos', 'Total pedidos'], 'range': ['#4ca5b6', '#1d3557']}},
+            'shape': {'field': 'Serie', 'type': 'nominal', 'title': None,
+                      'scale': {'domain': ['Usuarios únicos', 'Total pedidos'], 'range': ['circle', 'square']}},
+        },
+    }
+
+
+def grafico4(df_ciudades):
+    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
+    tabla, especificacion = _barras(top_pct[['Ciudad', 'Porcentaje %']], 'Ciudad', 'Porcentaje %', '#52b788',
+                                    'Ciudad', 'Porcentaje (%)')
+
+    # Etiqueta "v%" como el f"{v}%" de matplotlib
+    etiqueta = especificacion['layer'][1]
+    etiqueta['transform'] = [{'calculate': "datum['Porcentaje %'] + '%'", 'as': 'Etiqueta'}]
+    etiqueta['encoding']['text'] = {'field': 'Etiqueta', 'type': 'nominal'}
+    especificacion['layer'][0]['encoding']['x']['axis']['labelAngle'] = -40
+    return tabla, especificacion
+
+
+COLORES_TARTA = ['#1d3557', '#457b9d', '#6096ba', '#a8dadc', '#00b4d8',
+                 '#48cae4', '#90e0ef', '#52b788', '#2d6a4f', '#95d5b2']
+
+
+def grafico5(df_ciudades):
+    top_pct = df_ciudades.sort_values('Porcentaje %', ascending=False).head(10)
+
+    # autopct de matplotlib: porcentaje sobre la suma de las diez porciones
+    tabla = top_pct[['Ciudad', 'Porcentaje %']].reset_index(drop=True)
+    tabla['Orden'] = range(len(tabla))
+    tabla['Etiqueta'] = (tabla['Porcentaje %'] / tabla['Porcentaje %'].sum() * 100).map('{:.1f}%'.format)
+
+    theta = {'field': 'Porcentaje %', 'type': 'quantitative', 'stack': True}
+    orden = {'field': 'Orden', 'type': 'quantitative'}
+    return tabla, {
+        'height': 400,
+        'layer': [
+            {
+                'mark': {'type': 'arc', 'outerRadius': 150},
+                'encoding': {
+                    'theta': theta,
+                    'order': orden,
+                    'color': {'field': 'Ciudad', 'type': 'nominal', 'sort': tabla['Ciudad'].tolist(),
+                              'scale': {'range': COLORES_TARTA[:len(tabla)]}, 'legend': None},
+                },
+            },
+            {
+                'mark': {'type': 'text', 'radius': 100, 'color': 'white', 'fontSize': 10},
+                'encoding': {'theta': theta, 'order': orden, 'text': {'field': 'Etiqueta', 'type': 'nominal'}},
+            },
+            {
+                'mark': {'type': 'text', 'radius': 175},
+                'encoding': {'theta': theta, 'order': orden, 'text': {'field': 'Ciudad', 'type': 'nominal'}},
+            },
+        ],
+    }
+
+
+#GRAFICOS PAGINA 3
+def grafico6(pedidos_tarde):
+    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
+    return _barras(top10[['Ciudad', 'Dias tarde']], 'Ciudad', 'Dias tarde', '#1d3557', 'Ciudad', 'Días', '.1f')
+
+
+def grafico7(pedidos_tarde):
+    tabla = pedidos_tarde[['Ciudad', 'Pedidos tarde %', 'Dias tarde']]
+    x = {'field': 'Pedidos tarde %', 'type': 'quantitative', 'title': '% Pedidos entregados tarde',
+         'axis': {'gridDash': [4, 4]}}
+    y = {'field': 'Dias tarde', 'type': 'quantitative', 'title': 'Días promedio de retraso',
+         'axis': {'gridDash': [4, 4]}}
+    serie = {'field': 'Serie', 'type': 'nominal', 'title': None,
+             'scale': {'domain': ['Ciudades', 'Tendencia'], 'range': ['#52b788', '#1d3557']}}
+
+    return tabla, {
+        'layer': [
+            {
+                'transform': [_serie('Ciudades')],
+                'mark': {'type': 'circle', 'size': 100, 'opacity': 0.8},
+                'encoding': {'x': x, 'y': y, 'color': serie,
+                             'tooltip': [{'field': 'Ciudad', 'type': 'nominal'}]},
+            },
+            {
+                # La misma recta de mínimos cuadrados que np.polyfit(x, y, 1)
+                'transform': [{'regression': 'Dias tarde', 'on': 'Pedidos tarde %', 'method': 'linear'},
+                              _serie('Tendencia')],
+                'mark': {'type': 'line', 'strokeDash': [6, 4], 'strokeWidth': 2},
+                'encoding': {'x': x, 'y': y, 'color': serie},
+            },
+        ],
+    }
+
+
+def grafico8(pedidos_tarde):
+    top10 = pedidos_tarde.sort_values('Pedidos tarde %', ascending=False).head(10)
+    color_days_late = '#457b9d'
+    color_late_pct = '#2a9d8f'
+    series = ['Días promedio de retraso', '% Pedidos entregados tarde']
+
+    tabla = top10[['Ciudad', 'Dias tarde', 'Pedidos tarde %']].rename(
+        columns={'Dias tarde': series[0], 'Pedidos tarde %': series[1]},
+    )
+    x = {'field': 'Ciudad', 'type': 'nominal', 'sort': None, 'title': None, 'axis': {'labelAngle': -45}}
+    leyenda = {'field': 'Serie', 'type': 'nominal', 'title': None, 'scale': {'domain': series, 'range': [color_days_late, color_late_pct]}}
+
+    def barras(serie, color, desplazamiento):
+        # Dos ejes y independientes, como ax1 y ax2.twinx()
+        return {
+            'transform': [_serie(serie)],
+            'mark': {'type': 'bar', 'xOffset': desplazamiento, 'width': {'band': 0.4}},
+            'encoding': {
+                'x': x,
+                'y': {'field': serie, 'type': 'quantitative', 'title': serie,
+                      'axis': {'titleColor': color, 'labelColor': color, 'gridDash': [4, 4],
+                               'grid': serie == series[0]}},
+                'color': leyenda,
+            },
+        }
+
+    return tabla, {
+        'layer': [barras(series[0], color_days_late, -8), barras(series[1], color_late_pct, 8)],
+        'resolve': {'scale': {'y': 'independent'}},
+    }
+
+
+#GRAFICOS PAGINA 4
+def grafico9(customers_review):
+    customers_review_sorted = customers_review.sort_values('Puntuacion', ascending=False)
+    return customers_review_sorted[['Estado', 'Puntuacion']], {
+        'transform': [_serie('Puntaje promedio')],
+        'mark': {'type': 'line', 'point': {'size': 36}, 'strokeWidth': 2},
+        'encoding': {
+            'x': {'field': 'Estado', 'type': 'nominal', 'sort': None, 'title': 'Estado', 'axis': {'labelAngle': -45}},
+            'y': {'field': 'Puntuacion', 'type': 'quantitative', 'title': 'Puntaje promedio',
+                  'scale': {'zero': False}},
+            'color': {'field': 'Serie', 'type': 'nominal', 'title': None, 'scale': {'range': ['#1d3557']}},
+        },
+    }
+
+
+def grafico10(customers_review):
+    # cm.winter va de azul (0, 0, 1) a verde (0, 1, 0.5) sobre la puntuación normalizada
+    return customers_review[['Estado', 'Reviews', 'Puntuacion']], {
+        'mark': {'type': 'circle', 'size': 100, 'opacity': 0.8},
+        'encoding': {
+            'x': {'field': 'Reviews', 'type': 'quantitative', 'title': 'Número de reviews',
+                  'axis': {'gridDash': [4, 4]}},
+            'y': {'field': 'Puntuacion', 'type': 'quantitative', 'title': 'Puntaje promedio',
+                  'scale': {'zero': False}, 'axis': {'gridDash': [4, 4]}},
+            'color': {'field': 'Puntuacion', 'type': 'quantitative', 'legend': None,
+                      'scale': {'range': ['#0000ff', '#00ff80']}},
+            'tooltip': [{'field': 'Estado', 'type': 'nominal'}],
+        },
+    }
+
+
+def grafico11(customers_review):
+    # Mismas celdas que el pivot Estado x Reviews del heatmap de seaborn
+    tabla = customers_review[['Estado', 'Reviews', 'Puntuacion']].dropna()
+    # Texto claro sobre las celdas oscuras, como annot de seaborn
+    minimo, maximo = tabla['Puntuacion'].min(), tabla['Puntuacion'].max()
+    tabla['Oscura'] = (tabla['Puntuacion'] - minimo) > (maximo - minimo) * 0.6
+    estados = sorted(tabla['Estado'].unique().tolist())
+    reviews = sorted(tabla['Reviews'].unique().tolist())
+
+    x = {'field': 'Reviews', 'type': 'ordinal', 'sort': reviews, 'title': 'Número de reviews'}
+    y = {'field': 'Estado', 'type': 'ordinal', 'sort': estados, 'title': 'Estado'}
+    return tabla, {
+        'height': {'step': 20},
+        'layer': [
+            {
+                'mark': 'rect',
+                'encoding': {
+                    'x': x, 'y': y,
+                    'color': {'field': 'Puntuacion', 'type': 'quantitative', 'title': 'Puntaje promedio',
+                              'scale': {'scheme': 'yellowgreenblue'}},
+                },
+            },
+            {
+                'mark': {'type': 'text', 'fontSize': 9},
+                'encoding': {
+                    'x': x, 'y': y,
+                    'text': {'field': 'Puntuacion', 'type': 'quantitative', 'format': '.2f'},
+                    'color': {'condition': {'test': 'datum.Oscura', 'value': 'white'}, 'value': 'black'},
+                },
+            },
+        ],
+    }
+
+
+ESPECIFICACIONES = {
+    'grafico1': grafico1,
+    'grafico2': grafico2,
+    'grafico3': grafico3,
+    'grafico4': grafico4,
+    'grafico5': grafico5,
+    'grafico6': grafico6,
+    'grafico7': grafico7,
+    'grafico8': grafico8,
+    'grafico9': grafico9,
+    'grafico10': grafico10,
+    'grafico11': grafico11,
+}
+
+
+def _leer_seleccion(valor):
+    if valor.strip() == 'todos':
+        return set(ESPECIFICACIONES)
+    nombres = {nombre.strip() for nombre in valor.split(',') if nombre.strip()}
+    desconocidos = nombres - set(ESPECIFICACIONES)
+    if desconocidos:
+        raise ValueError(f"Sin versión Vega-Lite: {', '.join(sorted(desconocidos))}")
+    return nombres
+
+
+EN_CLIENTE = _leer_seleccion(os.environ.get("OLIST_GRAFICOS_CLIENTE", ""))
+
+
+def en_cliente(nombre):
+    return nombre in EN_CLIENTE
+
+
+def especificacion(nombre, df, *args):
+    # (tabla reducida, especificación Vega-Lite); las columnas categóricas se
+    # pasan a texto para que Arrow no mande el diccionario completo
+    tabla, spec = ESPECIFICACIONES[nombre](df, *args)
+    tabla = tabla.reset_index(drop=True)
+    for columna in tabla.columns:
+        if isinstance(tabla[columna].dtype, pd.CategoricalDtype):
+            tabla[columna] = tabla[columna].astype(str)
+    return tabla, spec
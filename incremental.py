@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import construir_dataset
+from datos import (
+    CLAVE_FIRMA, COLUMNA_FECHA, FECHAS_CUSTOMERS, RUTA_AGREGADOS, RUTA_ARTEFACTO, RUTA_REVIEWS_ARTEFACTO,
+    firma_fuentes, firma_metadatos, leer_agregados, leer_customers, leer_reviews,
+    ruta_customers_por_defecto, ruta_reviews_por_defecto,
+)
+
+
+# ACTUALIZACIÓN INCREMENTAL
+#
+# Aplica un lote de pedidos y reviews nuevos o modificados sobre el dataset ya
+# construido, sin volver a pasar por el notebook ni por etl.py:
+#   - cada fila del lote trae last_modified; solo se aplican las posteriores a la
+#     marca de agua guardada y, dentro del lote, gana la más reciente,
+#   - los pedidos se sustituyen por order_id (upsert) y las reviews de un pedido
+#     se sustituyen por las que traiga el lote para ese pedido,
+#   - los agregados diarios (pedidos y retrasos por día, estado y ciudad) solo
+#     se recalculan en las particiones que tocan los pedidos viejos o nuevos.
+#     cubo.py los usa en vez de agregar todas las filas,
+#   - si la marca de agua descarta todo el lote no se reescribe nada.
+#
+# El lote de pedidos tiene las columnas de customers.csv más last_modified; el
+# de reviews, las de olist_order_reviews_dataset.csv más last_modified.
+#
+#   python incremental.py --pedidos lote_pedidos.csv --reviews lote_reviews.csv
+
+RUTA_MARCA = "streamlit/marca_agua.json"
+
+COLUMNA_MARCA = 'last_modified'
+FECHAS_REVIEWS = ['review_creation_date', 'review_answer_timestamp']
+
+PARTICION = ['dia', 'state', 'city']
+METRICAS = {
+    'pedidos': np.int32,
+    'entregados': np.int32,
+    'tarde': np.int32,
+    'retraso_tarde': np.int64,
+}
+
+
+def leer_lote(ruta, fechas):
+    if ruta.endswith(".parquet"):
+        lote = pd.read_parquet(ruta)
+    else:
+        lote = pd.read_csv(ruta, parse_dates=fechas + [COLUMNA_MARCA])
+    lote[COLUMNA_MARCA] = pd.to_datetime(lote[COLUMNA_MARCA])
+    return lote
+
+
+def leer_marca(ruta=RUTA_MARCA):
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta) as fichero:
+        return {tabla: pd.Timestamp(valor) for tabla, valor in json.load(fichero).items()}
+
+
+def escribir_marca(marca, ruta=RUTA_MARCA):
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w') as fichero:
+        json.dump({tabla: valor.isoformat() for tabla, valor in marca.items()}, fichero)
+    os.replace(temporal, ruta)
+
+
+def filtrar_lote(lote, marca):
+    # Devuelve (filas a aplicar, filas ignoradas por ser anteriores a la marca)
+    if marca is None:
+        return lote, 0
+    recientes = lote[COLUMNA_MARCA] > marca
+    return lote[recientes], int((~recientes).sum())
+
+
+# AGREGADOS DIARIOS
+
+def agregar_dias(customers):
+    # Una fila por (día, estado, ciudad); mismas definiciones que metricas.py:
+    # retraso solo en entregados
+    customers = customers[customers[COLUMNA_FECHA].notna()]
+    entregado = (customers['order_status'] == 'delivered').to_numpy()
+    delay = customers['delay_days'].to_numpy(dtype='float64')
+    tarde = entregado & (delay > 0)
+
+    filas = pd.DataFrame({
+        'dia': customers[COLUMNA_FECHA].dt.floor('D').to_numpy(),
+        'state': customers['state'].to_numpy(dtype=object),
+        'city': customers['city'].to_numpy(dtype=object),
+        'pedidos': 1,
+        'entregados': entregado.astype(np.int32),
+        'tarde': tarde.astype(np.int32),
+        'retraso_tarde': np.where(tarde, delay, 0).astype(np.int64),
+    })
+
+    agregados = filas.groupby(PARTICION, dropna=False, sort=True)[list(METRICAS)].sum().reset_index()
+    return agregados.astype(METRICAS)
+
+
+def particiones(customers):
+    return pd.MultiIndex.from_arrays(
+        [customers[COLUMNA_FECHA].dt.floor('D'), customers['state'].astype(object), customers['city'].astype(object)],
+        names=PARTICION,
+    )
+
+
+def escribir_agregados(agregados, firma, destino=RUTA_AGREGADOS):
+    # La firma de customers/reviews va en los metadatos: cubo.py solo usa el
+    # fichero si coincide con los datos cargados
+    tabla = pa.Table.from_pandas(agregados, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({**tabla.schema.metadata, CLAVE_FIRMA: firma_metadatos(firma)})
+    temporal = destino + ".tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, destino)
+
+
+def _unir(indices):
+    if not indices:
+        return pd.MultiIndex.from_arrays([[], [], []], names=PARTICION)
+    return indices[0].append(indices[1:]).unique()
+
+
+# UPSERT
+
+def aplicar_lote(lote_pedidos=None, lote_reviews=None, ruta_customers=None, ruta_reviews=None,
+                 ruta_marca=RUTA_MARCA, ruta_agregados=RUTA_AGREGADOS):
+    ruta_customers = ruta_customers or ruta_customers_por_defecto()
+    ruta_reviews = ruta_reviews or ruta_reviews_por_defecto()
+    firma_anterior = firma_fuentes((ruta_customers, ruta_reviews))
+
+    marca = leer_marca(ruta_marca)
+    informe = {}
+    tocadas = []
+
+    pedidos = reviews = None
+    if lote_pedidos is not None and len(lote_pedidos):
+        pedidos, informe['pedidos_ignorados'] = filtrar_lote(lote_pedidos, marca.get('pedidos'))
+    if lote_reviews is not None and len(lote_reviews):
+        reviews, informe['reviews_ignoradas'] = filtrar_lote(lote_reviews, marca.get('reviews'))
+
+    if all(lote is None or not len(lote) for lote in (pedidos, reviews)):
+        # Nada posterior a la marca de agua: el dataset y los agregados no cambian
+        informe['agregados'] = 'sin cambios'
+        informe['particiones'] = _unir([]).to_frame(index=False)
+        informe['marca_agua'] = marca
+        return informe
+
+    customers = construir_dataset.tipar_customers(leer_customers(ruta_customers))
+    df_reviews = leer_reviews(ruta_reviews)
+    for columna in FECHAS_REVIEWS:
+        df_reviews[columna] = pd.to_datetime(df_reviews[columna])
+
+    if pedidos is not None and len(pedidos):
+        lote = pedidos.sort_values(COLUMNA_MARCA, kind='stable').drop_duplicates('order_id', keep='last')
+
+        reemplazar = customers['order_id'].isin(lote['order_id'])
+        anteriores = customers[reemplazar]
+        nuevos = lote.drop(columns=[COLUMNA_MARCA])
+
+        customers = pd.concat([customers[~reemplazar], nuevos], ignore_index=True)
+        customers = customers.sort_values(COLUMNA_FECHA, kind='stable', na_position='first', ignore_index=True)
+        # Recalcula delay_days/late de las filas nuevas y vuelve a las categóricas
+        customers = construir_dataset.tipar_customers(customers)
+
+        tocadas += [particiones(anteriores), particiones(nuevos)]
+        marca['pedidos'] = lote[COLUMNA_MARCA].max()
+
+        informe['pedidos_nuevos'] = int(len(lote) - len(anteriores))
+        informe['pedidos_actualizados'] = int(len(anteriores))
+
+    if reviews is not None and len(reviews):
+        # Por pedido se quedan las reviews de su versión más reciente en el lote
+        ultima = reviews.groupby('order_id')[COLUMNA_MARCA].transform('max')
+        lote = reviews[reviews[COLUMNA_MARCA] == ultima]
+
+        reemplazar = df_reviews['order_id'].isin(lote['order_id'])
+        informe['reviews_sustituidas'] = int(reemplazar.sum())
+        informe['reviews_nuevas'] = int(len(lote))
+
+        # Los agregados diarios no usan las reviews: no tocan ninguna partición
+        df_reviews = pd.concat([df_reviews[~reemplazar], lote.drop(columns=[COLUMNA_MARCA])], ignore_index=True)
+        marca['reviews'] = lote[COLUMNA_MARCA].max()
+
+    # El dataset se reescribe entero (Parquet no admite reescribir filas sueltas);
+    # lo que se ahorra es el ETL y la agregación de todo el histórico. Si aún
+    # era CSV, pasa a Parquet.
+    if ruta_customers.endswith('.csv'):
+        ruta_customers = RUTA_ARTEFACTO
+    if ruta_reviews.endswith('.csv'):
+        ruta_reviews = RUTA_REVIEWS_ARTEFACTO
+    construir_dataset.escribir(customers, ruta_customers, orden=COLUMNA_FECHA)
+    construir_dataset.escribir(df_reviews, ruta_reviews)
+
+    agregados = leer_agregados(firma_anterior, ruta_agregados)
+    tocadas = _unir(tocadas)
+
+    if agregados is None:
+        # Sin agregados o desfasados respecto al dataset: se calculan enteros
+        agregados = agregar_dias(customers)
+        informe['agregados'] = 'completo'
+    else:
+        # Solo las columnas actuales (ficheros anteriores traían también las reviews)
+        agregados = agregados[PARTICION + list(METRICAS)]
+        clave = pd.MultiIndex.from_frame(agregados[PARTICION])
+        filas = customers[particiones(customers).isin(tocadas)]
+        recalculadas = agregar_dias(filas)
+        agregados = pd.concat([agregados[~clave.isin(tocadas)], recalculadas], ignore_index=True)
+        agregados = agregados.sort_values(PARTICION, ignore_index=True)
+        informe['agregados'] = 'parcial'
+
+    escribir_agregados(agregados, firma_fuentes((ruta_customers, ruta_reviews)), ruta_agregados)
+    escribir_marca(marca, ruta_marca)
+
+    informe['particiones'] = tocadas.to_frame(index=False)
+    informe['marca_agua'] = marca
+    return informe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica un lote de pedidos/reviews al dataset sin reconstruirlo")
+    parser.add_argument("--pedidos", help="CSV o Parquet con columnas de customers.csv y last_modified")
+    parser.add_argument("--reviews", help="CSV o Parquet con columnas de reviews y last_modified")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    informe = aplicar_lote(
+        leer_lote(args.pedidos, FECHAS_CUSTOMERS) if args.pedidos else None,
+        leer_lote(args.reviews, FECHAS_REVIEWS) if args.reviews else None,
+    )
+    duracion = time.perf_counter() - inicio
+
+    for clave, valor in informe.items():
+        if clave == 'marca_agua':
+            valor = ', '.join(f"{tabla} {marca:%Y-%m-%d %H:%M:%S}" for tabla, marca in valor.items())
+        if clave != 'particiones':
+            print(f"{clave:<24} {valor}")
+
+    tocadas = informe['particiones']
+    print(f"{'particiones':<24} {len(tocadas)} (día, estado, ciudad) en "
+          f"{tocadas['dia'].nunique()} días y {tocadas['city'].nunique()} ciudades")
+    print(tocadas.to_string(index=False, max_rows=20))
+    print(f"{'total':<24} {duracion * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
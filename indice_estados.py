@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+
+# ÍNDICE JERÁRQUICO ESTADO -> CIUDADES
+#
+# Las tablas por ciudad (ciudades, retrasos) se reordenan una vez por estado,
+# sin perder el orden de la tabla nacional dentro de cada estado, y se guarda
+# dónde empieza y acaba el bloque de cada estado. Elegir un estado en el
+# selectbox es entonces un slice de ese bloque en vez de recorrer la columna
+# Estado con una máscara. También se guardan los totales por estado: las
+# columnas que se pueden sumar (sumas) se suman sobre el bloque; los recuentos
+# de distintos (clientes únicos) no, porque un cliente con pedidos en varias
+# ciudades contaría varias veces, y llegan ya calculados por estado (distintos).
+
+
+class IndiceEstados:
+
+    def __init__(self, df, sumas=(), distintos=None):
+        # distintos: columna -> Series por estado con el recuento a nivel de estado
+        self.sumas = list(sumas)
+
+        # mergesort es estable: dentro de cada estado se mantiene el orden nacional
+        estados = df['Estado'].astype(object).to_numpy()
+        orden = np.argsort(estados, kind='mergesort')
+        self.tabla = df.iloc[orden]
+
+        ordenados = estados[orden]
+        cortes = np.flatnonzero(ordenados[1:] != ordenados[:-1]) + 1
+        inicios = np.concatenate([[0], cortes]).astype(np.int64)
+        fines = np.concatenate([cortes, [len(ordenados)]]).astype(np.int64)
+
+        self.estados = [str(estado) for estado in ordenados[inicios]] if len(ordenados) else []
+        self.bloques = dict(zip(self.estados, zip(inicios.tolist(), fines.tolist())))
+
+        self.totales = pd.DataFrame(
+            [self.resumir(self.bloque(estado), self.sumas) for estado in self.estados],
+            index=pd.Index(self.estados, name='Estado'),
+        )
+        for columna, por_estado in (distintos or {}).items():
+            por_estado = pd.Series(por_estado.to_numpy(), index=por_estado.index.astype(str))
+            self.totales[columna] = por_estado.reindex(self.totales.index, fill_value=0).astype('int64')
+
+    def bloque(self, estado):
+        inicio, fin = self.bloques.get(estado, (0, 0))
+        return self.tabla.iloc[inicio:fin]
+
+    @staticmethod
+    def resumir(bloque, sumas=()):
+        # Totales de un estado: número de ciudades y suma de las columnas indicadas
+        resumen = {'Ciudades': len(bloque)}
+        for columna in sumas:
+            resumen[columna] = int(bloque[columna].sum())
+        return resumen
+
+    def __sizeof__(self):
+        # Para el presupuesto de memoria de tablas.resultados
+        return int(self.tabla.memory_usage(deep=True).sum() + self.totales.memory_usage(deep=True).sum())
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import pandas as pd
+
+
+# INSTRUMENTACIÓN DE ETAPAS
+#
+# Mide cada etapa de un rerun (carga, filtro, tablas, renders, envío de
+# imágenes): tiempo, filas de entrada y salida y pico de memoria. Los registros
+# van a un buffer circular en memoria y, si se configura, a un fichero JSON
+# lines. Desactivada, etapa() devuelve siempre el mismo objeto vacío y no mide
+# nada.
+#
+#   OLIST_PERFIL=1                  activa la medición
+#   OLIST_PERFIL_MEMORIA=1          además mide el pico de memoria (tracemalloc, más caro)
+#   OLIST_PERFIL_JSONL=perfil.jsonl  copia cada registro a ese fichero
+
+MAX_REGISTROS = 5000
+
+activa = os.environ.get("OLIST_PERFIL") == "1"
+memoria = os.environ.get("OLIST_PERFIL_MEMORIA") == "1"
+ruta_jsonl = os.environ.get("OLIST_PERFIL_JSONL")
+
+registros = deque(maxlen=MAX_REGISTROS)
+
+_lock_fichero = threading.Lock()
+_local = threading.local()
+
+
+def configurar(activar=None, medir_memoria=None, jsonl=None):
+    global activa, memoria, ruta_jsonl
+    if activar is not None:
+        activa = activar
+    if medir_memoria is not None:
+        memoria = medir_memoria
+    if jsonl is not None:
+        ruta_jsonl = jsonl
+
+
+def _filas(valor):
+    return len(valor) if hasattr(valor, '__len__') else None
+
+
+class _EtapaInactiva:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def salida(self, valor):
+        return valor
+
+
+_INACTIVA = _EtapaInactiva()
+
+
+class Etapa:
+
+    def __init__(self, nombre, entrada=None):
+        self.nombre = nombre
+        self.filas_entrada = _filas(entrada) if entrada is not None else None
+        self.filas_salida = None
+
+    def salida(self, valor):
+        self.filas_salida = _filas(valor)
+        return valor
+
+    def __enter__(self):
+        if memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            pila = getattr(_local, 'pila', None)
+            if pila is None:
+                pila = _local.pila = []
+            actual, pico = tracemalloc.get_traced_memory()
+            # El pico acumulado del padre se guarda antes de reiniciarlo
+            if pila:
+                pila[-1] = max(pila[-1], pico)
+            tracemalloc.reset_peak()
+            self._memoria_inicio = actual
+            pila.append(actual)
+
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        duracion = time.perf_counter() - self._inicio
+
+        pico = None
+        if memoria and tracemalloc.is_tracing():
+            pila = _local.pila
+            pico = max(pila.pop(), tracemalloc.get_traced_memory()[1])
+            if pila:
+                pila[-1] = max(pila[-1], pico)
+            pico -= self._memoria_inicio
+
+        registrar({
+            'ts': time.time(),
+            'etapa': self.nombre,
+            'segundos': duracion,
+            'filas_entrada': self.filas_entrada,
+            'filas_salida': self.filas_salida,
+            'pico_bytes': pico,
+            'error': tipo.__name__ if tipo is not None else None,
+        })
+        return False
+
+
+def etapa(nombre, entrada=None):
+    if not activa:
+        return _INACTIVA
+    return Etapa(nombre, entrada)
+
+
+def registrar(registro):
+    registros.append(registro)
+
+    if ruta_jsonl:
+        linea = json.dumps(registro)
+        with _lock_fichero:
+            with open(ruta_jsonl, 'a') as fichero:
+                fichero.write(linea + '\n')
+
+
+COLUMNAS_RESUMEN = ['Etapa', 'N', 'p50 ms', 'p95 ms', 'Filas entrada', 'Filas salida', 'Pico MB']
+
+
+def resumen():
+    # p50/p95 por etapa sobre los registros en memoria
+    if not registros:
+        return pd.DataFrame(columns=COLUMNAS_RESUMEN)
+
+    df = pd.DataFrame(list(registros))
+    tabla = df.groupby('etapa').agg(
+        N=('segundos', 'size'),
+        p50=('segundos', lambda s: s.quantile(0.5) * 1000),
+        p95=('segundos', lambda s: s.quantile(0.95) * 1000),
+        entrada=('filas_entrada', 'last'),
+        salida=('filas_salida', 'last'),
+        pico=('pico_bytes', lambda s: s.max() / 1e6),
+    ).round(2).sort_values('p95', ascending=False).reset_index()
+
+    tabla.columns = COLUMNAS_RESUMEN
+    return tabla
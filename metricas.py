@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from datos import filtrar_fechas
+
+
+# FUNCIONES DE MÉTRICAS
+
+# Opción del selectbox de estado que no filtra
+TODOS_LOS_ESTADOS = 'ALL STATES'
+
+
+def filtrar_estado(df, estado):
+    if estado == TODOS_LOS_ESTADOS:
+        return df
+    return df[df['Estado'] == estado]
+
+
+def calcular_top_estados(df):
+    
+    df_estados = df.groupby('state', observed=True)['id_user'].nunique().sort_values(ascending=False).head(5)
+    
+    df_estados = df_estados.reset_index()
+    
+    df_estados.rename(columns={'state': 'Estado', 'id_user': 'Total clientes'}, inplace=True)
+    
+    return df_estados
+
+def calcular_ciudades(df):
+    df_ciudades = (df.groupby(['city', 'state'], observed=True)['id_user'].nunique().reset_index(name='Total clientes').sort_values('Total clientes', ascending=False))
+    
+    totalPedidos = df.groupby('city', observed=True)['id_customer_order'].count().reset_index()
+    totalPedidos.rename(columns={'id_customer_order': 'Pedidos totales'}, inplace=True)
+
+    df_ciudades = pd.merge(df_ciudades, totalPedidos, on='city', how='left')
+
+    df_ciudades['Porcentaje %'] = (
+    df_ciudades['Pedidos totales'] / df_ciudades['Pedidos totales'].sum() * 100
+    ).round(2)
+    
+    df_ciudades['Pedidos x cliente'] =(
+        df_ciudades['Pedidos totales'] / df_ciudades['Total clientes']
+    ).round(2)
+
+    df_ciudades.rename(columns={'city': 'Ciudad', 'state':'Estado'}, inplace=True)
+
+ 
+    return df_ciudades
+
+
+
+# Umbrales del diagnóstico de retrasos (en % de pedidos tarde y días medios de retraso)
+UMBRALES_DIAGNOSTICO = {
+    'graves_pct': 40,
+    'graves_dias': 10,
+    'proveedor_pct': 25,
+    'moderados_pct': 15,
+}
+
+
+def diagnosticar(pct_tarde, dias_tarde, umbrales=UMBRALES_DIAGNOSTICO):
+    condiciones = [
+        (pct_tarde > umbrales['graves_pct']) & (dias_tarde > umbrales['graves_dias']),
+        pct_tarde > umbrales['proveedor_pct'],
+        pct_tarde > umbrales['moderados_pct'],
+    ]
+    etiquetas = [
+        "Problemas graves",
+        "Probable fallo del proveedor o mala preparación del pedido",
+        "Retrasos moderados (Posibles problemas con el repartidor)",
+    ]
+    return np.select(condiciones, etiquetas, default="Funcionamiento aceptable")
+
+
+def calcular_retrasos(df_delivered, umbrales=UMBRALES_DIAGNOSTICO):
+    # Una sola pasada de groupby con sumas: la media de días de los pedidos tarde
+    # es suma(retraso de los pedidos tarde) / nº de pedidos tarde
+    late = df_delivered['delay_days'] > 0
+
+    tabla = pd.DataFrame({
+        'city': df_delivered['city'],
+        'state': df_delivered['state'],
+        'id_customer_order': df_delivered['id_customer_order'],
+        'late': late,
+        'retraso_tarde': df_delivered['delay_days'].where(late, 0),
+    })
+
+    pedidos_tarde = tabla.groupby(["city", "state"], observed=True).agg(
+        late=("late", "sum"),
+        total_pedidos=("id_customer_order", "count"),
+        retraso_tarde=("retraso_tarde", "sum"),
+    ).reset_index()
+
+    late_orders = pedidos_tarde["late"].to_numpy()
+    pedidos_tarde["days_late"] = np.divide(
+        pedidos_tarde["retraso_tarde"].to_numpy(dtype='float64'),
+        late_orders,
+        out=np.zeros(len(pedidos_tarde)),
+        where=late_orders > 0,
+    )
+
+    pedidos_tarde["late_orders_%"] = (pedidos_tarde["late"] / pedidos_tarde["total_pedidos"] * 100).round(2)
+
+    pedidos_tarde['Diagnóstico'] = diagnosticar(
+        pedidos_tarde['late_orders_%'].to_numpy(), pedidos_tarde['days_late'].to_numpy(), umbrales
+    )
+
+    pedidos_tarde = pedidos_tarde[["city", "state", "late_orders_%", "days_late", "Diagnóstico"]]
+
+    pedidos_tarde = pedidos_tarde.rename(columns={"city": "Ciudad", "state": "Estado", "late_orders_%": "Pedidos tarde %", "days_late": "Dias tarde"})
+    return pedidos_tarde
+
+
+
+def calcular_reviews(customers_delivered, df_reviews):
+    customers_review = customers_delivered[customers_delivered['late'] == False]
+
+    customers_review = pd.merge(
+        df_reviews,
+        customers_review[['order_id','id_customer_order', 'id_user', 'state', 'order_purchase_timestamp']],
+        on='order_id',
+        how='left'
+    )
+
+    customers_review = customers_review.groupby(['state'], observed=True).agg(
+        Reviews=('order_id', 'count'),
+        Puntuacion=('review_score', 'mean')
+    ).reset_index()
+
+    customers_review.rename(columns={'state': 'Estado'}, inplace=True)
+
+
+    return customers_review
+
+
+def calcular_reviews_fechas(hechos_reviews, desde, hasta):
+    # Igual que calcular_reviews pero sobre datos.hechos_reviews y solo con las
+    # compras del rango: dos slices y un groupby, sin merge
+    a_tiempo = int(np.searchsorted(hechos_reviews['late'].to_numpy(), True, side='left'))
+    hechos = filtrar_fechas(hechos_reviews.iloc[:a_tiempo], desde, hasta)
+
+    customers_review = hechos.groupby('state', observed=True).agg(
+        Reviews=('review_score', 'count'),
+        Puntuacion=('review_score', 'mean')
+    ).reset_index()
+
+    customers_review.rename(columns={'state': 'Estado'}, inplace=True)
+
+    return customers_review
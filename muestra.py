@@ -0,0 +1,286 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from datos import COLUMNA_FECHA, Datos, preparar_delivered, rango_filas
+from paginas import definir_tablas
+from tablas import Tablas
+
+
+# MODO PROGRESIVO: MUESTRA ESTRATIFICADA
+#
+# Con rangos de fechas amplios las tablas exactas de una página tardan en
+# calcularse. En este modo la página se pinta primero con las tablas calculadas
+# sobre una muestra de los pedidos, marcadas como estimación, mientras las
+# exactas se calculan en segundo plano; al terminar, un rerun las pone en el
+# mismo sitio.
+#
+# La muestra es estratificada por (estado, mes de compra): de cada estrato se
+# toma la misma fracción de pedidos (al menos uno), y cada pedido de la muestra
+# pesa N_h / n_h. Se construye una vez por versión de los datos. Los KPIs se
+# estiman con su error (intervalo del 95 %) a partir de la varianza dentro de
+# cada estrato; si el error relativo supera la tolerancia no se muestra la
+# estimación y la página espera a las tablas exactas.
+#
+#   OLIST_PROGRESIVO=1            lo activa (solo con el backend pandas)
+#   OLIST_MUESTRA_FRACCION=0.1    fracción de pedidos de cada estrato
+#   OLIST_MUESTRA_TOLERANCIA=0.1  error relativo máximo de los KPIs estimados
+#
+# El error crece al estrechar el rango (hay menos pedidos de la muestra dentro),
+# justo cuando las tablas exactas son baratas: con rangos cortos la página
+# suele ir directamente a las exactas.
+
+FRACCION = float(os.environ.get("OLIST_MUESTRA_FRACCION", "0.1"))
+TOLERANCIA = float(os.environ.get("OLIST_MUESTRA_TOLERANCIA", "0.1"))
+HILOS = int(os.environ.get("OLIST_REFINAR_HILOS", "2"))
+
+# Cuantil de la normal para el intervalo del 95 %
+Z = 1.96
+
+
+class MuestraEstratificada:
+
+    def __init__(self, datos, fraccion=FRACCION, semilla=0):
+        customers = datos.customers
+        self.fraccion = fraccion
+
+        # Estrato = (estado, mes); los pedidos sin fecha forman su propio mes
+        mes = customers[COLUMNA_FECHA].dt.to_period('M')
+        estrato = customers.groupby([customers['state'], mes], observed=True, dropna=False).ngroup().to_numpy()
+        poblacion = np.bincount(estrato)
+        tamano = np.maximum(1, np.round(poblacion * fraccion)).astype(np.int64)
+
+        # Orden aleatorio dentro de cada estrato: se quedan los tamano[h] primeros
+        azar = np.random.default_rng(semilla).random(len(customers))
+        orden = np.lexsort((azar, estrato))
+        inicio_estrato = np.concatenate([[0], np.cumsum(poblacion)[:-1]])
+        posicion = np.arange(len(orden)) - inicio_estrato[estrato[orden]]
+        elegido = np.zeros(len(customers), dtype=bool)
+        elegido[orden[posicion < tamano[estrato[orden]]]] = True
+
+        # La máscara conserva el orden por fecha de compra: los rangos siguen siendo slices
+        filas = customers[elegido].reset_index(drop=True)
+        self.estrato = estrato[elegido]
+        self.poblacion = poblacion
+        self.tamano = tamano
+        self.peso = (poblacion / tamano)[self.estrato]
+
+        # Para contar usuarios únicos: cada pedido de la muestra se empareja con
+        # todos los pedidos de su usuario (solo si tiene más de uno). Un pedido
+        # cuenta 1/m, con m = pedidos del usuario dentro del rango.
+        repetidos = customers.loc[customers['id_user'].duplicated(keep=False), ['id_user', COLUMNA_FECHA]]
+        pares = pd.merge(
+            pd.DataFrame({'fila': np.arange(len(filas)), 'id_user': filas['id_user'].to_numpy()}),
+            repetidos,
+            on='id_user',
+        )
+        self._pares_fila = pares['fila'].to_numpy()
+        self._pares_fecha = pares[COLUMNA_FECHA].to_numpy()
+
+        delivered = preparar_delivered(filas)
+        hechos_reviews = datos.hechos_reviews[datos.hechos_reviews.index.isin(filas['order_id'])]
+        self.datos = Datos(filas, delivered, datos.df_reviews, datos.version,
+                           diccionarios=datos.diccionarios, hechos_reviews=hechos_reviews)
+
+        # Reviews de pedidos a tiempo (las que cuenta calcular_reviews_fechas) y
+        # suma de sus puntuaciones, por fila de la muestra: así se estiman con el
+        # peso del estrato de su pedido
+        a_tiempo = hechos_reviews[~hechos_reviews['late'].astype(bool)]
+        por_pedido = a_tiempo.groupby(level=0, observed=True)['review_score'].agg(['count', 'sum'])
+        posicion = por_pedido.index.get_indexer(filas['order_id'])
+        encontrada = posicion >= 0
+        self._reviews = np.where(encontrada, por_pedido['count'].to_numpy()[posicion], 0).astype('float64')
+        self._puntos = np.where(encontrada, por_pedido['sum'].to_numpy()[posicion], 0).astype('float64')
+
+    def _por_usuario(self, desde, hasta, inicio, fin):
+        # 1/m para las filas [inicio, fin): la suma ponderada estima los usuarios únicos
+        limites = np.array(
+            [np.datetime64(pd.Timestamp(desde)), np.datetime64(pd.Timestamp(hasta) + pd.Timedelta(days=1))]
+        ).astype(self._pares_fecha.dtype)
+        en_rango = (self._pares_fecha >= limites[0]) & (self._pares_fecha < limites[1])
+        pedidos_usuario = np.bincount(self._pares_fila[en_rango], minlength=len(self.datos.customers))[inicio:fin]
+        return 1 / np.maximum(pedidos_usuario, 1)
+
+    def _total(self, y, inicio, fin):
+        # Total estimado de y (definida en las filas [inicio, fin) de la muestra)
+        # y su varianza: fuera del rango y vale 0 en todos los estratos
+        estrato = self.estrato[inicio:fin]
+        y = np.asarray(y, dtype='float64')
+        suma = np.bincount(estrato, weights=y, minlength=len(self.poblacion))
+        suma2 = np.bincount(estrato, weights=y * y, minlength=len(self.poblacion))
+
+        n, N = self.tamano, self.poblacion
+        varianza_estrato = np.divide(suma2 - suma * suma / n, n - 1, out=np.zeros(len(n)), where=n > 1)
+        total = float((N / n * suma).sum())
+        varianza = float((N * N * (1 - n / N) * varianza_estrato / n).sum())
+        return total, varianza
+
+    def _razon(self, a, b, inicio, fin):
+        # a / b con la varianza por linealización
+        total_a, _ = self._total(a, inicio, fin)
+        total_b, _ = self._total(b, inicio, fin)
+        if total_b == 0:
+            return 0.0, 0.0
+        razon = total_a / total_b
+        _, varianza = self._total((np.asarray(a, dtype='float64') - razon * np.asarray(b)) / total_b, inicio, fin)
+        return razon, varianza
+
+    def kpis(self, desde, hasta):
+        # Mismas claves que cubo.kpis, más el error (±) de cada una y el mayor error relativo
+        filas = self.datos.customers
+        inicio, fin = rango_filas(filas, desde, hasta)
+        rango = filas.iloc[inicio:fin]
+
+        # Retraso desde las fechas, como preparar_delivered: con el CSV customers
+        # no trae delay_days ni late (solo los añade construir_dataset.tipar_customers)
+        entregado = (rango['order_status'] == 'delivered').to_numpy()
+        retraso = (rango['order_delivered_customer_date'] - rango['order_estimated_delivery_date']).dt.days
+        retraso = retraso.to_numpy(dtype='float64', na_value=np.nan)
+        tarde = entregado & (retraso > 0)
+        retraso_tarde = np.where(tarde, retraso, 0)
+
+        pedidos, var_pedidos = self._total(np.ones(fin - inicio), inicio, fin)
+        clientes, var_clientes = self._total(self._por_usuario(desde, hasta, inicio, fin), inicio, fin)
+        porcentaje, var_porcentaje = self._razon(tarde, entregado, inicio, fin)
+        retraso, var_retraso = self._razon(retraso_tarde, tarde, inicio, fin)
+
+        valores = {
+            'total_pedidos': (pedidos, var_pedidos, 0),
+            'clientes_unicos': (clientes, var_clientes, 0),
+            'porcentaje_tarde': (porcentaje * 100, var_porcentaje * 100 ** 2, 2),
+            'retraso_medio': (retraso, var_retraso, 2),
+        }
+
+        kpis = {}
+        errores = {}
+        for nombre, (valor, varianza, decimales) in valores.items():
+            error = Z * varianza ** 0.5
+            if decimales:
+                kpis[nombre], errores[nombre] = round(valor, decimales), round(error, decimales)
+            else:
+                kpis[nombre], errores[nombre] = int(round(valor)), int(round(error))
+
+        kpis['errores'] = errores
+        kpis['error_relativo'] = max(
+            (errores[nombre] / abs(valores[nombre][0]) for nombre in errores if valores[nombre][0]), default=0.0,
+        )
+        return kpis
+
+    # Tablas por estado y ciudad con los conteos ponderados: mismas columnas que el cubo
+
+    def _ponderado(self, desde, hasta, claves):
+        filas = self.datos.customers
+        inicio, fin = rango_filas(filas, desde, hasta)
+        peso = self.peso[inicio:fin]
+
+        tabla = pd.DataFrame({columna: filas[columna].to_numpy()[inicio:fin] for columna in claves})
+        tabla['Total clientes'] = peso * self._por_usuario(desde, hasta, inicio, fin)
+        tabla['Pedidos totales'] = peso
+        return tabla.groupby(claves, observed=True).sum().round().astype('int64').reset_index()
+
+    def top_estados(self, desde, hasta):
+        tabla = self._ponderado(desde, hasta, ['state'])
+        tabla = tabla.sort_values('Total clientes', ascending=False, kind='stable').head(5)
+        return tabla[['state', 'Total clientes']].rename(columns={'state': 'Estado'}).reset_index(drop=True)
+
+    def clientes_por_estado(self, desde, hasta):
+        tabla = self._ponderado(desde, hasta, ['state'])
+        return tabla.set_index('state')['Total clientes'].rename('id_user')
+
+    def ciudades(self, desde, hasta, estado=None):
+        tabla = self._ponderado(desde, hasta, ['city', 'state'])
+        tabla = tabla[tabla['Total clientes'] > 0].sort_values('Total clientes', ascending=False, kind='stable')
+
+        tabla['Porcentaje %'] = (tabla['Pedidos totales'] / tabla['Pedidos totales'].sum() * 100).round(2)
+        tabla['Pedidos x cliente'] = (tabla['Pedidos totales'] / tabla['Total clientes']).round(2)
+        if estado is not None:
+            tabla = tabla[tabla['state'] == estado]
+        return tabla.rename(columns={'city': 'Ciudad', 'state': 'Estado'}).reset_index(drop=True)
+
+    def reviews(self, desde, hasta):
+        # Mismas columnas que calcular_reviews_fechas, más el error (±) de cada estimación
+        filas = self.datos.customers
+        inicio, fin = rango_filas(filas, desde, hasta)
+        estados = filas['state'].to_numpy()[inicio:fin]
+        reviews = self._reviews[inicio:fin]
+        puntos = self._puntos[inicio:fin]
+
+        tabla = []
+        for estado in sorted(pd.unique(estados[reviews > 0]), key=str):
+            en_estado = estados == estado
+            total, var_total = self._total(reviews * en_estado, inicio, fin)
+            media, var_media = self._razon(puntos * en_estado, reviews * en_estado, inicio, fin)
+            tabla.append({
+                'Estado': estado,
+                'Reviews': int(round(total)),
+                'Puntuacion': media,
+                'Reviews ±': int(round(Z * var_total ** 0.5)),
+                'Puntuacion ±': round(Z * var_media ** 0.5, 2),
+            })
+        return pd.DataFrame(tabla, columns=['Estado', 'Reviews', 'Puntuacion', 'Reviews ±', 'Puntuacion ±'])
+
+    def estados_rango(self, desde, hasta, columna='pedidos'):
+        filas = self.datos.customers if columna == 'pedidos' else self.datos.customers_delivered
+        inicio, fin = rango_filas(filas, desde, hasta)
+        return sorted(str(estado) for estado in filas['state'].iloc[inicio:fin].dropna().unique())
+
+    def tablas(self, version, desde, hasta, fuentes):
+        # Las mismas tablas que paginas.definir_tablas, con la muestra en lugar
+        # de datos y cubo. No van a la cache compartida.
+        tablas = Tablas(('muestra', version, self.fraccion), (desde, hasta), compartir=False)
+        definir_tablas(tablas, desde, hasta, **{**fuentes, 'datos': self.datos, 'cubo': self})
+
+        # Cada review pesa lo que el estrato de su pedido
+        tablas.definir('reviews', lambda: self.reviews(desde, hasta))
+        return tablas
+
+
+_lock = threading.Lock()
+_muestras = {}
+
+
+def obtener_muestra(datos, fraccion=FRACCION):
+    # Una muestra por versión de los datos y fracción, como obtener_cubo
+    clave = (datos.version, fraccion)
+    muestra = _muestras.get(clave)
+    if muestra is not None:
+        return muestra
+
+    with _lock:
+        muestra = _muestras.get(clave)
+        if muestra is None:
+            muestra = MuestraEstratificada(datos, fraccion)
+            for anterior in [c for c in _muestras if c[0] != datos.version]:
+                del _muestras[anterior]
+            _muestras[clave] = muestra
+
+    return muestra
+
+
+# REFINAMIENTO EN SEGUNDO PLANO
+
+_pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix="refinamiento")
+_lock_refinamiento = threading.Lock()
+_en_curso = {}
+
+
+def _calcular(version, desde, hasta, fuentes, nombres):
+    # Van a la cache compartida (tablas.resultados), donde las encuentra el rerun
+    tablas = Tablas(version, (desde, hasta))
+    definir_tablas(tablas, desde, hasta, **fuentes)
+    tablas.preparar(nombres)
+
+
+def refinar(version, desde, hasta, fuentes, nombres):
+    # Varias sesiones con los mismos filtros comparten el mismo cálculo
+    clave = (version, desde, hasta, tuple(nombres))
+    with _lock_refinamiento:
+        futuro = _en_curso.get(clave)
+        if futuro is None:
+            futuro = _pool.submit(_calcular, version, desde, hasta, fuentes, nombres)
+            _en_curso[clave] = futuro
+            futuro.add_done_callback(lambda _: _en_curso.pop(clave, None))
+    return futuro
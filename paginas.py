@@ -0,0 +1,164 @@
+from datos import filtrar_fechas
+from estrella import retrasos_vendedor
+from indice_estados import IndiceEstados
+from metricas import TODOS_LOS_ESTADOS, calcular_retrasos, calcular_reviews_fechas, filtrar_estado
+
+
+# TABLAS Y GRÁFICOS DE CADA PÁGINA
+#
+# Qué tablas derivadas (ver tablas.py) y qué gráficos necesita cada página.
+# Lo usan dashboard.py y precalentamiento.py, así que los dos calculan las
+# mismas claves en las caches compartidas.
+
+# Parámetro de las tablas del detalle por estado del mapa: se sustituye por el
+# estado elegido en su selectbox (ver estado_detalle)
+ESTADO_DETALLE = object()
+
+PAGINAS = ["Inicio", "Clientes por estado", "Clientes por ciudad", "Análisis de retrasos", "Análisis de reviews"]
+
+TABLAS_POR_PAGINA = {
+    "Inicio": ['kpis', 'top_estados', 'ciudades'],
+    "Clientes por estado": [
+        'top_estados', 'estados_ciudades',
+        ('totales_estado', ESTADO_DETALLE), ('ciudades_estado', ESTADO_DETALLE),
+    ],
+    "Clientes por ciudad": ['ciudades'],
+    "Análisis de retrasos": ['retrasos'],
+    "Análisis de reviews": ['reviews'],
+}
+
+# (gráfico, tabla, parámetros de la tabla) con los filtros por defecto de cada página.
+# Debe seguir lo que pinta dashboard.py.
+GRAFICOS_POR_PAGINA = {
+    "Clientes por estado": [('mapa', 'top_estados', ())],
+    "Clientes por ciudad": [
+        (f'grafico{numero}', 'ciudades_estado', (TODOS_LOS_ESTADOS,)) for numero in range(1, 6)
+    ],
+    "Análisis de retrasos": [
+        (f'grafico{numero}', 'retrasos_estado', (TODOS_LOS_ESTADOS,)) for numero in range(6, 9)
+    ],
+    "Análisis de reviews": [(f'grafico{numero}', 'reviews', ()) for numero in range(9, 12)],
+}
+
+
+# Páginas con selectbox de estado: (clave del selectbox, tabla nacional, tabla
+# por estado). Con un estado elegido la página pide solo el bloque del estado.
+SELECTOR_ESTADO = {
+    "Clientes por ciudad": ('estado_ciudades', 'ciudades', 'ciudades_estado'),
+    "Análisis de retrasos": ('estado_retrasos', 'retrasos', 'retrasos_estado'),
+}
+
+# Páginas con detalle de un estado: clave de su selectbox
+SELECTOR_DETALLE = {
+    "Clientes por estado": 'estado_mapa',
+}
+
+
+def tablas_pagina(pagina, estado=TODOS_LOS_ESTADOS, detalle=None):
+    # Lo que hay que preparar para la página: nombres o (nombre, parámetros...).
+    # Sin estado de detalle se omiten las tablas que lo necesitan.
+    nombres = []
+    for nombre in TABLAS_POR_PAGINA[pagina]:
+        if isinstance(nombre, tuple) and ESTADO_DETALLE in nombre:
+            if detalle is None:
+                continue
+            nombre = tuple(detalle if parametro is ESTADO_DETALLE else parametro for parametro in nombre)
+        nombres.append(nombre)
+
+    if pagina not in SELECTOR_ESTADO or estado == TODOS_LOS_ESTADOS:
+        return nombres
+    _, nacional, por_estado = SELECTOR_ESTADO[pagina]
+    return [(por_estado, estado) if nombre == nacional else nombre for nombre in nombres]
+
+
+def estado_detalle(tablas, elegido=None):
+    # El elegido si sigue en el rango de fechas; si no, el de más clientes
+    estados = tablas['estados_ciudades']
+    if elegido in estados:
+        return elegido
+    top = tablas['top_estados']
+    mayor = str(top['Estado'].iloc[0]) if len(top) else None
+    if mayor in estados:
+        return mayor
+    return estados[0] if estados else None
+
+
+def definir_tablas(tablas, desde, hasta, consultas=None, datos=None, cubo=None, estrella=None):
+    # Con consultas (DuckDB) todo sale de SQL; si no, de datos y del cubo diario
+    if consultas is not None:
+        tablas.definir('kpis', lambda: consultas.kpis(desde, hasta))
+        tablas.definir('top_estados', lambda: consultas.top_estados(desde, hasta))
+        tablas.definir('ciudades', lambda: consultas.ciudades(desde, hasta))
+        tablas.definir('retrasos', lambda: consultas.retrasos(desde, hasta))
+        tablas.definir('reviews', lambda: consultas.reviews(desde, hasta))
+        tablas.definir('clientes_estados', lambda: consultas.clientes_por_estado(desde, hasta))
+
+    else:
+        # Slices sin copia: no ocupan memoria propia y no van a la cache compartida
+        tablas.definir('filtrado', lambda: filtrar_fechas(datos.customers, desde, hasta), compartida=False)
+        tablas.definir('filtrado_delivered', lambda: filtrar_fechas(datos.customers_delivered, desde, hasta),
+                       compartida=False)
+
+        # Los totales por rango de fechas salen del cubo diario (ver cubo.py)
+        tablas.definir('kpis', lambda: cubo.kpis(desde, hasta))
+        tablas.definir('top_estados', lambda: cubo.top_estados(desde, hasta))
+        tablas.definir('ciudades', lambda: cubo.ciudades(desde, hasta))
+        tablas.definir('clientes_estados', lambda: cubo.clientes_por_estado(desde, hasta))
+
+        tablas.definir('retrasos', calcular_retrasos, depende=['filtrado_delivered'])
+        tablas.definir('reviews', lambda: calcular_reviews_fechas(datos.hechos_reviews, desde, hasta))
+
+    # Retrasos por vendedor, solo si se ha generado el esquema en estrella (ver estrella.py)
+    if estrella is not None:
+        tablas.definir('retrasos_vendedor', lambda: retrasos_vendedor(estrella, desde, hasta))
+        tablas.definir('retrasos_vendedor_estado', filtrar_estado, depende=['retrasos_vendedor'])
+
+    # Índice estado -> bloque de ciudades sobre las tablas nacionales (ver indice_estados.py)
+    # Los clientes únicos por estado no son la suma de sus ciudades (ver indice_estados.py)
+    tablas.definir('indice_ciudades',
+                   lambda df, clientes: IndiceEstados(df, ['Pedidos totales'], {'Total clientes': clientes}),
+                   depende=['ciudades', 'clientes_estados'])
+    tablas.definir('indice_retrasos', IndiceEstados, depende=['retrasos'])
+
+    # Sin cubo (DuckDB) los estados del selectbox salen de la tabla nacional
+    if consultas is not None:
+        tablas.definir('estados_ciudades', lambda indice: indice.estados, depende=['indice_ciudades'])
+        tablas.definir('estados_retrasos', lambda indice: indice.estados, depende=['indice_retrasos'])
+    else:
+        tablas.definir('estados_ciudades', lambda: cubo.estados_rango(desde, hasta))
+        tablas.definir('estados_retrasos', lambda: cubo.estados_rango(desde, hasta, 'entregados'))
+
+        # Un solo estado sin pasar por la tabla nacional
+        tablas.definir('ciudades_solo_estado', lambda estado: cubo.ciudades(desde, hasta, estado))
+        tablas.definir('retrasos_solo_estado', lambda df, estado: calcular_retrasos(df[df['state'] == estado]),
+                       depende=['filtrado_delivered'])
+
+    # Tablas por estado del selectbox: cada combinación (fechas, estado) se guarda aparte
+    tablas.definir('ciudades_estado', _por_estado(tablas, 'ciudades', consultas is None))
+    tablas.definir('retrasos_estado', _por_estado(tablas, 'retrasos', consultas is None))
+    tablas.definir('totales_estado', lambda estado: _totales_estado(tablas, estado))
+
+
+def _por_estado(tablas, nacional, solo_estado):
+    # Bloque de un estado: un slice del índice si la tabla nacional ya está
+    # calculada; si no, y se puede, solo las filas de ese estado
+    def obtener(estado):
+        if estado == TODOS_LOS_ESTADOS:
+            return tablas[nacional]
+        if solo_estado and not tablas.disponible(nacional):
+            return tablas.obtener(f'{nacional}_solo_estado', estado)
+        return tablas[f'indice_{nacional}'].bloque(estado)
+    return obtener
+
+
+def _totales_estado(tablas, estado):
+    # Totales precalculados del índice, o la suma del bloque del estado con los
+    # clientes únicos del estado (no la suma de los de sus ciudades)
+    if tablas.disponible('ciudades'):
+        indice = tablas['indice_ciudades']
+        if estado in indice.bloques:
+            return indice.totales.loc[estado].to_dict()
+    totales = IndiceEstados.resumir(tablas.obtener('ciudades_estado', estado), ['Pedidos totales'])
+    clientes = tablas['clientes_estados']
+    totales['Total clientes'] = int(clientes[clientes.index.astype(str) == estado].sum())
+    return totales
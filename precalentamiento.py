@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from graficos import renderizar
+from graficos_cliente import en_cliente
+from paginas import GRAFICOS_POR_PAGINA, PAGINAS, SELECTOR_DETALLE, definir_tablas, estado_detalle, tablas_pagina
+from tablas import Tablas
+
+
+# PRECALENTAMIENTO DE CACHES
+#
+# Al arrancar el proceso y cada vez que cambia la versión de los datos, calcula
+# en segundo plano las tablas y las imágenes de todas las páginas con los
+# filtros por defecto (rango completo, todos los estados). Van a las caches
+# compartidas (tablas.resultados y graficos.renders), así que el primer usuario
+# que abre una página ya las encuentra hechas. Las sesiones no esperan a nada:
+# si piden algo que aún no está, lo calculan ellas.
+#
+# Si llega una versión más nueva, las tareas de la anterior se cancelan entre
+# tabla y tabla o entre gráfico y gráfico.
+#
+#   OLIST_PRECALENTAR=0   lo desactiva
+
+HILOS = int(os.environ.get("OLIST_PRECALENTAR_HILOS", "2"))
+
+log = logging.getLogger(__name__)
+
+
+class Precalentamiento:
+
+    def __init__(self, hilos=HILOS):
+        # Los hilos se crean con la primera versión programada: con
+        # OLIST_PRECALENTAR=0 no se llega a crear ninguno
+        self.hilos = hilos
+        self._pool = None
+        self._lock = threading.Lock()
+        self.version = None
+        self._cancelado = threading.Event()
+        self._futuros = []
+
+    def programar(self, version, desde, hasta, fuentes):
+        # fuentes: los argumentos de paginas.definir_tablas (consultas o datos y cubo)
+        with self._lock:
+            if version == self.version:
+                return False
+
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="precalentamiento")
+
+            self._cancelado.set()
+            self._cancelado = cancelado = threading.Event()
+            self.version = version
+            self._futuros = [
+                self._pool.submit(self._calentar, pagina, version, desde, hasta, fuentes, cancelado)
+                for pagina in PAGINAS
+            ]
+            for pagina, futuro in zip(PAGINAS, self._futuros):
+                futuro.add_done_callback(lambda futuro, pagina=pagina: _registrar_error(pagina, futuro))
+        return True
+
+    def _calentar(self, pagina, version, desde, hasta, fuentes, cancelado):
+        tablas = Tablas(version, (desde, hasta))
+        definir_tablas(tablas, desde, hasta, **fuentes)
+
+        # El detalle por estado se prepara para el que se ve por defecto
+        detalle = estado_detalle(tablas) if pagina in SELECTOR_DETALLE else None
+        for nombre in tablas_pagina(pagina, detalle=detalle):
+            if cancelado.is_set():
+                return False
+            tablas.preparar([nombre])
+
+        for grafico, tabla, parametros in GRAFICOS_POR_PAGINA.get(pagina, []):
+            if cancelado.is_set():
+                return False
+            # Los que dibuja el navegador no tienen imagen que preparar
+            if en_cliente(grafico):
+                continue
+            renderizar(grafico, tablas.obtener(tabla, *parametros))
+
+        return True
+
+    def progreso(self):
+        # (páginas preparadas, total) de la versión actual: solo cuentan las
+        # tareas que terminaron bien, no las que fallaron o se cancelaron
+        futuros = self._futuros
+        return sum(_preparada(futuro) for futuro in futuros), len(futuros)
+
+    def errores(self):
+        # página -> excepción de las tareas de la versión actual que fallaron
+        return {
+            pagina: futuro.exception()
+            for pagina, futuro in zip(PAGINAS, self._futuros)
+            if futuro.done() and not futuro.cancelled() and futuro.exception() is not None
+        }
+
+
+def _preparada(futuro):
+    # _calentar devuelve False si lo cancela una versión más nueva
+    return futuro.done() and not futuro.cancelled() and futuro.exception() is None and futuro.result()
+
+
+def _registrar_error(pagina, futuro):
+    if not futuro.cancelled() and futuro.exception() is not None:
+        log.error("Precalentamiento de %r fallido", pagina, exc_info=futuro.exception())
+
+
+calentador = Precalentamiento()
+activo = os.environ.get("OLIST_PRECALENTAR", "1") == "1"
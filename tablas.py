@@ -0,0 +1,111 @@
+# TABLAS DERIVADAS BAJO DEMANDA
+#
+# Cada tabla se declara con la función que la calcula y las tablas de las que
+# depende. Solo se calcula la primera vez que se pide, de modo que una página
+# solo paga por las tablas que usa. La clave de cada resultado es
+# (tabla, versión de los datos, filtros, parámetros), p. ej. ('ciudades_estado',
+# versión, (desde, hasta), ('SP',)).
+#
+# Los resultados se guardan en una cache LRU compartida por todas las sesiones
+# del proceso, con presupuesto de memoria: una combinación de filtros que ya
+# pidió otro usuario no se vuelve a calcular. Las sesiones no guardan copia
+# propia, así que lo que la LRU descarta se libera de verdad. Cuando cambia la
+# versión de los datos se descartan las entradas anteriores. Los resultados
+# compartidos no deben modificarse in situ.
+#
+# Las tablas definidas con compartida=False (los slices por fecha, que son
+# vistas sin copia) no van a la LRU: se recalculan en cada rerun y solo se
+# guardan en el propio objeto Tablas mientras dura.
+
+import sys
+import threading
+
+import pandas as pd
+
+from cache import CacheLRU
+from instrumentacion import etapa
+
+MAX_BYTES_RESULTADOS = 256 * 1024 * 1024
+
+
+def tamano_resultado(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    return sys.getsizeof(valor)
+
+
+resultados = CacheLRU(MAX_BYTES_RESULTADOS, tamano=tamano_resultado)
+
+_lock = threading.Lock()
+_version_vigente = None
+_FALTA = object()
+
+
+def _invalidar(version):
+    global _version_vigente
+    with _lock:
+        if version != _version_vigente:
+            resultados.descartar(lambda clave: clave[1] != version)
+            _version_vigente = version
+
+
+class Tablas:
+
+    def __init__(self, version, filtros, compartir=True):
+        self.version = version
+        self.filtros = filtros
+        self.compartir = compartir
+        self.definiciones = {}
+        # Valores que no van a la cache compartida, solo durante este rerun
+        self.locales = {}
+
+        if compartir:
+            _invalidar(version)
+
+    def definir(self, nombre, funcion, depende=(), compartida=True):
+        # funcion recibe las tablas de las que depende y después los parámetros
+        self.definiciones[nombre] = (funcion, tuple(depende), compartida)
+
+    def _compartida(self, nombre):
+        return self.compartir and self.definiciones[nombre][2]
+
+    def __getitem__(self, nombre):
+        return self.obtener(nombre)
+
+    def obtener(self, nombre, *parametros):
+        clave = (nombre, self.version, self.filtros, parametros)
+        compartida = self._compartida(nombre)
+
+        valor = resultados.obtener(clave, _FALTA) if compartida else self.locales.get(clave, _FALTA)
+
+        if valor is _FALTA:
+            funcion, depende, _ = self.definiciones[nombre]
+            entradas = [self[dependencia] for dependencia in depende]
+
+            with etapa(f"tabla:{nombre}", entradas[0] if entradas else None) as medicion:
+                valor = medicion.salida(funcion(*entradas, *parametros))
+
+            if compartida:
+                resultados.guardar(clave, valor)
+            else:
+                self.locales[clave] = valor
+
+        return valor
+
+    def disponible(self, nombre, *parametros):
+        # Si ya está calculada: en la cache compartida o, si no va a ella, en este rerun
+        clave = (nombre, self.version, self.filtros, parametros)
+        return clave in resultados if self._compartida(nombre) else clave in self.locales
+
+    def disponibles(self, nombres):
+        return all(self.disponible(*_peticion(nombre)) for nombre in nombres)
+
+    def preparar(self, nombres):
+        # Cada elemento es un nombre o una tupla (nombre, parámetros...)
+        return {nombre: self.obtener(*_peticion(nombre)) for nombre in nombres}
+
+
+def _peticion(nombre):
+    return nombre if isinstance(nombre, tuple) else (nombre,)